@@ -1,43 +1,228 @@
-from flask import Flask, request, jsonify, render_template
-import io
-import contextlib
+from flask import (
+    Flask, Response, request, jsonify, render_template, stream_with_context, abort, make_response,
+)
+import json
+import os
+import threading
+import time
+import pyva_cache
 import pyva_compiler
+import pyva_metrics
+import pyva_pool
 
 app = Flask(__name__)
 
-def execute_pyva_code(code, inputs):
-    try:
-        output = io.StringIO()
-        inputs = inputs.split('\n')
-        input_index = 0
-        def mock_input(prompt=''):
-            nonlocal input_index
-            if input_index < len(inputs):
-                result = inputs[input_index]
-                input_index += 1
-                return result
-            else:
-                return ''
-        import builtins
-        old_input = builtins.input
-        builtins.input = mock_input
-        with contextlib.redirect_stdout(output):
-            pyva_compiler.run_program(code)
-        builtins.input = old_input
-        return output.getvalue().strip()
-    except Exception as e:
-        return f"Error: {str(e)}"
+# PYVA_WORKERS=0 runs programs inside the request thread instead of the pool.
+app.config['PYVA_WORKERS'] = int(os.environ.get('PYVA_WORKERS', os.cpu_count() or 1))
+app.config['PYVA_QUEUE_SIZE'] = int(os.environ.get('PYVA_QUEUE_SIZE', 64))
+# Budgets: PYVA_TIMEOUT and PYVA_MAX_STEPS are the most a request may ask
+# for. A worker still running PYVA_KILL_GRACE seconds past its deadline
+# (stuck inside a single statement) is killed.
+app.config['PYVA_TIMEOUT'] = float(os.environ.get('PYVA_TIMEOUT', 10))
+app.config['PYVA_MAX_STEPS'] = int(os.environ.get('PYVA_MAX_STEPS', pyva_compiler.DEFAULT_MAX_STEPS))
+app.config['PYVA_KILL_GRACE'] = float(os.environ.get('PYVA_KILL_GRACE', 1))
+app.config['PYVA_CACHE_ENTRIES'] = int(os.environ.get('PYVA_CACHE_ENTRIES', 256))
+app.config['PYVA_CACHE_BYTES'] = int(os.environ.get('PYVA_CACHE_BYTES', 32 * 1024 * 1024))
+app.config['PYVA_MAX_OUTPUT'] = int(os.environ.get('PYVA_MAX_OUTPUT', pyva_pool.DEFAULT_MAX_OUTPUT))
+app.config['PYVA_MAX_BATCH'] = int(os.environ.get('PYVA_MAX_BATCH', 100))
+
+_pool = None
+_pool_lock = threading.Lock()
+# Used when programs run in the request thread; pool workers keep their own.
+_program_cache = pyva_cache.ProgramCache(app.config['PYVA_CACHE_ENTRIES'], app.config['PYVA_CACHE_BYTES'])
+
+# Served at /metrics. Queue wait, parse time and execution time tell apart
+# worker saturation, slow parsing and slow programs when latency jumps.
+_metrics = pyva_metrics.Registry()
+_requests_total = _metrics.counter('pyva_requests_total', "Program runs by endpoint and status",
+                                   ('endpoint', 'status'))
+_request_seconds = _metrics.histogram('pyva_request_seconds', "Request latency in seconds", ('endpoint',))
+_queue_wait_seconds = _metrics.histogram('pyva_queue_wait_seconds', "Time jobs waited for an idle worker")
+_parse_seconds = _metrics.histogram('pyva_parse_seconds',
+                                    "Time spent parsing and compiling programs or fetching them from the cache",
+                                    ('engine',))
+_execute_seconds = _metrics.histogram('pyva_execute_seconds', "Time spent running programs", ('engine',))
+_output_bytes = _metrics.histogram('pyva_output_bytes', "Size of program output in bytes",
+                                   buckets=pyva_metrics.SIZE_BUCKETS)
+_budget_exceeded_total = _metrics.counter('pyva_budget_exceeded_total',
+                                          "Runs stopped by their step or time budget", ('kind',))
+_workers = _metrics.gauge('pyva_workers', "Worker processes in the pool")
+_workers_busy = _metrics.gauge('pyva_workers_busy', "Worker processes running a job")
+_jobs_queued = _metrics.gauge('pyva_jobs_queued', "Jobs waiting for an idle worker")
+_worker_restarts_total = _metrics.counter('pyva_worker_restarts_total', "Workers killed and replaced")
+_cache_entries = _metrics.gauge('pyva_program_cache_entries', "Programs in the program caches")
+_cache_bytes = _metrics.gauge('pyva_program_cache_bytes', "Estimated memory of the program caches")
+_cache_hits_total = _metrics.counter('pyva_program_cache_hits_total', "Program cache hits")
+_cache_misses_total = _metrics.counter('pyva_program_cache_misses_total', "Program cache misses")
+_cache_evictions_total = _metrics.counter('pyva_program_cache_evictions_total', "Program cache evictions")
+
+def collect_pool_metrics():
+    if app.config['PYVA_WORKERS'] <= 0:
+        stats = _program_cache.stats()
+    else:
+        with _pool_lock:
+            pool = _pool
+        if pool is None:
+            return
+        load = pool.load()
+        _workers.set(load['workers'])
+        _workers_busy.set(load['busy'])
+        _jobs_queued.set(load['queued'])
+        _worker_restarts_total.set(load['restarts'])
+        stats = pool.cache_stats()
+    _cache_entries.set(stats['entries'])
+    _cache_bytes.set(stats['bytes'])
+    _cache_hits_total.set(stats['hits'])
+    _cache_misses_total.set(stats['misses'])
+    _cache_evictions_total.set(stats['evictions'])
+
+_metrics.collectors.append(collect_pool_metrics)
+
+def get_pool():
+    # Started on first use so that importing the app (or the reloader's
+    # parent process) does not fork workers.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = pyva_pool.WorkerPool(size=app.config['PYVA_WORKERS'],
+                                         max_queue=app.config['PYVA_QUEUE_SIZE'],
+                                         timeout=app.config['PYVA_TIMEOUT'] + app.config['PYVA_KILL_GRACE'],
+                                         cache_entries=app.config['PYVA_CACHE_ENTRIES'],
+                                         cache_bytes=app.config['PYVA_CACHE_BYTES'])
+        return _pool
+
+def execute_pyva_code(code, inputs, engine='tree'):
+    return pyva_pool.run_job({'code': code, 'inputs': inputs, 'engine': engine})['output']
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
+def requested_limit(name, ceiling, kind):
+    value = request.json.get(name)
+    if value is None:
+        return ceiling
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        abort(make_response(jsonify({'error': f"'{name}' must be a positive number"}), 400))
+    return min(kind(value), ceiling)
+
+def job_from_request():
+    return {
+        'code': request.json['code'],
+        'inputs': request.json.get('inputs', ''),
+        'engine': request.json.get('engine', request.json.get('backend', 'tree')),
+        'max_output': app.config['PYVA_MAX_OUTPUT'],
+        'max_steps': requested_limit('max_steps', app.config['PYVA_MAX_STEPS'], int),
+        'timeout': requested_limit('timeout', app.config['PYVA_TIMEOUT'], float),
+        # Per-line and per-function timings, run on the tree engine.
+        'profile': bool(request.json.get('profile', False)),
+        # Sampled PyVa call stacks in collapsed format, on any engine.
+        'sample': bool(request.json.get('sample', False)),
+    }
+
+def kill_timeout(job):
+    return job['timeout'] + app.config['PYVA_KILL_GRACE']
+
+def result_fields(result):
+    fields = {'output': result['output'], 'status': result['status']}
+    for key in ('budget', 'profile', 'samples'):
+        if key in result:
+            fields[key] = result[key]
+    return fields
+
+def record_result(endpoint, job, result):
+    # Unknown engines are bounded to one label value.
+    engine = job['engine'] if job['engine'] in pyva_compiler.ENGINES else 'invalid'
+    _requests_total.inc(endpoint=endpoint, status=result['status'])
+    if 'queue_wait' in result:
+        _queue_wait_seconds.observe(result['queue_wait'])
+    if 'parse_time' in result:
+        _parse_seconds.observe(result['parse_time'], engine=engine)
+        _execute_seconds.observe(result['time'] - result['parse_time'], engine=engine)
+    if 'output_bytes' in result:
+        _output_bytes.observe(result['output_bytes'])
+    if 'budget' in result:
+        _budget_exceeded_total.inc(kind=result['budget']['kind'])
+
+def server_sent_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @app.route('/execute', methods=['POST'])
 def execute_code():
-    code = request.json['code']
-    inputs = request.json.get('inputs', '')
-    output = execute_pyva_code(code, inputs)
-    return jsonify({'output': output})
+    started = time.perf_counter()
+    job = job_from_request()
+    if app.config['PYVA_WORKERS'] <= 0:
+        result = pyva_pool.run_job(job, _program_cache)
+    else:
+        try:
+            result = get_pool().run(job, kill_timeout(job))
+        except pyva_pool.PoolBusy:
+            result = {'output': pyva_pool.BUSY_MESSAGE, 'status': 'busy'}
+    record_result('execute', job, result)
+    _request_seconds.observe(time.perf_counter() - started, endpoint='execute')
+    if result['status'] == 'busy':
+        return jsonify(result), 503
+    return jsonify(result_fields(result))
+
+@app.route('/execute/stream', methods=['POST'])
+def execute_stream():
+    # Server-Sent Events: an 'output' event per chunk of program output,
+    # then a single 'done' event with the status and any closing error.
+    started = time.perf_counter()
+    job = job_from_request()
+    job['stream'] = True
+    if app.config['PYVA_WORKERS'] <= 0:
+        messages = pyva_pool.stream_job(job, _program_cache)
+    else:
+        messages = get_pool().stream(job, kill_timeout(job))
+
+    def generate():
+        try:
+            for kind, payload in messages:
+                if kind == 'chunk':
+                    yield server_sent_event('output', {'text': payload})
+                else:
+                    record_result('stream', job, payload)
+                    yield server_sent_event('done', result_fields(payload))
+        except pyva_pool.PoolBusy:
+            busy = {'output': pyva_pool.BUSY_MESSAGE, 'status': 'busy'}
+            record_result('stream', job, busy)
+            yield server_sent_event('done', busy)
+        finally:
+            messages.close()
+            _request_seconds.observe(time.perf_counter() - started, endpoint='stream')
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/execute/batch', methods=['POST'])
+def execute_batch():
+    # One program, many input sets: {"code": ..., "inputs": [...], "parallel": true}
+    cases = request.json.get('inputs', [])
+    if not isinstance(cases, list) or not all(isinstance(inputs, str) for inputs in cases):
+        return jsonify({'error': "'inputs' must be a list of strings"}), 400
+    if len(cases) > app.config['PYVA_MAX_BATCH']:
+        return jsonify({'error': f"At most {app.config['PYVA_MAX_BATCH']} input sets per batch"}), 400
+    template = job_from_request()
+    jobs = [dict(template, inputs=inputs) for inputs in cases]
+    started = time.perf_counter()
+    if app.config['PYVA_WORKERS'] <= 0:
+        results = [pyva_pool.run_job(job, _program_cache) for job in jobs]
+    else:
+        results = get_pool().run_many(jobs, parallel=bool(request.json.get('parallel', False)),
+                                      timeout=kill_timeout(template))
+    for job, result in zip(jobs, results):
+        record_result('batch', job, result)
+    elapsed = time.perf_counter() - started
+    _request_seconds.observe(elapsed, endpoint='batch')
+    return jsonify({
+        'results': [dict(result_fields(result), time=result.get('time')) for result in results],
+        'time': elapsed,
+    })
+
+@app.route('/metrics')
+def metrics():
+    return Response(_metrics.render(), mimetype='text/plain; version=0.0.4')
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    app.run(debug=True, threaded=True)
\ No newline at end of file
@@ -0,0 +1,30 @@
+"""Time the call-heavy calls.pyva benchmark (recursive fib plus early returns from loops)"""
+import contextlib
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_compiler
+
+def bench(source, engine, repeat):
+    best = None
+    for _ in range(repeat):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            pyva_compiler.run_program(source, engine)
+            elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def main():
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calls.pyva')
+    with open(path) as file:
+        source = file.read()
+    engines = sys.argv[1:] or list(pyva_compiler.ENGINES)
+    for engine in engines:
+        print(f"{engine:<8} {bench(source, engine, 5) * 1000:8.1f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Run the PyVa benchmark suite and compare it against a stored baseline.
+
+Each benchmark is parsed once per engine (parse time covers parsing, the
+optimizer passes and compiling for the engine), then run repeat times
+with its scripted input; the best run counts. Statements per second
+divide the statements the run executed by its time. Peak memory is
+traced in one extra, untimed run that parses the program afresh.
+
+    python benchmarks/bench_suite.py [names...] [--engine=tree] [--repeat=N]
+                                     [--save] [--baseline=FILE] [--threshold=1.25]
+
+Without --save the results are compared with the baseline, and the exit
+status is 1 if any run time or peak memory grew past threshold times
+its baseline; run times within MIN_TIME_CHANGE of it never count.
+Timings only compare on the machine the baseline was saved on.
+"""
+import argparse
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+import pyva_compiler
+
+DEFAULT_BASELINE = os.path.join(HERE, 'baseline.json')
+DEFAULT_THRESHOLD = 1.25
+MIN_TIME_CHANGE = 0.001
+
+# (name, program path relative to the repository, scripted input, memo
+# size); fib runs without memoization so that its recursion really runs.
+BENCHMARKS = [
+    ('whileloop', 'whileloop.pyva', '', pyva_compiler.DEFAULT_MEMO_SIZE),
+    ('forloop', 'forloop.pyva', '', pyva_compiler.DEFAULT_MEMO_SIZE),
+    ('dowhileloop', 'dowhileloop.pyva', '', pyva_compiler.DEFAULT_MEMO_SIZE),
+    ('operations', 'operations.pyva', '12\n5\nPy\nVa\n', pyva_compiler.DEFAULT_MEMO_SIZE),
+    ('calls', 'benchmarks/calls.pyva', '', pyva_compiler.DEFAULT_MEMO_SIZE),
+    ('fib', 'benchmarks/fib.pyva', '', 0),
+    ('nested', 'benchmarks/nested.pyva', '', pyva_compiler.DEFAULT_MEMO_SIZE),
+    ('concat', 'benchmarks/concat.pyva', '', pyva_compiler.DEFAULT_MEMO_SIZE),
+    ('elif', 'benchmarks/elif.pyva', '', pyva_compiler.DEFAULT_MEMO_SIZE),
+]
+
+def run_once(interpreter, program, engine, inputs):
+    interpreter.stdin = io.StringIO(inputs)
+    interpreter.stdout = io.StringIO()
+    start = time.perf_counter()
+    interpreter.execute(program, engine, None)
+    return time.perf_counter() - start
+
+def bench(source, inputs, engine, repeat, memo_size=pyva_compiler.DEFAULT_MEMO_SIZE):
+    """Measure one program on one engine; returns a dict of parse, run, steps, statements_per_second and peak"""
+    interpreter = pyva_compiler.Interpreter(echo_prompts=False, memo_size=memo_size)
+    start = time.perf_counter()
+    program = pyva_compiler.Program(source)
+    program.compile(engine)
+    parse = time.perf_counter() - start
+    best = None
+    for _ in range(repeat):
+        elapsed = run_once(interpreter, program, engine, inputs)
+        best = elapsed if best is None else min(best, elapsed)
+    steps = interpreter.steps
+    tracemalloc.start()
+    try:
+        program = pyva_compiler.Program(source)
+        program.compile(engine)
+        run_once(interpreter, program, engine, inputs)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'parse': parse, 'run': best, 'steps': steps,
+            'statements_per_second': steps / best if best else 0.0, 'peak': peak}
+
+def compare(result, base, threshold):
+    """Notes on how a result differs from its baseline entry"""
+    notes = []
+    if base is None:
+        return ['new']
+    if result['run'] > base['run'] * threshold and result['run'] - base['run'] > MIN_TIME_CHANGE:
+        notes.append(f"REGRESSION {result['run'] / base['run']:.2f}x slower")
+    if result['peak'] > base['peak'] * threshold:
+        notes.append(f"REGRESSION {result['peak'] / base['peak']:.2f}x more memory")
+    if result['steps'] != base['steps']:
+        notes.append(f"steps {base['steps']} -> {result['steps']}")
+    return notes
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='bench_suite.py')
+    parser.add_argument('names', nargs='*', help='benchmarks to run (default: all)')
+    parser.add_argument('--engine', action='append', choices=pyva_compiler.ENGINES,
+                        help='engine to run on, may be repeated (default: all)')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--save', action='store_true', help='store the results as the new baseline')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD)
+    args = parser.parse_args(argv)
+    known = [name for name, _, _, _ in BENCHMARKS]
+    unknown = [name for name in args.names if name not in known]
+    if unknown:
+        parser.error(f"unknown benchmark {', '.join(unknown)}, expected some of: {', '.join(known)}")
+    engines = args.engine or list(pyva_compiler.ENGINES)
+
+    baseline = {}
+    if not args.save and os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            baseline = json.load(file)['benchmarks']
+
+    results = {}
+    regressions = 0
+    print(f"{'Benchmark':<12} {'Engine':<7} {'Steps':>9} {'Parse ms':>9} {'Run ms':>9} "
+          f"{'Stmts/s':>11} {'Peak KiB':>9}  Baseline")
+    for name, path, inputs, memo_size in BENCHMARKS:
+        if args.names and name not in args.names:
+            continue
+        with open(os.path.join(ROOT, path)) as file:
+            source = file.read()
+        for engine in engines:
+            result = bench(source, inputs, engine, args.repeat, memo_size)
+            results.setdefault(name, {})[engine] = result
+            notes = [] if args.save else compare(result, baseline.get(name, {}).get(engine), args.threshold)
+            regressions += sum(note.startswith('REGRESSION') for note in notes)
+            print(f"{name:<12} {engine:<7} {result['steps']:>9} {result['parse'] * 1000:>9.2f} "
+                  f"{result['run'] * 1000:>9.2f} {result['statements_per_second']:>11.0f} "
+                  f"{result['peak'] / 1024:>9.1f}  {', '.join(notes) or 'ok'}")
+
+    if args.save:
+        if os.path.exists(args.baseline):
+            # Keep the entries of benchmarks and engines this run skipped.
+            with open(args.baseline) as file:
+                saved = json.load(file)['benchmarks']
+            for name, engines_results in results.items():
+                saved.setdefault(name, {}).update(engines_results)
+            results = saved
+        with open(args.baseline, 'w') as file:
+            json.dump({'python': sys.version.split()[0], 'benchmarks': results}, file, indent=2, sort_keys=True)
+            file.write('\n')
+        print(f"Saved baseline to {args.baseline}")
+    elif regressions:
+        print(f"{regressions} regression(s) past {args.threshold:.2f}x the baseline")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""Caches of parsed and compiled PyVa programs: a bounded, memory-aware LRU cache and .pyvac files"""
+import copyreg
+import hashlib
+import marshal
+import os
+import pickle
+import sys
+import tempfile
+import threading
+import types
+from collections import OrderedDict
+
+from pyva_compiler import Program
+
+PYVAC_MAGIC = b'PYVAC1\n'
+# Modules whose classes a cached Program holds or whose code shaped it.
+_COMPILER_MODULES = ('pyva_compiler', 'pyva_optimize', 'pyva_types', 'pyva_memo', 'pyva_reduce',
+                     'pyva_resolve', 'pyva_vm', 'pyva_transpile', 'pyva_list', 'pyva_map')
+_compiler_version = None
+
+_OPAQUE = (type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType)
+
+def source_key(source_code):
+    return hashlib.sha256(source_code.encode('utf-8')).hexdigest()
+
+def deep_sizeof(obj):
+    """Approximate number of bytes held by an object graph (AST nodes, code objects, containers)"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen or isinstance(item, _OPAQUE):
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, set, frozenset)):
+            stack.extend(item)
+        elif isinstance(item, types.CodeType):
+            stack.extend(item.co_consts)
+        elif not isinstance(item, (str, bytes, int, float, bool)):
+            for cls in type(item).__mro__:
+                slots = cls.__dict__.get('__slots__', ())
+                if isinstance(slots, str):
+                    slots = (slots,)
+                for slot in slots:
+                    stack.append(getattr(item, slot, None))
+            if hasattr(item, '__dict__'):
+                stack.append(item.__dict__)
+    return total
+
+class ProgramCache:
+    """Maps a hash of the source and the engine to a ready-to-run Program.
+
+    Entries are evicted least recently used first, whenever the cache holds
+    more than max_entries programs or more than max_bytes of estimated memory.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, source_code, engine='tree'):
+        """Return the Program for source_code, parsing and compiling it on a miss"""
+        key = (source_key(source_code), engine)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+        # Parse outside the lock; a syntax error propagates and caches nothing.
+        program = Program(source_code)
+        program.compile(engine)
+        size = deep_sizeof(program)
+        if size <= self.max_bytes:
+            with self._lock:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.total_bytes -= old[1]
+                self._entries[key] = (program, size)
+                self.total_bytes += size
+                self._evict()
+        return program
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries or self.total_bytes > self.max_bytes:
+            _, (_, size) = self._entries.popitem(last=False)
+            self.total_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.total_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+def compiler_version():
+    """Digest of the Python version and the sources of the compiler modules, computed once per process"""
+    global _compiler_version
+    if _compiler_version is None:
+        digest = hashlib.sha256(PYVAC_MAGIC + sys.implementation.cache_tag.encode('utf-8'))
+        directory = os.path.dirname(os.path.abspath(__file__))
+        for name in _COMPILER_MODULES:
+            with open(os.path.join(directory, name + '.py'), 'rb') as file:
+                digest.update(file.read())
+        _compiler_version = digest.hexdigest()
+    return _compiler_version
+
+def cache_path(filename):
+    """Where the .pyvac file of a source file goes: beside it, in __pycache__"""
+    directory, name = os.path.split(os.path.abspath(filename))
+    return os.path.join(directory, '__pycache__', os.path.splitext(name)[0] + '.pyvac')
+
+def _reduce_code(code):
+    # The Python backend's compiled form is a code object, which pickle
+    # cannot handle; marshal can, for the Python version in the key.
+    return marshal.loads, (marshal.dumps(code),)
+
+def load_program_file(filename, source_code, engine='tree', optimize=True):
+    """The Program of a source file, taken from its .pyvac file when that is still valid.
+
+    A .pyvac file holds one Program with the compiled forms built so far,
+    keyed on the source's mtime, size and content hash, the optimize flag
+    and compiler_version(). When it is stale, unreadable or lacks the
+    engine's compiled form, the program is built and the file replaced
+    atomically. Failing to write it only costs the next run a parse.
+    """
+    stat = os.stat(filename)
+    header = {'mtime': stat.st_mtime_ns, 'size': stat.st_size, 'source': source_key(source_code),
+              'optimize': bool(optimize), 'version': compiler_version()}
+    path = cache_path(filename)
+    program = _read_pyvac(path, header)
+    if program is not None and engine in program.compiled:
+        return program
+    if program is None:
+        program = Program(source_code, optimize)
+    program.compile(engine)
+    _write_pyvac(path, header, program, stat.st_mode)
+    return program
+
+def _read_pyvac(path, header):
+    try:
+        with open(path, 'rb') as file:
+            if file.read(len(PYVAC_MAGIC)) != PYVAC_MAGIC or pickle.load(file) != header:
+                return None
+            program = pickle.load(file)
+    except Exception:
+        # Missing, truncated or written by an incompatible version.
+        return None
+    return program if isinstance(program, Program) else None
+
+def _write_pyvac(path, header, program, source_mode):
+    directory = os.path.dirname(path)
+    temp = None
+    try:
+        os.makedirs(directory, exist_ok=True)
+        fd, temp = tempfile.mkstemp(prefix='.pyvac-', dir=directory)
+        with os.fdopen(fd, 'wb') as file:
+            file.write(PYVAC_MAGIC)
+            pickle.dump(header, file, pickle.HIGHEST_PROTOCOL)
+            pickler = pickle.Pickler(file, pickle.HIGHEST_PROTOCOL)
+            pickler.dispatch_table = copyreg.dispatch_table.copy()
+            pickler.dispatch_table[types.CodeType] = _reduce_code
+            pickler.dump(program)
+        # mkstemp makes the file private; like a .pyc, the cache gets the
+        # source's permissions, and stays writable by its owner.
+        os.chmod(temp, (source_mode | 0o200) & 0o666)
+        os.replace(temp, path)
+        temp = None
+    except Exception:
+        pass
+    finally:
+        if temp is not None:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
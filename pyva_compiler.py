@@ -1,272 +1,935 @@
+import io
+import operator
 import re
 import sys
+import time
+from collections import OrderedDict
 
-functions = {}
-global_vars = {}
+from pyva_list import PyvaList
+from pyva_map import PyvaMap
+
+class ControlSignal:
+    """Completion signal handed back up the executors for break and continue"""
+    __slots__ = ('name',)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return f'<{self.name}>'
+
+BREAK = ControlSignal('break')
+CONTINUE = ControlSignal('continue')
+
+class ReturnSignal:
+    """Completion signal carrying the value of a return statement"""
+    __slots__ = ('value',)
 
-class ReturnException(Exception):
-    """Custom exception to handle return statements"""
     def __init__(self, value):
         self.value = value
 
-class BreakException(Exception):
-    """Custom exception to handle break statements"""
-    pass
+class Unbound:
+    """Marker for a frame slot whose local variable has not been assigned yet"""
+    __slots__ = ()
 
-class ContinueException(Exception):
-    """Custom exception to handle continue statements"""
+    def __repr__(self):
+        return '<unbound>'
+
+UNBOUND = Unbound()
+
+class ExecutionAborted(Exception):
+    """Stops the whole run; unlike other runtime errors it is not reported per statement"""
     pass
 
+class BudgetExceeded(ExecutionAborted):
+    """Raised when a run uses up its step budget ('steps') or passes its deadline ('time')"""
+
+    def __init__(self, kind, limit, steps, elapsed):
+        self.kind = kind
+        self.limit = limit
+        self.steps = steps
+        self.elapsed = elapsed
+        if kind == 'steps':
+            message = f"Step budget of {limit} exceeded"
+        else:
+            message = f"Time limit of {limit:g} seconds exceeded"
+        super().__init__(message)
+
+    def as_dict(self):
+        return {'kind': self.kind, 'limit': self.limit, 'steps': self.steps, 'elapsed': self.elapsed}
+
 def parse_type(type_str):
     """Convert type annotations to Python types"""
     type_map = {
         'String': str,
         'int': int,
         'float': float,
-        'bool': bool
+        'bool': bool,
+        'list': PyvaList,
+        'map': PyvaMap,
     }
     return type_map.get(type_str, str)
 
-def evaluate_expression(expr, local_vars):
-    """Enhanced expression evaluator with fixed comparison operators and ignored gaps within expressions"""
-    expr = expr.strip()
-    if not expr:
-        return None
-    if expr.startswith('"') and expr.endswith('"') and len(expr) >= 2:
-        return expr[1:-1]
-    expr_no_space = expr.replace(' ', '')
-    if expr_no_space.lstrip('-').replace('.', '').isdigit():
-        return float(expr_no_space) if '.' in expr_no_space else int(expr_no_space)
-    expr_lower = expr.lower().replace(' ', '')
-    if expr_lower in ['true', 'false']:
-        return expr_lower == 'true'
-    builtin_funcs = ['int', 'float', 'str', 'bool']
-    for func in builtin_funcs:
-        pattern = f'{func}\\s*\\((.*)\\)$'
-        match = re.match(pattern, expr)
-        if match:
-            inner_expr = match.group(1).strip()
-            inner_value = evaluate_expression(inner_expr, local_vars)
-            try:
-                if func == 'int':
-                    if isinstance(inner_value, str):
-                        inner_value = inner_value.strip()
-                        if inner_value.lstrip('-').replace('.', '').isdigit():
-                            return int(float(inner_value))
-                        else:
-                            return 0
-                    return int(inner_value)
-                elif func == 'float':
-                    return float(inner_value)
-                elif func == 'str':
-                    return str(inner_value)
-                elif func == 'bool':
-                    if isinstance(inner_value, str):
-                        return inner_value.lower() in ['true', '1', 'yes', 'y']
-                    return bool(inner_value)
-            except:
-                return 0
-    input_pattern = r'input\s*\((.*)\)$'
-    match_input = re.match(input_pattern, expr)
-    if match_input:
-        prompt_expr = match_input.group(1).strip()
-        prompt = evaluate_expression(prompt_expr, local_vars) if prompt_expr else ""
-        user_input = input(str(prompt))
-        return user_input
-    if expr in local_vars:
-        return local_vars[expr]
-    elif expr in global_vars:
-        return global_vars[expr]
-    if ('(' in expr and ')' in expr and 
-        not any(op in expr for op in ['+', '-', '*', '/', '%', '<=', '>=', '==', '!=', '<', '>', ' and ', ' or '])):
-        try:
-            fname, args = parse_function_call_enhanced(expr, local_vars)
-            if fname in functions:
-                return execute_function(fname, args)
-        except Exception:
-            pass
-    if expr.startswith('(') and expr.endswith(')') and is_balanced_parentheses(expr):
-        return evaluate_expression(expr[1:-1], local_vars)
-    if ' or ' in expr:
-        parts = split_expression_safe(expr, ' or ')
-        if len(parts) > 1:
-            return any(evaluate_expression(part.strip(), local_vars) for part in parts)
-    if ' and ' in expr:
-        parts = split_expression_safe(expr, ' and ')
-        if len(parts) > 1:
-            return all(evaluate_expression(part.strip(), local_vars) for part in parts)
-    comparison_ops = ['<=', '>=', '==', '!=', '<', '>']
-    for op in comparison_ops:
-        parts = split_expression_safe(expr, op)
-        if len(parts) == 2:
-            left_val = evaluate_expression(parts[0].strip(), local_vars)
-            right_val = evaluate_expression(parts[1].strip(), local_vars)
-            left_val = convert_for_comparison(left_val)
-            right_val = convert_for_comparison(right_val)
-            try:
-                if op == '==':
-                    return left_val == right_val
-                elif op == '!=':
-                    return left_val != right_val
-                elif op == '<=':
-                    return left_val <= right_val
-                elif op == '>=':
-                    return left_val >= right_val
-                elif op == '<':
-                    return left_val < right_val
-                elif op == '>':
-                    return left_val > right_val
-            except TypeError:
-                if op == '==':
-                    return str(left_val) == str(right_val)
-                elif op == '!=':
-                    return str(left_val) != str(right_val)
+# ---------------------------------------------------------------------------
+# Tokenizer
+# ---------------------------------------------------------------------------
+
+TOKEN_RE = re.compile(r'''
+    (?P<ws>\s+)
+  | (?P<number>\d+\.\d*|\.\d+|\d+)
+  | (?P<string>"[^"]*"|'[^']*')
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>==|!=|<=|>=|[-+*/%<>=(),\[\]{}:])
+''', re.VERBOSE)
+
+def tokenize(text):
+    """Split a single PyVa expression or statement into (kind, value) tokens"""
+    tokens = []
+    pos = 0
+    n = len(text)
+    while pos < n:
+        match = TOKEN_RE.match(text, pos)
+        if not match:
+            if text[pos] in '"\'':
+                raise SyntaxError("Unterminated string literal")
+            raise SyntaxError(f"Unexpected character '{text[pos]}'")
+        kind = match.lastgroup
+        value = match.group(kind)
+        pos = match.end()
+        if kind == 'ws':
+            continue
+        if kind == 'number':
+            value = float(value) if '.' in value else int(value)
+        elif kind == 'string':
+            value = value[1:-1]
+        elif kind == 'name':
+            lowered = value.lower()
+            if lowered in ('and', 'or'):
+                kind, value = 'op', lowered
+            elif value == 'not':
+                kind = 'op'
+        tokens.append((kind, value))
+    tokens.append(('eof', None))
+    return tokens
+
+def split_source_line(text):
+    """Strip a trailing comment and split a source line on ';' outside strings"""
+    segments = []
+    current = ''
+    quote = None
+    for char in text:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '#':
+            break
+        elif char == ';':
+            segments.append(current)
+            current = ''
+            continue
+        current += char
+    segments.append(current)
+    return [segment.strip() for segment in segments if segment.strip()]
+
+# ---------------------------------------------------------------------------
+# AST nodes
+# ---------------------------------------------------------------------------
+
+class Node:
+    __slots__ = ()
+
+    def __repr__(self):
+        fields = ', '.join(f'{name}={getattr(self, name)!r}' for name in self.__slots__)
+        return f'{type(self).__name__}({fields})'
+
+class Const(Node):
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value
+
+class Name(Node):
+    __slots__ = ('name',)
+    def __init__(self, name):
+        self.name = name
+
+class LocalName(Node):
+    """A function local resolved to its frame slot by pyva_resolve"""
+    __slots__ = ('name', 'slot')
+    def __init__(self, name, slot):
+        self.name = name
+        self.slot = slot
+
+class GlobalName(Node):
+    """A name resolved by pyva_resolve to the globals of the main block"""
+    __slots__ = ('name',)
+    def __init__(self, name):
+        self.name = name
+
+class UnaryOp(Node):
+    __slots__ = ('op', 'operand')
+    def __init__(self, op, operand):
+        self.op = op
+        self.operand = operand
+
+class BinOp(Node):
+    __slots__ = ('op', 'left', 'right')
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+class Compare(Node):
+    __slots__ = ('op', 'left', 'right')
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+class BoolOp(Node):
+    __slots__ = ('op', 'values')
+    def __init__(self, op, values):
+        self.op = op
+        self.values = values
+
+class Call(Node):
+    __slots__ = ('fname', 'args')
+    def __init__(self, fname, args):
+        self.fname = fname
+        self.args = args
+
+class List(Node):
+    """A list literal; every evaluation builds a new PyvaList"""
+    __slots__ = ('items',)
+    def __init__(self, items):
+        self.items = items
+
+class Map(Node):
+    """A map literal; every evaluation builds a new PyvaMap, evaluating each key before its value"""
+    __slots__ = ('keys', 'values')
+    def __init__(self, keys, values):
+        self.keys = keys
+        self.values = values
+
+class Subscript(Node):
+    __slots__ = ('value', 'index')
+    def __init__(self, value, index):
+        self.value = value
+        self.index = index
+
+class Slice(Node):
+    """value[start:stop]; a missing bound is None"""
+    __slots__ = ('value', 'start', 'stop')
+    def __init__(self, value, start, stop):
+        self.value = value
+        self.start = start
+        self.stop = stop
+
+# Plain Python operators, exact for operands whose types pyva_types has
+# proven; see NativeBinOp and NativeCompare.
+NATIVE_OPS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+class NativeBinOp(Node):
+    """A BinOp whose operand types are known, so it skips binary_op's generic dispatch"""
+    __slots__ = ('op', 'left', 'right', 'func')
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.func = NATIVE_OPS[op]
+
+class NativeCompare(Node):
+    """A Compare of two numbers, which needs no convert_for_comparison"""
+    __slots__ = ('op', 'left', 'right', 'func')
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+        self.func = NATIVE_OPS[op]
+
+class Stmt(Node):
+    """Base class for statements; every statement remembers where it came from"""
+    __slots__ = ('indent', 'lineno')
+
+class Assign(Stmt):
+    __slots__ = ('name', 'value')
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+class AssignLocal(Stmt):
+    """An Assign to a function local, resolved to its frame slot by pyva_resolve"""
+    __slots__ = ('name', 'slot', 'value')
+    def __init__(self, name, slot, value):
+        self.name = name
+        self.slot = slot
+        self.value = value
+
+class AssignItem(Stmt):
+    """target[index] = value, evaluated in that order"""
+    __slots__ = ('target', 'index', 'value')
+    def __init__(self, target, index, value):
+        self.target = target
+        self.index = index
+        self.value = value
+
+class ExprStmt(Stmt):
+    __slots__ = ('expr',)
+    def __init__(self, expr):
+        self.expr = expr
+
+class Return(Stmt):
+    __slots__ = ('value',)
+    def __init__(self, value):
+        self.value = value
+
+class Break(Stmt):
+    __slots__ = ()
+
+class Continue(Stmt):
+    __slots__ = ()
+
+class IfHeader(Stmt):
+    __slots__ = ('cond',)
+    def __init__(self, cond):
+        self.cond = cond
+
+class ElifHeader(Stmt):
+    __slots__ = ('cond',)
+    def __init__(self, cond):
+        self.cond = cond
+
+class ElseHeader(Stmt):
+    __slots__ = ()
+
+class WhileHeader(Stmt):
+    __slots__ = ('cond',)
+    def __init__(self, cond):
+        self.cond = cond
+
+class DoHeader(Stmt):
+    __slots__ = ()
+
+class ForHeader(Stmt):
+    __slots__ = ('var', 'loop_type', 'items')
+    def __init__(self, var, loop_type, items):
+        self.var = var
+        self.loop_type = loop_type
+        self.items = items
+
+# Compound statements produced by build_block_tree from the headers above
+
+class If(Stmt):
+    __slots__ = ('branches', 'orelse')
+    def __init__(self, branches, orelse=None):
+        self.branches = branches
+        self.orelse = orelse
+
+class While(Stmt):
+    __slots__ = ('cond', 'body')
+    def __init__(self, cond, body):
+        self.cond = cond
+        self.body = body
+
+class DoWhile(Stmt):
+    __slots__ = ('body', 'cond')
+    def __init__(self, body, cond):
+        self.body = body
+        self.cond = cond
+
+class For(Stmt):
+    """A for loop; slot is the frame slot of the loop variable once pyva_resolve has run.
+
+    reduction is the pyva_reduce.Reduction the optimizer found for a range
+    loop that only sums integer terms, which the engines try first.
+    """
+    __slots__ = ('var', 'loop_type', 'items', 'body', 'slot', 'reduction')
+    def __init__(self, var, loop_type, items, body, slot=None, reduction=None):
+        self.var = var
+        self.loop_type = loop_type
+        self.items = items
+        self.body = body
+        self.slot = slot
+        self.reduction = reduction
+
+# ---------------------------------------------------------------------------
+# Parser
+# ---------------------------------------------------------------------------
+
+BINARY_PRECEDENCE = {
+    'or': 1,
+    'and': 2,
+    '==': 4, '!=': 4, '<': 4, '<=': 4, '>': 4, '>=': 4,
+    '+': 5, '-': 5,
+    '*': 6, '/': 6, '%': 6,
+}
+COMPARISON_OPS = ('==', '!=', '<', '<=', '>', '>=')
+NOT_PRECEDENCE = 3
+
+class Parser:
+    """Precedence-climbing parser over the tokens of one source line"""
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def at_op(self, value):
+        kind, tok_value = self.tokens[self.pos]
+        return kind == 'op' and tok_value == value
+
+    def expect_op(self, value):
+        if not self.at_op(value):
+            raise SyntaxError(f"Expected '{value}'")
+        self.pos += 1
+
+    def expect_name(self):
+        kind, value = self.advance()
+        if kind != 'name':
+            raise SyntaxError("Expected a name")
+        return value
+
+    def expect_end(self):
+        kind, value = self.peek()
+        if kind != 'eof':
+            raise SyntaxError(f"Unexpected '{value}'")
+
+    def parse_expression(self, min_prec=1):
+        left = self.parse_unary()
+        while True:
+            kind, op = self.peek()
+            if kind != 'op':
+                break
+            prec = BINARY_PRECEDENCE.get(op)
+            if prec is None or prec < min_prec:
+                break
+            self.pos += 1
+            right = self.parse_expression(prec + 1)
+            if op in ('and', 'or'):
+                if isinstance(left, BoolOp) and left.op == op:
+                    left.values.append(right)
                 else:
-                    return False
-    for op in ['+', '-']:
-        parts = split_expression_safe(expr, op)
-        if len(parts) > 1:
-            result = evaluate_expression(parts[0].strip(), local_vars)
-            for i in range(1, len(parts)):
-                right = evaluate_expression(parts[i].strip(), local_vars)
-                try:
-                    if op == '+':
-                        result = result + right
-                    elif op == '-':
-                        result = result - right
-                except TypeError:
-                    if op == '+':
-                        result = str(result) + str(right)
-                    else:
-                        result = 0
-            return result
-    for op in ['*', '/', '%']:
-        parts = split_expression_safe(expr, op)
-        if len(parts) > 1:
-            result = evaluate_expression(parts[0].strip(), local_vars)
-            for i in range(1, len(parts)):
-                right = evaluate_expression(parts[i].strip(), local_vars)
-                try:
-                    if op == '*':
-                        result = result * right
-                    elif op == '/':
-                        result = result / right if right != 0 else 0
-                    elif op == '%':
-                        result = result % right if right != 0 else 0
-                except:
-                    result = 0
-            return result
-    if expr.isidentifier():
-        return expr
+                    left = BoolOp(op, [left, right])
+            elif op in COMPARISON_OPS:
+                left = Compare(op, left, right)
+            else:
+                left = BinOp(op, left, right)
+        return left
+
+    def parse_unary(self):
+        if self.at_op('not'):
+            self.pos += 1
+            return UnaryOp('not', self.parse_expression(NOT_PRECEDENCE))
+        if self.at_op('-'):
+            self.pos += 1
+            operand = self.parse_unary()
+            if isinstance(operand, Const) and type(operand.value) in (int, float):
+                return Const(-operand.value)
+            return UnaryOp('-', operand)
+        if self.at_op('+'):
+            self.pos += 1
+            return self.parse_unary()
+        return self.parse_primary()
+
+    def parse_primary(self):
+        return self.parse_subscripts(self.parse_atom())
+
+    def parse_atom(self):
+        kind, value = self.advance()
+        if kind in ('number', 'string'):
+            return Const(value)
+        if kind == 'name':
+            if value.lower() in ('true', 'false'):
+                return Const(value.lower() == 'true')
+            if self.at_op('('):
+                self.pos += 1
+                return Call(value, self.parse_call_args())
+            return Name(value)
+        if kind == 'op' and value == '(':
+            expr = self.parse_expression()
+            self.expect_op(')')
+            return expr
+        if kind == 'op' and value == '[':
+            return List(self.parse_list_items())
+        if kind == 'op' and value == '{':
+            return self.parse_map_items()
+        if kind == 'eof':
+            raise SyntaxError("Unexpected end of expression")
+        raise SyntaxError(f"Unexpected '{value}'")
+
+    def parse_subscripts(self, node):
+        """Parse any '[index]' and '[start:stop]' following an atom"""
+        while self.at_op('['):
+            self.pos += 1
+            start = None if self.at_op(':') else self.parse_expression()
+            if self.at_op(':'):
+                self.pos += 1
+                stop = None if self.at_op(']') else self.parse_expression()
+                node = Slice(node, start, stop)
+            elif start is None:
+                raise SyntaxError("Expected an index")
+            else:
+                node = Subscript(node, start)
+            self.expect_op(']')
+        return node
+
+    def parse_list_items(self):
+        """Parse the items of a list up to its ']'; the '[' is already consumed"""
+        items = []
+        while not self.at_op(']'):
+            items.append(self.parse_expression())
+            if not self.at_op(','):
+                break
+            self.pos += 1
+        self.expect_op(']')
+        return items
+
+    def parse_map_items(self):
+        """Parse the 'key: value' pairs of a map up to its '}'; the '{' is already consumed"""
+        keys = []
+        values = []
+        while not self.at_op('}'):
+            keys.append(self.parse_expression())
+            self.expect_op(':')
+            values.append(self.parse_expression())
+            if not self.at_op(','):
+                break
+            self.pos += 1
+        self.expect_op('}')
+        return Map(keys, values)
+
+    def parse_call_args(self):
+        """Parse a comma separated argument list; the '(' is already consumed"""
+        args = []
+        if self.at_op(')'):
+            self.pos += 1
+            return args
+        while True:
+            args.append(self.parse_expression())
+            if self.at_op(','):
+                self.pos += 1
+                continue
+            self.expect_op(')')
+            return args
+
+def parse_expression(text):
+    """Parse a complete PyVa expression into an AST"""
+    parser = Parser(text)
+    expr = parser.parse_expression()
+    parser.expect_end()
     return expr
 
+def _header_condition(line, keyword):
+    return parse_expression(line[len(keyword):-1])
+
+def _starts_with_keyword(line, keyword):
+    return (line.startswith(keyword) and len(line) > len(keyword)
+            and (line[len(keyword)].isspace() or line[len(keyword)] == '('))
+
+def parse_for_header(text):
+    parser = Parser(text[3:-1])
+    var_name = parser.expect_name()
+    kind, value = parser.advance()
+    if kind != 'name' or value != 'in':
+        raise SyntaxError("Invalid for statement")
+    kind, value = parser.peek()
+    if kind == 'name' and value == 'range' and parser.tokens[parser.pos + 1] == ('op', '('):
+        parser.pos += 2
+        items = parser.parse_call_args()
+        if not 1 <= len(items) <= 3:
+            raise SyntaxError("Range function accepts 1, 2, or 3 arguments")
+        loop_type = 'range'
+    elif kind == 'op' and value == '[':
+        parser.pos += 1
+        items = parser.parse_list_items()
+        loop_type = 'list'
+    elif kind == 'name':
+        parser.pos += 1
+        items = value
+        loop_type = 'variable'
+    else:
+        raise SyntaxError("Invalid for statement")
+    parser.expect_end()
+    return ForHeader(var_name, loop_type, items)
+
+def parse_statement(line):
+    """Parse one stripped source statement into a statement node"""
+    if line.endswith(':'):
+        if _starts_with_keyword(line, 'if'):
+            return IfHeader(_header_condition(line, 'if'))
+        if _starts_with_keyword(line, 'elif'):
+            return ElifHeader(_header_condition(line, 'elif'))
+        if _starts_with_keyword(line, 'while'):
+            return WhileHeader(_header_condition(line, 'while'))
+        if _starts_with_keyword(line, 'for'):
+            return parse_for_header(line)
+        compact = line.replace(' ', '')
+        if compact == 'else:':
+            return ElseHeader()
+        if compact == 'do:':
+            return DoHeader()
+    if line == 'break':
+        return Break()
+    if line == 'continue':
+        return Continue()
+    if line == 'return':
+        return Return(None)
+    if _starts_with_keyword(line, 'return') or line.startswith('return"'):
+        return Return(parse_expression(line[6:]))
+    parser = Parser(line)
+    expr = parser.parse_expression()
+    if parser.at_op('='):
+        if not isinstance(expr, (Name, Subscript)):
+            raise SyntaxError("Cannot assign to expression")
+        parser.pos += 1
+        value = parser.parse_expression()
+        parser.expect_end()
+        if isinstance(expr, Subscript):
+            return AssignItem(expr.value, expr.index, value)
+        return Assign(expr.name, value)
+    parser.expect_end()
+    return ExprStmt(expr)
+
+def indent_width(line):
+    expanded = line.expandtabs(4)
+    return len(expanded) - len(expanded.lstrip())
+
+def collect_body(stmts, start_idx):
+    """Return the statements nested under stmts[start_idx] and the index after them"""
+    indent = stmts[start_idx].indent
+    i = start_idx + 1
+    n = len(stmts)
+    while i < n and stmts[i].indent > indent:
+        i += 1
+    return stmts[start_idx + 1:i], i
+
+def build_block_tree(stmts, in_loop=False):
+    """Nest a flat, indentation-tagged statement list into compound statements"""
+    tree = []
+    i = 0
+    n = len(stmts)
+    while i < n:
+        stmt = stmts[i]
+        kind = stmt.__class__
+        if kind is IfHeader:
+            body, i = collect_body(stmts, i)
+            node = If([(stmt.cond, build_block_tree(body, in_loop))])
+            while i < n and stmts[i].indent == stmt.indent and stmts[i].__class__ in (ElifHeader, ElseHeader):
+                branch = stmts[i]
+                body, i = collect_body(stmts, i)
+                if branch.__class__ is ElseHeader:
+                    node.orelse = build_block_tree(body, in_loop)
+                    break
+                node.branches.append((branch.cond, build_block_tree(body, in_loop)))
+        elif kind is WhileHeader:
+            body, i = collect_body(stmts, i)
+            node = While(stmt.cond, build_block_tree(body, True))
+        elif kind is ForHeader:
+            body, i = collect_body(stmts, i)
+            node = For(stmt.var, stmt.loop_type, stmt.items, build_block_tree(body, True))
+        elif kind is DoHeader:
+            body, i = collect_body(stmts, i)
+            if i >= n or stmts[i].__class__ is not WhileHeader or stmts[i].indent != stmt.indent:
+                raise SyntaxError(f"line {stmt.lineno}: do-while loop missing 'while' condition")
+            node = DoWhile(build_block_tree(body, True), stmts[i].cond)
+            i += 1
+        elif kind is ElifHeader or kind is ElseHeader:
+            raise SyntaxError(f"line {stmt.lineno}: '{'elif' if kind is ElifHeader else 'else'}' without matching 'if'")
+        else:
+            if (kind is Break or kind is Continue) and not in_loop:
+                raise SyntaxError(f"line {stmt.lineno}: '{'break' if kind is Break else 'continue'}' outside loop")
+            tree.append(stmt)
+            i += 1
+            continue
+        node.indent = stmt.indent
+        node.lineno = stmt.lineno
+        tree.append(node)
+    return tree
+
+def walk_statements(stmts):
+    """Yield every statement of a block tree, nested ones included"""
+    for stmt in stmts:
+        yield stmt
+        kind = stmt.__class__
+        if kind is If:
+            for _, body in stmt.branches:
+                yield from walk_statements(body)
+            if stmt.orelse is not None:
+                yield from walk_statements(stmt.orelse)
+        elif kind is While or kind is For or kind is DoWhile:
+            yield from walk_statements(stmt.body)
+
+def parse_block(lines, first_lineno=1):
+    """Parse raw source lines into a block tree of statements"""
+    statements = []
+    for offset, raw_line in enumerate(lines):
+        lineno = first_lineno + offset
+        indent = indent_width(raw_line)
+        for segment in split_source_line(raw_line):
+            try:
+                stmt = parse_statement(segment)
+            except SyntaxError as e:
+                raise SyntaxError(f"line {lineno}: {e}") from None
+            stmt.indent = indent
+            stmt.lineno = lineno
+            statements.append(stmt)
+    return build_block_tree(statements)
+
+# ---------------------------------------------------------------------------
+# Evaluator
+# ---------------------------------------------------------------------------
+
 def convert_for_comparison(value):
     if isinstance(value, str):
         if value.lstrip('-').replace('.', '').isdigit():
             return float(value) if '.' in value else int(value)
     return value
 
-def is_balanced_parentheses(expr):
-    count = 0
-    in_string = False
-    for char in expr:
-        if char == '"':
-            in_string = not in_string
-        elif not in_string:
-            if char == '(':
-                count += 1
-            elif char == ')':
-                count -= 1
-                if count < 0:
-                    return False
-    return count == 0
-
-def split_expression_safe(expr, operator):
-    parts = []
-    current_part = ""
-    paren_depth = 0
-    quote_depth = 0
-    i = 0
-    op_len = len(operator)
-    while i < len(expr):
-        if expr[i] == '"' and paren_depth == 0:
-            quote_depth = 1 - quote_depth
-            current_part += expr[i]
-        elif expr[i] == '(' and quote_depth == 0:
-            paren_depth += 1
-            current_part += expr[i]
-        elif expr[i] == ')' and quote_depth == 0:
-            paren_depth -= 1
-            current_part += expr[i]
-        elif (paren_depth == 0 and quote_depth == 0 and 
-              i + op_len <= len(expr) and 
-              expr[i:i+op_len].lower() == operator):
-            before_ok = (i == 0 or expr[i-1] not in '=!<>')
-            after_ok = (i + op_len >= len(expr) or (i + op_len < len(expr) and expr[i + op_len] not in '=!<>'))
-            if before_ok and after_ok:
-                parts.append(current_part.strip())
-                current_part = ""
-                i += op_len - 1
+def is_true(value):
+    """Truthiness of if/while conditions"""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return value != 0
+    if isinstance(value, str):
+        return value.lower() in ['true', '1', 'yes', 'y']
+    if value is None:
+        return False
+    return bool(value)
+
+def builtin_int(args):
+    value = args[0] if args else None
+    try:
+        if isinstance(value, str):
+            value = value.strip()
+            if value.lstrip('-').replace('.', '').isdigit():
+                return int(float(value))
+            return 0
+        return int(value)
+    except Exception:
+        return 0
+
+def builtin_float(args):
+    try:
+        return float(args[0] if args else None)
+    except Exception:
+        return 0
+
+def builtin_str(args):
+    return str(args[0] if args else None)
+
+def builtin_bool(args):
+    value = args[0] if args else None
+    if isinstance(value, str):
+        return value.lower() in ['true', '1', 'yes', 'y']
+    return bool(value)
+
+def builtin_len(args):
+    value = args[0] if args else None
+    if not isinstance(value, (str, PyvaList, PyvaMap, range)):
+        raise TypeError(f"len() needs a list, a map or a string, not {type(value).__name__}")
+    return len(value)
+
+def builtin_append(args):
+    if len(args) != 2 or args[0].__class__ is not PyvaList:
+        raise TypeError("append() takes a list and a value")
+    args[0].append(args[1])
+
+def builtin_get(args):
+    if not 2 <= len(args) <= 3 or args[0].__class__ is not PyvaMap:
+        raise TypeError("get() takes a map, a key and an optional default")
+    return args[0].get(args[1], args[2] if len(args) == 3 else None)
+
+def builtin_set(args):
+    if len(args) != 3 or args[0].__class__ is not PyvaMap:
+        raise TypeError("set() takes a map, a key and a value")
+    args[0][args[1]] = args[2]
+
+def builtin_contains(args):
+    if len(args) != 2 or not isinstance(args[0], (str, PyvaList, PyvaMap)):
+        raise TypeError("contains() takes a map, a list or a string and a value")
+    return args[1] in args[0]
+
+def builtin_keys(args):
+    if len(args) != 1 or args[0].__class__ is not PyvaMap:
+        raise TypeError("keys() takes a map")
+    return PyvaList(dict.keys(args[0]))
+
+def builtin_values(args):
+    if len(args) != 1 or args[0].__class__ is not PyvaMap:
+        raise TypeError("values() takes a map")
+    return PyvaList(args[0].values())
+
+def builtin_range(args):
+    """A lazy range value, with the bounds of a 'for ... in range(...)' loop"""
+    if not 1 <= len(args) <= 3:
+        raise TypeError("range() takes 1, 2 or 3 arguments")
+    bounds = [int(value) for value in args]
+    if len(bounds) == 1:
+        bounds.insert(0, 0)
+    return range(*bounds)
+
+class StringBuilder:
+    """Value of a variable that a loop only extends with '+', see Optimizer.concat_block.
+
+    Once the value is a string, binary_op's '+' appends str() of the right
+    operand to it, so from then on the parts are collected in a list and
+    joined once when the loop is done instead of copied on every '+'.
+    """
+    __slots__ = ('value', 'parts')
+
+    def __init__(self, value):
+        self.value = value
+        self.parts = [value] if value.__class__ is str else None
+
+    def add(self, terms):
+        parts = self.parts
+        for term in terms:
+            if parts is not None:
+                parts.append(term if term.__class__ is str else str(term))
             else:
-                current_part += expr[i]
-        else:
-            current_part += expr[i]
-        i += 1
-    if current_part:
-        parts.append(current_part.strip())
-    return parts
-
-def parse_function_call_enhanced(expr, local_vars):
-    paren_index = expr.find('(')
-    if paren_index == -1:
-        raise ValueError("Invalid function call syntax")
-    fname = expr[:paren_index].strip()
-    args_start = paren_index + 1
-    paren_count = 1
-    i = args_start
-    while i < len(expr) and paren_count > 0:
-        if expr[i] == '(':
-            paren_count += 1
-        elif expr[i] == ')':
-            paren_count -= 1
-        i += 1
-    if paren_count != 0:
-        raise ValueError("Mismatched parentheses in function call")
-    args_str = expr[args_start:i-1].strip()
-    args = []
-    if args_str:
-        args = parse_arguments(args_str, local_vars)
-    return fname, args
-
-def parse_arguments(args_str, local_vars):
-    args = []
-    current_arg = ""
-    paren_depth = 0
-    quote_depth = 0
-    for char in args_str + ',':
-        if char == '"' and paren_depth == 0:
-            quote_depth = 1 - quote_depth
-            current_arg += char
-        elif char == '(' and quote_depth == 0:
-            paren_depth += 1
-            current_arg += char
-        elif char == ')' and quote_depth == 0:
-            paren_depth -= 1
-            current_arg += char
-        elif char == ',' and paren_depth == 0 and quote_depth == 0:
-            if current_arg.strip():
-                arg_value = evaluate_expression(current_arg.strip(), local_vars)
-                args.append(arg_value)
-            current_arg = ""
-        else:
-            current_arg += char
-    return args
+                self.value = binary_op('+', self.value, term)
+                if self.value.__class__ is str:
+                    parts = self.parts = [self.value]
 
-def parse_function(lines):
+    def result(self):
+        if self.parts is not None:
+            self.value = ''.join(self.parts)
+            self.parts = [self.value]
+        return self.value
+
+def builtin_concat_start(args):
+    return StringBuilder(args[0])
+
+def builtin_concat_add(args):
+    args[0].add(args[1:])
+
+def builtin_concat_end(args):
+    return args[0].result()
+
+# Builtins that need no interpreter state; print and input are bound per
+# Interpreter so they can use its own stdin/stdout channels.
+BUILTINS = {
+    'int': builtin_int,
+    'float': builtin_float,
+    'str': builtin_str,
+    'bool': builtin_bool,
+    'len': builtin_len,
+    'append': builtin_append,
+    'range': builtin_range,
+    'get': builtin_get,
+    'set': builtin_set,
+    'contains': builtin_contains,
+    'keys': builtin_keys,
+    'values': builtin_values,
+    # Only emitted by the optimizer, like its '__hoisted' temporaries.
+    '__concat_start': builtin_concat_start,
+    '__concat_add': builtin_concat_add,
+    '__concat_end': builtin_concat_end,
+}
+
+# Builtins that change their first argument in place.
+MUTATING_BUILTINS = frozenset(('append', 'set'))
+
+# Builtins that never raise, whatever their arguments.
+SAFE_BUILTINS = frozenset(('int', 'float', 'str', 'bool', 'input', 'print'))
+BUILTIN_NAMES = frozenset(BUILTINS) | {'input', 'print'}
+
+def binary_op(op, left, right):
+    """Arithmetic with PyVa's forgiving semantics: failures yield 0, '+' falls back to concatenation"""
+    if op == '+':
+        try:
+            return left + right
+        except TypeError:
+            return str(left) + str(right)
+    if op == '-':
+        try:
+            return left - right
+        except TypeError:
+            return 0
+    try:
+        if op == '*':
+            return left * right
+        if op == '/':
+            return left / right if right != 0 else 0
+        if op == '%':
+            return left % right if right != 0 else 0
+    except Exception:
+        return 0
+    raise SyntaxError(f"Unknown operator '{op}'")
+
+def compare_op(op, left, right):
+    left = convert_for_comparison(left)
+    right = convert_for_comparison(right)
+    try:
+        if op == '==':
+            return left == right
+        elif op == '!=':
+            return left != right
+        elif op == '<=':
+            return left <= right
+        elif op == '>=':
+            return left >= right
+        elif op == '<':
+            return left < right
+        elif op == '>':
+            return left > right
+    except TypeError:
+        if op == '==':
+            return str(left) == str(right)
+        elif op == '!=':
+            return str(left) != str(right)
+        return False
+
+def coerce_argument(value, param_type):
+    """Convert an argument to the declared parameter type, keeping it unchanged if that fails"""
+    try:
+        if param_type == int:
+            if isinstance(value, str) and value.lstrip('-').replace('.', '').isdigit():
+                return int(float(value))
+            return int(value)
+        elif param_type == float:
+            return float(value)
+        elif param_type == bool:
+            if isinstance(value, str):
+                return value.lower() in ['true', '1', 'yes', 'y']
+            return bool(value)
+        elif param_type is PyvaList:
+            if value.__class__ is PyvaList:
+                return value
+            return PyvaList(value if isinstance(value, (str, range)) else [value])
+        elif param_type is PyvaMap:
+            # Nothing converts to a map.
+            return value
+        return str(value)
+    except (ValueError, TypeError):
+        return value
+
+def parse_function(lines, first_lineno=1, registry=None):
+    if registry is None:
+        registry = functions
     header = lines[0].strip()
-    match = re.match(r'def\s+(\w+)\s*\((.*?)\)\s*(?:->\s*(\w+))?:', header)
+    match = re.match(r'def\s+(\w+)\s*\((.*?)\)\s*(?:->\s*(\w+))?\s*:', header)
     if not match:
-        raise SyntaxError("Invalid function definition")
+        raise SyntaxError(f"line {first_lineno}: Invalid function definition")
     fname = match.group(1)
     params_str = match.group(2)
     return_type = match.group(3) or 'void'
@@ -279,489 +942,697 @@ def parse_function(lines):
                 params.append((name.strip(), parse_type(ptype.strip())))
             else:
                 params.append((param, str))
-    body = lines[1:]
-    functions[fname] = (params, body, return_type)
+    body = parse_block(lines[1:], first_lineno + 1)
+    registry[fname] = (params, body, return_type)
+    return fname
 
-def execute_statement(line, local_vars):
-    line = line.strip()
-    if not line:
-        return
-    try:
-        if '(' in line and ')' in line and '=' not in line:
-            try:
-                fname, args = parse_function_call_enhanced(line, local_vars)
-                if fname in functions:
-                    return execute_function(fname, args)
-                elif fname == 'print':
-                    if args:
-                        print(*args)
-                    else:
-                        print()
-                    return
-                elif fname == 'input':
-                    prompt = args[0] if args else ""
-                    return input(str(prompt))
-            except Exception as e:
-                raise SyntaxError(f"Error in function call '{line}': {e}")
-        if '=' in line and not any(op in line for op in ['==', '!=', '<=', '>=']):
-            parts = line.split('=', 1)
-            var_name = parts[0].strip()
-            expr = parts[1].strip()
-            value = evaluate_expression(expr, local_vars)
-            local_vars[var_name] = value
-            return
-        if line.startswith("print(") and line.endswith(")"):
-            expr = line[6:-1]
-            value = evaluate_expression(expr, local_vars)
-            print(value if value is not None else "")
-            return
-        if line.startswith("return"):
-            if len(line) > 6:
-                expr = line[6:].strip()
-                value = evaluate_expression(expr, local_vars)
-            else:
-                value = None
-            raise ReturnException(value)
-        if line == "break":
-            raise BreakException()
-        if line == "continue":
-            raise ContinueException()
-        try:
-            result = evaluate_expression(line, local_vars)
-            return result
-        except Exception as e:
-            raise SyntaxError(f"Error evaluating expression '{line}': {e}")
-    except Exception as e:
-        print(f"Error: {e}")
+def count_braces(line):
+    """Net '{' minus '}' count of a line, ignoring braces inside strings and comments"""
+    count = 0
+    quote = None
+    for char in line:
+        if quote:
+            if char == quote:
+                quote = None
+        elif char in '"\'':
+            quote = char
+        elif char == '#':
+            break
+        elif char == '{':
+            count += 1
+        elif char == '}':
+            count -= 1
+    return count
 
-def execute_if_block(lines, start_idx, local_vars):
-    i = start_idx
-    n = len(lines)
-    line = lines[i].strip()
-    if_match = re.match(r'if\s+(.+):', line)
-    if not if_match:
-        raise SyntaxError("Invalid if statement")
-    conditions_blocks = []
-    cond = if_match.group(1).strip()
-    current_block = []
-    i += 1
-    while i < n:
-        current_line = lines[i]
-        stripped_line = current_line.strip()
-        if stripped_line.startswith('if ') or stripped_line.startswith('elif ') or stripped_line.startswith('else:'):
-            conditions_blocks.append((cond, current_block))
-            current_block = []
-            if stripped_line.startswith('elif '):
-                elif_match = re.match(r'elif\s+(.+):', stripped_line)
-                if not elif_match:
-                    raise SyntaxError("Invalid elif statement")
-                cond = elif_match.group(1).strip()
-            elif stripped_line == 'else:':
-                cond = None
-            else:
-                break
+def load_program(source_code, registry=None, memoized=None):
+    """Register every function of a program and return the parsed main block.
+
+    The names of functions preceded by an '@memo' line are added to the
+    memoized set, if one is given.
+    """
+    lines = source_code.split('\n')
+    lines = [line.rstrip() for line in lines]
+
+    i = 0
+    main_block = []
+    memo_next = False
+    while i < len(lines):
+        line = lines[i].strip()
+        if line == "@memo":
+            memo_next = True
+            i += 1
+        elif line.startswith("def "):
+            j = i + 1
+            while j < len(lines) and (lines[j].startswith("    ") or lines[j].startswith("\t") or lines[j].strip() == ""):
+                j += 1
+            fname = parse_function(lines[i:j], i + 1, registry)
+            if memo_next and memoized is not None:
+                memoized.add(fname)
+            memo_next = False
+            i = j
+        elif re.match(r'main\s*\{', line):
+            # collect main block lines until matching closing '}'
+            start = i + 1
+            brace_count = 1
+            i += 1
+            while i < len(lines):
+                brace_count += count_braces(lines[i])
+                if brace_count <= 0:
+                    break
+                i += 1
+            main_block = parse_block(lines[start:i], start + 1)
             i += 1
-            continue
-        if stripped_line and not current_line.startswith('    ') and not current_line.startswith('\t'):
-            break
-        if stripped_line or current_line.strip() == "":
-            current_block.append(stripped_line)
-        i += 1
-    conditions_blocks.append((cond, current_block))
-    for cond, block in conditions_blocks:
-        if cond is None:
-            execute_block(block, local_vars)
-            break
         else:
-            cond_result = evaluate_expression(cond, local_vars)
-            if isinstance(cond_result, bool):
-                cond_bool = cond_result
-            elif isinstance(cond_result, (int, float)):
-                cond_bool = cond_result != 0
-            elif isinstance(cond_result, str):
-                cond_bool = cond_result.lower() in ['true', '1', 'yes', 'y'] and cond_result != ""
-            else:
-                cond_bool = bool(cond_result)
-            if cond_bool:
-                execute_block(block, local_vars)
-                break
-    return i - 1
-
-def execute_while_loop(lines, start_idx, local_vars):
-    i = start_idx
-    line = lines[i].strip()
-    while_match = re.match(r'while\s+(.+):', line)
-    if not while_match:
-        raise SyntaxError("Invalid while statement")
-    condition = while_match.group(1).strip()
-    i += 1
-    loop_body = []
-    while i < len(lines):
-        current_line = lines[i]
-        stripped_line = current_line.strip()
-        if stripped_line and not current_line.startswith("    ") and not current_line.startswith("\t"):
-            break
-        if stripped_line:
-            loop_body.append(stripped_line)
-        elif current_line.strip() == "":
-            loop_body.append("")
-        i += 1
-    loop_iterations = 0
-    max_iterations = 100000
-    while loop_iterations < max_iterations:
-        condition_result = evaluate_expression(condition, local_vars)
-        if isinstance(condition_result, bool):
-            condition_bool = condition_result
-        elif isinstance(condition_result, (int, float)):
-            condition_bool = condition_result != 0
-        elif isinstance(condition_result, str):
-            condition_bool = (condition_result.lower() in ['true', '1', 'yes', 'y'] and 
-                            condition_result.strip() != "")
-        elif condition_result is None:
-            condition_bool = False
+            i += 1
+    return main_block
+
+ENGINES = ('tree', 'vm', 'python')
+
+# One step is one executed statement. Every engine charges a block's
+# statement count when the block is entered, so loop iterations and
+# function calls are all paid for; an empty block costs one step, so a
+# loop with an empty body still runs out of budget. The deadline is
+# checked every BUDGET_CHECK_INTERVAL steps.
+DEFAULT_MAX_STEPS = 10000000
+BUDGET_CHECK_INTERVAL = 10000
+
+def check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine '{engine}', expected one of: {', '.join(ENGINES)}")
+
+DEFAULT_MEMO_SIZE = 4096
+
+# Memoized results are only kept when the caller cannot change them.
+CACHEABLE_TYPES = (int, float, str, bool, type(None))
+
+def memo_key(fname, args):
+    """Memo cache key of a call; raises TypeError if an argument is unhashable.
+
+    Equal arguments of different types (1, 1.0 and True) or signs (0.0 and
+    -0.0) can give different results, so each argument is keyed with its
+    type, and floats by repr. The key stays one flat tuple, since the
+    cache may hold thousands of them.
+    """
+    key = [fname]
+    for arg in args:
+        kind = type(arg)
+        key.append(kind)
+        key.append(repr(arg) if kind is float else arg)
+    return tuple(key)
+
+class MemoCache:
+    """Least recently used cache of function results keyed by (name, coerced arguments)"""
+
+    def __init__(self, max_entries=DEFAULT_MEMO_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Cached value for key, or default; raises TypeError if key is unhashable"""
+        value = self._entries.get(key, default)
+        if value is default:
+            self.misses += 1
         else:
-            condition_bool = bool(condition_result)
-        if not condition_bool:
-            break
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if type(value) not in CACHEABLE_TYPES:
+            return
+        self._entries[key] = value
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def stats(self):
+        return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                'evictions': self.evictions}
+
+class Program:
+    """A parsed PyVa program with its functions, main block and compiled forms.
+
+    Running a program never modifies it, so one Program can be executed any
+    number of times, by any number of interpreters. With optimize, the block
+    trees go through pyva_optimize and then pyva_types before any engine
+    sees them. specialized maps a function name to its body with native
+    operations, which runs when every argument has its declared type after
+    coercion. memoized names the functions whose calls are cached.
+    """
+
+    def __init__(self, source_code, optimize=True):
+        import pyva_memo
+        self.functions = {}
+        self.specialized = {}
+        annotated = set()
+        main_block = load_program(source_code, self.functions, annotated)
+        if optimize:
+            import pyva_optimize
+            import pyva_types
+            main_block = pyva_optimize.optimize_program(self.functions, main_block)
+            main_block, self.specialized = pyva_types.specialize_program(self.functions, main_block)
+        self.main_block = main_block
+        self.memoized = pyva_memo.memoized_functions(self.functions, annotated)
+        self.compiled = {}
+
+    def compile(self, engine):
+        """Return the engine's executable form of the program, building it on first use"""
+        check_engine(engine)
+        if engine not in self.compiled:
+            if engine == 'vm':
+                import pyva_vm
+                self.compiled[engine] = pyva_vm.compile_program(self.functions, self.main_block,
+                                                                self.specialized)
+            elif engine == 'python':
+                import pyva_transpile
+                self.compiled[engine] = pyva_transpile.compile_program(self.functions, self.main_block,
+                                                                       self.specialized)
+            else:
+                import pyva_resolve
+                self.compiled[engine] = pyva_resolve.compile_program(self.functions, self.main_block,
+                                                                     self.specialized)
+        return self.compiled[engine]
+
+class Interpreter:
+    """One PyVa runtime: owns the functions, globals and I/O channels of a program run.
+
+    stdin is any object with readline() (None reads the terminal through
+    input()), stdout any object with write() (None means sys.stdout at the
+    time of writing). Separate instances share nothing, so they can run
+    concurrently in different threads. optimize=False runs programs exactly
+    as parsed, without the pyva_optimize pass. Calls of a program's
+    memoized functions share an LRU cache of memo_size results per run;
+    0 turns memoization off.
+    """
+
+    def __init__(self, stdin=None, stdout=None, echo_prompts=True, optimize=True, memo_size=DEFAULT_MEMO_SIZE):
+        self.functions = {}
+        self.resolved = {}
+        self.memo = MemoCache(memo_size)
+        self.memoized = frozenset()
+        self.errors = 0
+        self.global_vars = {}
+        self.stdin = stdin
+        self.stdout = stdout
+        self.echo_prompts = echo_prompts
+        self.optimize = optimize
+        self.start_budget(None, None)
+        self.builtins = dict(BUILTINS)
+        self.builtins['input'] = self.builtin_input
+        self.builtins['print'] = self.builtin_print
+        self.evaluators = {
+            Const: self._eval_const,
+            Name: self._eval_name,
+            LocalName: self._eval_local,
+            GlobalName: self._eval_global,
+            UnaryOp: self._eval_unary,
+            BinOp: self._eval_binop,
+            Compare: self._eval_compare,
+            NativeBinOp: self._eval_native,
+            NativeCompare: self._eval_native,
+            BoolOp: self._eval_boolop,
+            Call: self._eval_call,
+            List: self._eval_list,
+            Map: self._eval_map,
+            Subscript: self._eval_subscript,
+            Slice: self._eval_slice,
+        }
+
+    # -- I/O -------------------------------------------------------------------
+
+    def write_line(self, text):
+        print(text, file=self.stdout)
+
+    def report_error(self, error):
+        self.errors += 1
+        self.write_line(f"Error: {error}")
+
+    def builtin_print(self, args):
+        print(*args, file=self.stdout)
+
+    def builtin_input(self, args):
+        prompt = str(args[0]) if args else ""
+        if self.stdin is None:
+            if self.stdout is None:
+                return input(prompt)
+            self.stdout.write(prompt)
+            return input()
+        if self.echo_prompts and prompt:
+            (self.stdout or sys.stdout).write(prompt)
+        line = self.stdin.readline()
+        if line.endswith('\n'):
+            line = line[:-1]
+        if line.endswith('\r'):
+            line = line[:-1]
+        return line
+
+    # -- execution budget ----------------------------------------------------------
+
+    def start_budget(self, max_steps=DEFAULT_MAX_STEPS, timeout=None):
+        """Reset the step counter; None disables the step limit or the deadline"""
+        self.steps = 0
+        self.max_steps = max_steps
+        self.timeout = timeout
+        self.started = time.monotonic()
+        self.deadline = None if timeout is None else self.started + timeout
+        self.next_check = self._next_check()
+
+    def _next_check(self):
+        limit = sys.maxsize if self.max_steps is None else self.max_steps + 1
+        if self.deadline is not None:
+            limit = min(limit, self.steps + BUDGET_CHECK_INTERVAL)
+        return limit
+
+    def check_budget(self):
+        """Called by the engines once steps reach next_check"""
+        elapsed = time.monotonic() - self.started
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise BudgetExceeded('steps', self.max_steps, self.steps, elapsed)
+        if self.deadline is not None and elapsed > self.timeout:
+            raise BudgetExceeded('time', self.timeout, self.steps, elapsed)
+        self.next_check = self._next_check()
+
+    # -- program loading and execution -------------------------------------------
+
+    def load(self, source_code):
+        """Reset the interpreter, register the program's functions and return its main block"""
+        self.functions.clear()
+        self.resolved.clear()
+        self.memoized = frozenset()
+        self.memo.clear()
+        self.global_vars.clear()
+        return load_program(source_code, self.functions)
+
+    def run(self, source_code, engine='tree', max_steps=DEFAULT_MAX_STEPS, timeout=None):
+        check_engine(engine)
+        return self.execute(Program(source_code, self.optimize), engine, max_steps, timeout)
+
+    def run_batch(self, source_code, inputs_list, engine='tree', max_steps=DEFAULT_MAX_STEPS, timeout=None):
+        """Parse a program once and run it against each input string in turn.
+
+        Returns one dict per case with the case's 'output', its 'status'
+        ('ok', 'error' or 'budget_exceeded'), the 'error' message if any and
+        the run 'time' in seconds. Every case gets the full budget. The
+        interpreter's own stdin and stdout are left untouched.
+        """
+        check_engine(engine)
+        program = Program(source_code, self.optimize)
+        program.compile(engine)
+        stdin, stdout = self.stdin, self.stdout
+        results = []
         try:
-            execute_block(loop_body, local_vars)
-        except ReturnException:
-            raise
-        except BreakException:
-            break
-        except ContinueException:
-            pass
-        loop_iterations += 1
-    if loop_iterations >= max_iterations:
-        print(f"Warning: While loop exceeded {max_iterations} iterations, stopping")
-    return i - 1
-
-def execute_do_while_loop(lines, start_idx, local_vars):
-    i = start_idx
-    line = lines[i].strip()
-    if line != "do:":
-        raise SyntaxError("Invalid do-while statement - expected 'do:'")
-    i += 1
-    loop_body = []
-    while i < len(lines):
-        current_line = lines[i]
-        stripped_line = current_line.strip()
-        if stripped_line.startswith("while ") and stripped_line.endswith(":"):
-            while_match = re.match(r'while\s+(.+):', stripped_line)
-            if not while_match:
-                raise SyntaxError("Invalid while condition in do-while loop")
-            condition = while_match.group(1).strip()
-            break
-        if stripped_line and not current_line.startswith("    ") and not current_line.startswith("\t"):
-            raise SyntaxError("do-while loop missing 'while' condition")
-        if stripped_line:
-            loop_body.append(stripped_line)
-        elif current_line.strip() == "":
-            loop_body.append("")
-        i += 1
-    if i >= len(lines):
-        raise SyntaxError("do-while loop missing 'while' condition")
-    loop_iterations = 0
-    max_iterations = 100000
-    while True:
-        loop_iterations += 1
-        if loop_iterations > max_iterations:
-            print(f"Warning: Do-while loop exceeded {max_iterations} iterations, stopping")
-            break
+            for inputs in inputs_list:
+                self.stdin = io.StringIO(inputs)
+                self.stdout = io.StringIO()
+                started = time.perf_counter()
+                try:
+                    self.execute(program, engine, max_steps, timeout)
+                    status, error = 'ok', None
+                except BudgetExceeded as e:
+                    status, error = 'budget_exceeded', str(e)
+                except Exception as e:
+                    status, error = 'error', str(e)
+                results.append({'output': self.stdout.getvalue(), 'status': status, 'error': error,
+                                'time': time.perf_counter() - started})
+        finally:
+            self.stdin, self.stdout = stdin, stdout
+        return results
+
+    def execute(self, program, engine='tree', max_steps=DEFAULT_MAX_STEPS, timeout=None):
+        """Reset the interpreter and run an already parsed Program.
+
+        The run raises BudgetExceeded once it executes more than max_steps
+        statements or runs longer than timeout seconds.
+        """
+        compiled = program.compile(engine)
+        self.functions.clear()
+        self.functions.update(program.functions)
+        self.resolved.clear()
+        self.memoized = program.memoized if self.memo.max_entries > 0 else frozenset()
+        self.memo.clear()
+        self.global_vars.clear()
+        self.start_budget(max_steps, timeout)
+        if engine == 'vm':
+            import pyva_vm
+            return pyva_vm.run_compiled(self, compiled)
+        if engine == 'python':
+            import pyva_transpile
+            return pyva_transpile.run_compiled(self, compiled)
+        resolved, main_block = compiled
+        self.resolved.update(resolved)
+        return self.execute_main(main_block)
+
+    def execute_main(self, main_block, engine='tree'):
+        if engine == 'vm':
+            import pyva_vm
+            return pyva_vm.run(self, main_block)
+        if engine == 'python':
+            import pyva_transpile
+            return pyva_transpile.run(self, main_block)
+        signal = self.execute_block(main_block, self.global_vars)
+        if signal is None:
+            return None
+        return signal.value
+
+    # -- expressions ---------------------------------------------------------------
+
+    def evaluate(self, node, local_vars):
+        """Evaluate an expression AST"""
+        return self.evaluators[node.__class__](node, local_vars)
+
+    def _eval_const(self, node, local_vars):
+        return node.value
+
+    def _eval_name(self, node, local_vars):
+        name = node.name
+        if name in local_vars:
+            return local_vars[name]
+        if name in self.global_vars:
+            return self.global_vars[name]
+        return name
+
+    def _eval_local(self, node, local_vars):
+        value = local_vars[node.slot]
+        if value is UNBOUND:
+            return self.global_vars.get(node.name, node.name)
+        return value
+
+    def _eval_global(self, node, local_vars):
+        return self.global_vars.get(node.name, node.name)
+
+    def _eval_unary(self, node, local_vars):
+        value = self.evaluate(node.operand, local_vars)
+        if node.op == 'not':
+            return not value
         try:
-            execute_block(loop_body, local_vars)
-        except ReturnException:
-            raise
-        except BreakException:
-            break
-        except ContinueException:
-            pass
-        condition_result = evaluate_expression(condition, local_vars)
-        if isinstance(condition_result, bool):
-            condition_bool = condition_result
-        elif isinstance(condition_result, (int, float)):
-            condition_bool = condition_result != 0
-        elif isinstance(condition_result, str):
-            condition_bool = (condition_result.lower() in ['true', '1', 'yes', 'y'] and 
-                            condition_result.strip() != "")
-        elif condition_result is None:
-            condition_bool = False
-        else:
-            condition_bool = bool(condition_result)
-        if not condition_bool:
-            break
-    return i
-
-def execute_for_loop(lines, start_idx, local_vars):
-    i = start_idx
-    line = lines[i].strip()
-    for_range_match = re.match(r'for\s+(\w+)\s+in\s+range\s*\((.+)\):', line)
-    for_list_match = re.match(r'for\s+(\w+)\s+in\s*\[(.+)\]:', line)
-    for_var_match = re.match(r'for\s+(\w+)\s+in\s+(\w+):', line)
-    if for_range_match:
-        var_name = for_range_match.group(1)
-        range_expr = for_range_match.group(2)
-        loop_type = "range"
-    elif for_list_match:
-        var_name = for_list_match.group(1)
-        list_expr = for_list_match.group(2)
-        loop_type = "list"
-    elif for_var_match:
-        var_name = for_var_match.group(1)
-        iterable_var = for_var_match.group(2)
-        loop_type = "variable"
-    else:
-        raise SyntaxError("Invalid for statement")
-    i += 1
-    loop_body = []
-    while i < len(lines):
-        current_line = lines[i]
-        stripped_line = current_line.strip()
-        if stripped_line and not current_line.startswith("    ") and not current_line.startswith("\t"):
-            break
-        if stripped_line:
-            loop_body.append(stripped_line)
-        elif current_line.strip() == "":
-            loop_body.append("")
-        i += 1
-    try:
-        if loop_type == "range":
-            parts_raw = [p.strip() for p in split_range_args(range_expr)]
-            if len(parts_raw) == 1:
-                start_val = 0
-                end_val = int(evaluate_expression(parts_raw[0], local_vars))
-                step_val = 1
-            elif len(parts_raw) == 2:
-                start_val = int(evaluate_expression(parts_raw[0], local_vars))
-                end_val = int(evaluate_expression(parts_raw[1], local_vars))
-                step_val = 1
-            elif len(parts_raw) == 3:
-                start_val = int(evaluate_expression(parts_raw[0], local_vars))
-                end_val = int(evaluate_expression(parts_raw[1], local_vars))
-                step_val = int(evaluate_expression(parts_raw[2], local_vars))
+            return -value
+        except TypeError:
+            return 0
+
+    def _eval_binop(self, node, local_vars):
+        return binary_op(node.op, self.evaluate(node.left, local_vars), self.evaluate(node.right, local_vars))
+
+    def _eval_compare(self, node, local_vars):
+        return compare_op(node.op, self.evaluate(node.left, local_vars), self.evaluate(node.right, local_vars))
+
+    def _eval_native(self, node, local_vars):
+        # Typed arithmetic sits in hot loops, so the operands skip the extra
+        # call through evaluate().
+        evaluators = self.evaluators
+        left = node.left
+        right = node.right
+        return node.func(evaluators[left.__class__](left, local_vars), evaluators[right.__class__](right, local_vars))
+
+    def _eval_boolop(self, node, local_vars):
+        evaluate = self.evaluate
+        if node.op == 'and':
+            return all(evaluate(value, local_vars) for value in node.values)
+        return any(evaluate(value, local_vars) for value in node.values)
+
+    def _eval_call(self, node, local_vars):
+        args = [self.evaluate(arg, local_vars) for arg in node.args]
+        return self.call_function(node.fname, args)
+
+    def _eval_list(self, node, local_vars):
+        return PyvaList([self.evaluate(item, local_vars) for item in node.items])
+
+    def _eval_map(self, node, local_vars):
+        result = PyvaMap()
+        for key, value in zip(node.keys, node.values):
+            key = self.evaluate(key, local_vars)
+            result[key] = self.evaluate(value, local_vars)
+        return result
+
+    def _eval_subscript(self, node, local_vars):
+        return self.evaluate(node.value, local_vars)[self.evaluate(node.index, local_vars)]
+
+    def _eval_slice(self, node, local_vars):
+        value = self.evaluate(node.value, local_vars)
+        start = None if node.start is None else self.evaluate(node.start, local_vars)
+        stop = None if node.stop is None else self.evaluate(node.stop, local_vars)
+        return value[start:stop]
+
+    def call_function(self, fname, args):
+        if fname in self.functions:
+            return self.execute_function(fname, args)
+        builtin = self.builtins.get(fname)
+        if builtin is None:
+            raise NameError(f"Function '{fname}' not defined")
+        return builtin(args)
+
+    # -- statements ----------------------------------------------------------------
+
+    def execute_statement(self, stmt, local_vars):
+        """Run a simple statement; returns a completion signal or None"""
+        try:
+            kind = stmt.__class__
+            if kind is AssignLocal:
+                local_vars[stmt.slot] = self.evaluate(stmt.value, local_vars)
+            elif kind is Assign:
+                local_vars[stmt.name] = self.evaluate(stmt.value, local_vars)
+            elif kind is AssignItem:
+                target = self.evaluate(stmt.target, local_vars)
+                index = self.evaluate(stmt.index, local_vars)
+                target[index] = self.evaluate(stmt.value, local_vars)
+            elif kind is ExprStmt:
+                self.evaluate(stmt.expr, local_vars)
+            elif kind is Return:
+                return ReturnSignal(None if stmt.value is None else self.evaluate(stmt.value, local_vars))
+            elif kind is Break:
+                return BREAK
+            elif kind is Continue:
+                return CONTINUE
             else:
-                raise ValueError("Range function accepts 1, 2, or 3 arguments")
-            for value in range(start_val, end_val, step_val):
-                local_vars[var_name] = value
-                try:
-                    execute_block(loop_body, local_vars)
-                except ReturnException:
-                    raise
-                except BreakException:
+                raise SyntaxError(f"Unexpected '{type(stmt).__name__}'")
+        except ExecutionAborted:
+            raise
+        except Exception as e:
+            self.report_error(e)
+        return None
+
+    def execute_if_block(self, node, local_vars):
+        for cond, block in node.branches:
+            if is_true(self.evaluate(cond, local_vars)):
+                return self.execute_block(block, local_vars)
+        if node.orelse is not None:
+            return self.execute_block(node.orelse, local_vars)
+        return None
+
+    def execute_while_loop(self, node, local_vars):
+        condition = node.cond
+        loop_body = node.body
+        while is_true(self.evaluate(condition, local_vars)):
+            signal = self.execute_block(loop_body, local_vars)
+            if signal is not None and signal is not CONTINUE:
+                if signal is BREAK:
                     break
-                except ContinueException:
-                    continue
-        elif loop_type == "list":
-            list_items = []
-            if list_expr.strip():
-                items = split_list_items(list_expr)
-                for item in items:
-                    item_value = evaluate_expression(item.strip(), local_vars)
-                    list_items.append(item_value)
-            for value in list_items:
-                local_vars[var_name] = value
-                try:
-                    execute_block(loop_body, local_vars)
-                except ReturnException:
-                    raise
-                except BreakException:
+                return signal
+        return None
+
+    def execute_do_while_loop(self, node, local_vars):
+        condition = node.cond
+        loop_body = node.body
+        while True:
+            signal = self.execute_block(loop_body, local_vars)
+            if signal is not None and signal is not CONTINUE:
+                if signal is BREAK:
                     break
-                except ContinueException:
-                    continue
-        elif loop_type == "variable":
-            if iterable_var in local_vars:
-                iterable = local_vars[iterable_var]
-            elif iterable_var in global_vars:
-                iterable = global_vars[iterable_var]
-            else:
-                raise NameError(f"Variable '{iterable_var}' not defined")
-            if isinstance(iterable, (list, tuple)):
-                iteration_values = iterable
-            elif isinstance(iterable, str):
-                iteration_values = list(iterable)
-            elif isinstance(iterable, range):
-                iteration_values = list(iterable)
+                return signal
+            if not is_true(self.evaluate(condition, local_vars)):
+                break
+        return None
+
+    def execute_for_loop(self, node, local_vars):
+        # Main block loops store by name, resolved function loops by slot.
+        target = node.var if node.slot is None else node.slot
+        loop_body = node.body
+        try:
+            if node.loop_type == "range":
+                bounds = [int(self.evaluate(arg, local_vars)) for arg in node.items]
+                if len(bounds) == 1:
+                    bounds.insert(0, 0)
+                iteration_values = range(*bounds)
+            elif node.loop_type == "list":
+                iteration_values = [self.evaluate(item, local_vars) for item in node.items]
             else:
+                # Lists, strings and ranges are iterated in place, not copied;
+                # maps give their keys.
+                iterable = self.lookup_iterable(node.items, local_vars)
                 try:
-                    iteration_values = list(iterable)
+                    iteration_values = iter(iterable)
                 except TypeError:
                     raise TypeError(f"'{type(iterable).__name__}' object is not iterable")
-            for value in iteration_values:
-                local_vars[var_name] = value
-                try:
-                    execute_block(loop_body, local_vars)
-                except ReturnException:
-                    raise
-                except BreakException:
+        except (ValueError, TypeError) as e:
+            raise SyntaxError(f"Error in for loop: {e}")
+        reduction = node.reduction
+        if reduction is not None:
+            results = reduction.run(self, iteration_values,
+                                    [self.evaluate(read, local_vars) for read in reduction.reads])
+            if results is not None:
+                for name, value in zip(reduction.targets, results):
+                    local_vars[name] = value
+                return None
+        for value in iteration_values:
+            local_vars[target] = value
+            signal = self.execute_block(loop_body, local_vars)
+            if signal is not None and signal is not CONTINUE:
+                if signal is BREAK:
                     break
-                except ContinueException:
-                    continue
-    except (ValueError, TypeError) as e:
-        raise SyntaxError(f"Error in for loop: {e}")
-    return i - 1
-
-def split_range_args(range_expr):
-    args = []
-    current = ''
-    depth = 0
-    for c in range_expr:
-        if c == '(':
-            depth += 1
-            current += c
-        elif c == ')':
-            depth -= 1
-            current += c
-        elif c == ',' and depth == 0:
-            args.append(current.strip())
-            current = ''
-        else:
-            current += c
-    if current.strip():
-        args.append(current.strip())
-    return args
-
-def split_list_items(list_expr):
-    items = []
-    current = ''
-    depth = 0
-    in_string = False
-    i = 0
-    while i < len(list_expr):
-        c = list_expr[i]
-        if c == '"':
-            in_string = not in_string
-            current += c
-        elif c == '[' and not in_string:
-            depth += 1
-            current += c
-        elif c == ']' and not in_string:
-            depth -= 1
-            current += c
-        elif c == ',' and depth == 0 and not in_string:
-            items.append(current.strip())
-            current = ''
-        else:
-            current += c
-        i += 1
-    if current.strip():
-        items.append(current.strip())
-    return items
+                return signal
+        return None
 
-def execute_block(lines, local_vars):
-    i = 0
-    while i < len(lines):
-        line = lines[i].strip()
-        if not line:
-            i += 1
-            continue
-        if line.startswith("if "):
-            i = execute_if_block(lines, i, local_vars)
-        elif line.startswith("while "):
-            i = execute_while_loop(lines, i, local_vars)
-        elif line.startswith("for "):
-            i = execute_for_loop(lines, i, local_vars)
-        elif line == "do:":
-            i = execute_do_while_loop(lines, i, local_vars)
+    def lookup_iterable(self, items, local_vars):
+        """Value named by a 'for x in name' loop: a name, or a LocalName or GlobalName once resolved"""
+        kind = items.__class__
+        if kind is LocalName:
+            value = local_vars[items.slot]
+            if value is not UNBOUND:
+                return value
+            name = items.name
+        elif kind is GlobalName:
+            name = items.name
         else:
-            execute_statement(line, local_vars)
-        i += 1
+            name = items
+            if name in local_vars:
+                return local_vars[name]
+        if name in self.global_vars:
+            return self.global_vars[name]
+        raise NameError(f"Variable '{name}' not defined")
 
-def execute_function(fname, args):
-    if fname not in functions:
-        raise NameError(f"Function '{fname}' not defined")
-    params, body, return_type = functions[fname]
-    if len(params) != len(args):
-        raise ValueError(f"Function '{fname}' expects {len(params)} arguments, got {len(args)}")
-    local_vars = {}
-    for i, (param_name, param_type) in enumerate(params):
-        try:
-            if param_type == int:
-                if isinstance(args[i], str) and args[i].lstrip('-').replace('.', '').isdigit():
-                    local_vars[param_name] = int(float(args[i]))
-                else:
-                    local_vars[param_name] = int(args[i])
-            elif param_type == float:
-                local_vars[param_name] = float(args[i])
-            elif param_type == bool:
-                if isinstance(args[i], str):
-                    local_vars[param_name] = args[i].lower() in ['true', '1', 'yes', 'y']
-                else:
-                    local_vars[param_name] = bool(args[i])
+    def execute_block(self, stmts, local_vars):
+        """Run a block; returns the first completion signal raised by a statement, or None"""
+        self.steps += len(stmts) or 1
+        if self.steps >= self.next_check:
+            self.check_budget()
+        for stmt in stmts:
+            kind = stmt.__class__
+            if kind is If:
+                signal = self.execute_if_block(stmt, local_vars)
+            elif kind is While:
+                signal = self.execute_while_loop(stmt, local_vars)
+            elif kind is For:
+                signal = self.execute_for_loop(stmt, local_vars)
+            elif kind is DoWhile:
+                signal = self.execute_do_while_loop(stmt, local_vars)
             else:
-                local_vars[param_name] = str(args[i])
-        except (ValueError, TypeError):
-            local_vars[param_name] = args[i]
-    try:
-        execute_block(body, local_vars)
+                signal = self.execute_statement(stmt, local_vars)
+            if signal is not None:
+                return signal
         return None
-    except ReturnException as e:
-        return e.value
-
-def run_program(source_code):
-    global functions, global_vars
-    functions.clear()
-    global_vars.clear()
-    lines = source_code.strip().split('\n')
-    lines = [line.rstrip() for line in lines]
 
-    # Parse function definitions
-    i = 0
-    main_block_lines = []
-    in_main_block = False
-    main_block_indent = None
+    def execute_function(self, fname, args):
+        function = self.resolved.get(fname)
+        if function is None:
+            # Functions registered without a Program (load() and the
+            # module-level API) are resolved on their first call.
+            if fname not in self.functions:
+                raise NameError(f"Function '{fname}' not defined")
+            import pyva_resolve
+            params, body, return_type = self.functions[fname]
+            function = self.resolved[fname] = pyva_resolve.resolve_function(params, body, return_type)
+        params = function.params
+        if len(params) != len(args):
+            raise ValueError(f"Function '{fname}' expects {len(params)} arguments, got {len(args)}")
+        frame = [UNBOUND] * function.nlocals
+        typed = True
+        for index, ((_, param_type), arg) in enumerate(zip(params, args)):
+            value = coerce_argument(arg, param_type)
+            if type(value) is not param_type:
+                typed = False
+            frame[index] = value
+        body = function.specialized if typed and function.specialized is not None else function.body
+        if fname in self.memoized:
+            return self.call_memoized(fname, frame[:len(params)], self.run_body, body, frame)
+        return self.run_body(body, frame)
 
-    while i < len(lines):
-        line = lines[i].strip()
-        if line.startswith("def "):
-            j = i + 1
-            while j < len(lines) and (lines[j].startswith("    ") or lines[j].startswith("\t") or lines[j].strip() == ""):
-                j += 1
-            func_lines = lines[i:j]
-            parse_function(func_lines)
-            i = j
-        elif line.startswith("main"):
-            # Detect main block start: e.g. main { or main{
-            m = re.match(r'main\s*\{', line)
-            if m:
-                in_main_block = True
-                main_block_lines = []
-                i += 1
-                # collect main block lines until matching closing '}'
-                brace_count = 1
-                while i < len(lines) and brace_count > 0:
-                    cur_line = lines[i]
-                    # count braces to find block end
-                    brace_count += cur_line.count('{')
-                    brace_count -= cur_line.count('}')
-                    if brace_count > 0:
-                        main_block_lines.append(cur_line.strip())
-                    i += 1
-                continue
-            else:
-                i += 1
-        else:
-            i += 1
+    def run_body(self, body, frame):
+        signal = self.execute_block(body, frame)
+        if signal is None:
+            return None
+        return signal.value
 
-    # Execute main block
-    if main_block_lines:
+    def call_memoized(self, fname, args, func, *func_args):
+        """Return func(*func_args), reusing the result of an earlier call of fname with the same coerced args.
+
+        A call that reported an error is not cached, so the error shows up
+        again the next time.
+        """
         try:
-            execute_block(main_block_lines, global_vars)
-        except ReturnException as e:
-            return e.value
+            key = memo_key(fname, args)
+            value = self.memo.get(key, UNBOUND)
+        except TypeError:
+            return func(*func_args)
+        if value is UNBOUND:
+            errors = self.errors
+            value = func(*func_args)
+            if self.errors == errors:
+                self.memo.put(key, value)
+        return value
+
+# The module-level API below drives a shared default interpreter, as the
+# original single-program interpreter did; servers should create their own
+# Interpreter per request instead.
+_default_interpreter = Interpreter()
+functions = _default_interpreter.functions
+global_vars = _default_interpreter.global_vars
+
+def evaluate_expression(expr, local_vars):
+    """Parse and evaluate an expression given as source text"""
+    expr = expr.strip()
+    if not expr:
+        return None
+    return _default_interpreter.evaluate(parse_expression(expr), local_vars)
+
+def execute_function(fname, args):
+    return _default_interpreter.execute_function(fname, args)
+
+def run_program(source_code, engine='tree', max_steps=DEFAULT_MAX_STEPS, timeout=None):
+    return _default_interpreter.run(source_code, engine, max_steps, timeout)
+
+def run_batch(source_code, inputs_list, engine='tree', max_steps=DEFAULT_MAX_STEPS, timeout=None):
+    return _default_interpreter.run_batch(source_code, inputs_list, engine, max_steps, timeout)
 
-    return None
+def transpile(source_code, optimize=True):
+    """Translate a PyVa program into equivalent Python source code"""
+    import pyva_transpile
+    return pyva_transpile.transpile(source_code, optimize)
 
-def interpret_file(filename):
+def interpret_file(filename, engine='tree', max_steps=DEFAULT_MAX_STEPS, timeout=None, interpreter=None,
+                   cache=True):
+    """Run a program file on interpreter (the default one if None) and return its source, None if unreadable.
+
+    With cache, the parsed and compiled program is kept in a .pyvac file
+    (see pyva_cache.load_program_file), so unchanged files skip the parse.
+    """
+    source_code = None
+    if interpreter is None:
+        interpreter = _default_interpreter
     try:
         with open(filename, 'r') as file:
             source_code = file.read()
-        result = run_program(source_code)
+        check_engine(engine)
+        if cache:
+            import pyva_cache
+            program = pyva_cache.load_program_file(filename, source_code, engine, interpreter.optimize)
+        else:
+            program = Program(source_code, interpreter.optimize)
+        result = interpreter.execute(program, engine, max_steps, timeout)
         if result is not None:
             print(f"Program returned: {result}")
     except FileNotFoundError:
         print(f"Error: File '{filename}' not found")
     except Exception as e:
         print(f"Error: {e}")
+    return source_code
 
 def interactive_mode():
     print("Enhanced Compiler Interactive Mode")
@@ -809,22 +1680,90 @@ def interactive_mode():
         except Exception as e:
             print(f"Error: {e}")
 
-if __name__ == "__main__":
-    import sys
-    if len(sys.argv) > 1:
-        if sys.argv[1] == "--test":
-            # Place for test calls if any
-            pass
-        elif sys.argv[1] == "--interactive":
-            interactive_mode()
-        else:
-            interpret_file(sys.argv[1])
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(prog='pyva_compiler.py', add_help=False)
+    parser.add_argument('filename', nargs='?')
+    parser.add_argument('--interactive', action='store_true')
+    parser.add_argument('--test', action='store_true')
+    parser.add_argument('--engine', '--backend', dest='engine', choices=ENGINES, default='tree')
+    parser.add_argument('--transpile', action='store_true')
+    parser.add_argument('--no-optimize', dest='optimize', action='store_false')
+    parser.add_argument('--no-cache', dest='cache', action='store_false')
+    parser.add_argument('--max-steps', type=int, default=DEFAULT_MAX_STEPS)
+    parser.add_argument('--timeout', type=float)
+    parser.add_argument('--memo-size', type=int, default=DEFAULT_MEMO_SIZE)
+    parser.add_argument('--memo-stats', action='store_true')
+    parser.add_argument('--profile', action='store_true')
+    parser.add_argument('--profile-json')
+    parser.add_argument('--sample')
+    parser.add_argument('--sample-interval', type=float)
+    parser.add_argument('-h', '--help', action='store_true')
+    args = parser.parse_args(argv)
+    _default_interpreter.optimize = args.optimize
+    _default_interpreter.memo.max_entries = args.memo_size
+    if args.test:
+        # Place for test calls if any
+        pass
+    elif args.interactive:
+        interactive_mode()
+    elif args.filename and args.transpile:
+        with open(args.filename, 'r') as file:
+            print(transpile(file.read(), args.optimize), end='')
+    elif args.filename and not args.help:
+        interpreter = _default_interpreter
+        if args.profile or args.profile_json:
+            import pyva_profile
+            interpreter = pyva_profile.ProfilingInterpreter(optimize=args.optimize, memo_size=args.memo_size)
+        sampler = None
+        if args.sample:
+            import pyva_profile
+            sampler = pyva_profile.Sampler(args.sample_interval or pyva_profile.DEFAULT_SAMPLE_INTERVAL)
+            sampler.start()
+        source_code = interpret_file(args.filename, args.engine, args.max_steps or None, args.timeout, interpreter,
+                                     args.cache)
+        if sampler is not None:
+            sampler.stop()
+            with open(args.sample, 'w') as file:
+                file.write(sampler.collapsed())
+            print(f"Wrote {sampler.samples} samples to {args.sample}", file=sys.stderr)
+        if interpreter is not _default_interpreter:
+            if args.profile:
+                print(interpreter.report(source_code), file=sys.stderr)
+            if args.profile_json:
+                import json
+                with open(args.profile_json, 'w') as file:
+                    json.dump(interpreter.as_dict(source_code), file, indent=2)
+        if args.memo_stats:
+            stats = interpreter.memo.stats()
+            print(f"Memo cache: {stats['hits']} hits, {stats['misses']} misses, "
+                  f"{stats['evictions']} evictions, {stats['entries']} entries", file=sys.stderr)
     else:
         print("Enhanced Compiler Usage:")
         print("  python pyva_compiler.py <filename>     - Run a program file")
         print("  python pyva_compiler.py --interactive   - Interactive mode")
+        print("\nOptions:")
+        print("  --engine=tree|vm|python - Execution engine (default: tree walking interpreter)")
+        print("  --backend=python        - Same as --engine, compiles to Python via compile()/exec")
+        print("  --transpile             - Print the Python translation instead of running")
+        print("  --no-optimize           - Skip constant folding, dead-branch removal, hoisting, loop reductions")
+        print("                            and string builders")
+        print("  --no-cache              - Parse the file afresh instead of using its cached form in")
+        print("                            __pycache__/<name>.pyvac, and leave that file alone")
+        print(f"  --max-steps=N           - Stop after N executed statements (default: {DEFAULT_MAX_STEPS}, 0: no limit)")
+        print("  --timeout=SECONDS       - Stop the program after this much wall-clock time")
+        print(f"  --memo-size=N           - Results kept for memoized functions (default: {DEFAULT_MEMO_SIZE}, 0: off)")
+        print("  --memo-stats            - Print memo cache hits and misses to stderr after the run")
+        print("  --profile               - Print time and hits per line and per function to stderr after the run")
+        print("                            (runs on the tree engine)")
+        print("  --profile-json=FILE     - Write that profile to FILE as JSON")
+        print("  --sample=FILE           - Sample the PyVa call stack while the program runs and write")
+        print("                            the stacks to FILE in collapsed format, for flame graphs")
+        print("  --sample-interval=SECS  - Time between samples (default: 0.005)")
         print("\nSupported Features:")
         print("  - Functions with type annotations")
+        print("  - Memoized pure functions; '@memo' before 'def' forces it")
+        print("  - Deep recursion and tail calls with --engine=vm")
         print("  - While loops")
         print("  - Do-while loops")
         print("  - For loops (range, list, variable)")
@@ -832,5 +1771,13 @@ if __name__ == "__main__":
         print("  - Break and continue statements")
         print("  - Nested loops and functions")
         print("  - Variable assignments and expressions")
-        print("  - Built-in functions: print, input, int, float, str, bool")
+        print("  - Lists: [1, 2, 3], xs[i], xs[i] = v, xs[a:b], 'list' parameters")
+        print("  - Maps: {\"a\": 1}, m[k], m[k] = v, for k in m, 'map' parameters")
+        print("  - Built-in functions: print, input, int, float, str, bool, len, append, range,")
+        print("    get, set, contains, keys, values")
 
+if __name__ == "__main__":
+    # Run through the importable module so helper modules such as pyva_vm
+    # share the same AST classes and interpreter state.
+    import pyva_compiler
+    pyva_compiler.main()
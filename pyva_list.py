@@ -0,0 +1,102 @@
+"""PyVa list values, stored compactly in an array.array while they hold only ints or only floats"""
+from array import array
+
+# Items of these exact types share an array typecode; bools stay out since
+# an int array would hand them back as ints.
+TYPECODES = {int: 'q', float: 'd'}
+ITEM_TYPES = {'q': int, 'd': float}
+
+def pack(items):
+    """Storage for a list of items: a typed array when they allow one, else a Python list"""
+    items = list(items)
+    if items:
+        item_type = type(items[0])
+        typecode = TYPECODES.get(item_type)
+        if typecode is not None and all(type(item) is item_type for item in items):
+            try:
+                return array(typecode, items)
+            except OverflowError:
+                pass
+    return items
+
+class PyvaList:
+    """A mutable PyVa list.
+
+    items is an array.array for lists of ints that fit in 64 bits or of
+    floats, and a Python list otherwise; storing anything else turns an
+    array into a list for good. Lists compare equal item by item and are
+    unhashable, so memoized calls taking them are never cached.
+    """
+    __slots__ = ('items',)
+
+    def __init__(self, items=()):
+        self.items = pack(items)
+
+    @classmethod
+    def wrap(cls, items):
+        """A list around storage pack() already produced, such as a slice of another list's"""
+        value = cls.__new__(cls)
+        value.items = items
+        return value
+
+    def _widen(self):
+        items = self.items
+        if items.__class__ is array:
+            items = self.items = items.tolist()
+        return items
+
+    def append(self, value):
+        items = self.items
+        if items.__class__ is array:
+            if type(value) is ITEM_TYPES[items.typecode]:
+                try:
+                    items.append(value)
+                    return
+                except OverflowError:
+                    pass
+        elif not items:
+            self.items = pack([value])
+            return
+        self._widen().append(value)
+
+    def __getitem__(self, index):
+        if index.__class__ is slice:
+            return PyvaList.wrap(self.items[index])
+        return self.items[index]
+
+    def __setitem__(self, index, value):
+        items = self.items
+        if items.__class__ is array and type(value) is ITEM_TYPES[items.typecode]:
+            try:
+                items[index] = value
+                return
+            except OverflowError:
+                pass
+        self._widen()[index] = value
+
+    def __len__(self):
+        return len(self.items)
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __add__(self, other):
+        if other.__class__ is not PyvaList:
+            return NotImplemented
+        left = self.items
+        right = other.items
+        if left.__class__ is array and right.__class__ is array and left.typecode == right.typecode:
+            return PyvaList.wrap(left + right)
+        return PyvaList(list(left) + list(right))
+
+    def __eq__(self, other):
+        if other.__class__ is not PyvaList:
+            return NotImplemented
+        return len(self.items) == len(other.items) and all(a == b for a, b in zip(self.items, other.items))
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self.items))
+
+    __str__ = __repr__
@@ -0,0 +1,16 @@
+"""PyVa hash maps, a dict whose for-loops may change it"""
+
+class PyvaMap(dict):
+    """A mutable PyVa map from int, float, str or bool keys to any values.
+
+    Iterating gives the keys over a snapshot taken when the loop starts,
+    so a loop body may set and add entries. Looking up a missing key is an
+    error; get() gives a default instead.
+    """
+    __slots__ = ()
+
+    def __missing__(self, key):
+        raise LookupError(f"Key {key!r} not found")
+
+    def __iter__(self):
+        return iter(list(dict.keys(self)))
@@ -0,0 +1,63 @@
+"""Purity analysis choosing which PyVa functions get their calls memoized"""
+from pyva_compiler import While, DoWhile, For, BUILTINS, walk_statements
+from pyva_optimize import calls, statement_exprs
+from pyva_types import TypeInference
+
+class _ReadScan(TypeInference):
+    # Only which names are read before they are assigned matters here. A
+    # failing assignment reports an error, and calls that report errors
+    # are never cached.
+    def may_raise(self, node, types):
+        return False
+
+def pure_functions(functions):
+    """Names of the functions whose result depends only on their arguments.
+
+    A pure function never calls print or input, reads no global (reading a
+    local before its first assignment falls back to a global) and only
+    calls builtins and other pure functions. Functions cannot assign
+    globals at all.
+    """
+    scan = _ReadScan(functions)
+    called = {}
+    pure = set()
+    for fname, (params, body, return_type) in functions.items():
+        found = set()
+        scan.scan(body, {name for name, _ in params}, {}, found)
+        if found:
+            continue
+        names = set()
+        for stmt in walk_statements(body):
+            for node in statement_exprs(stmt):
+                names |= calls(node)
+        if any(name not in functions and name not in BUILTINS for name in names):
+            continue
+        called[fname] = {name for name in names if name in functions}
+        pure.add(fname)
+    # Drop functions calling impure ones until nothing changes; recursion
+    # among pure functions keeps them pure.
+    changed = True
+    while changed:
+        changed = False
+        for fname in list(pure):
+            if not called[fname] <= pure:
+                pure.discard(fname)
+                changed = True
+    return pure
+
+def memoized_functions(functions, annotated=()):
+    """Functions to memoize: those annotated with @memo, and pure functions that call functions or loop.
+
+    Pure leaf functions without loops cost about as much to run as a cache
+    lookup, so they are not memoized unless annotated.
+    """
+    chosen = set(annotated)
+    for fname in pure_functions(functions):
+        body = functions[fname][1]
+        for stmt in walk_statements(body):
+            kind = stmt.__class__
+            if kind is While or kind is DoWhile or kind is For or \
+                    any(calls(node) & functions.keys() for node in statement_exprs(stmt)):
+                chosen.add(fname)
+                break
+    return frozenset(chosen)
@@ -0,0 +1,139 @@
+"""In-process counters, gauges and histograms, exposed in the Prometheus text format"""
+import math
+import threading
+
+# Seconds, from sub-millisecond parses up to the longest allowed runs.
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+def format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+def format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Metric:
+    """A named metric with one series per combination of label values"""
+    kind = None
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labels):
+            raise ValueError(f"Metric {self.name} takes labels {', '.join(self.labels) or 'none'}")
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self):
+        """(suffix, label values, extra label pairs, value) for every series"""
+        raise NotImplementedError
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, values, extra, value in self.samples():
+            out.append(f"{self.name}{suffix}{format_labels(self.labels, values, extra)} {format_value(value)}")
+        return '\n'.join(out)
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = self._series.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Copy in a total counted elsewhere, from a collector"""
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def value(self, **labels):
+        with self._lock:
+            return self._series.get(self._key(labels), 0)
+
+    def samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._series.items())]
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._series[key] = value
+
+    def samples(self):
+        with self._lock:
+            return [('', key, (), value) for key, value in sorted(self._series.items())]
+
+class Histogram(Metric):
+    """Counts observations into cumulative buckets with upper bounds, plus their sum and count"""
+    kind = 'histogram'
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                # Per-bucket counts, then the sum.
+                series = self._series[key] = [0] * len(self.buckets) + [0.0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-1] += value
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                count = 0
+                for bound, hits in zip(self.buckets, series):
+                    count += hits
+                    out.append(('_bucket', key, (('le', format_value(bound)),), count))
+                out.append(('_sum', key, (), series[-1]))
+                out.append(('_count', key, (), count))
+        return out
+
+class Registry:
+    """The metrics of one process; collectors are called to refresh gauges before every render"""
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help_text, labels=()):
+        return self.register(Counter(name, help_text, labels))
+
+    def gauge(self, name, help_text, labels=()):
+        return self.register(Gauge(name, help_text, labels))
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def render(self):
+        for collect in self.collectors:
+            collect()
+        return ''.join(metric.render() + '\n' for metric in self.metrics)
@@ -0,0 +1,594 @@
+"""Optimizer pass over the block tree: constant folding, dead branches, loop-invariant hoisting, loop reductions, string builders"""
+from pyva_compiler import (
+    Const, Name, UnaryOp, BinOp, Compare, BoolOp, Call, NativeBinOp, NativeCompare, List, Map, Subscript, Slice,
+    Assign, AssignItem, ExprStmt, Return, If, While, DoWhile, For,
+    BUILTINS, MUTATING_BUILTINS, binary_op, compare_op, is_true, walk_statements,
+)
+from collections import Counter
+
+from pyva_reduce import MAX_DEGREE, Reduction, degree, is_integer_term
+
+# Folding never builds constants bigger than this (string length or int bits),
+# so '"ab" * 1000000' stays a runtime computation.
+MAX_FOLDED_SIZE = 4096
+
+COMPOUND_EXPRS = (BinOp, Compare, UnaryOp, BoolOp)
+
+# Substituting the names a loop body assigns into later terms stops at
+# terms of this many nodes.
+MAX_TERM_SIZE = 64
+
+def _small_enough(op, left, right):
+    if op != '*':
+        return True
+    for value, count in ((left, right), (right, left)):
+        if isinstance(value, str) and isinstance(count, int) and len(value) * count > MAX_FOLDED_SIZE:
+            return False
+    if type(left) is int and type(right) is int:
+        return left.bit_length() + right.bit_length() <= MAX_FOLDED_SIZE
+    return True
+
+def _is_const(node):
+    return node.__class__ is Const
+
+def _like(new, old):
+    """Give a rebuilt statement the position of the one it replaces"""
+    new.indent = old.indent
+    new.lineno = old.lineno
+    return new
+
+def _signed_terms(node, sign=1):
+    """The operands of a chain of + and -, each with the sign it is added with"""
+    if (node.__class__ is BinOp or node.__class__ is NativeBinOp) and (node.op == '+' or node.op == '-'):
+        return _signed_terms(node.left, sign) + _signed_terms(node.right, sign if node.op == '+' else -sign)
+    return [(sign, node)]
+
+def _concat_terms(node):
+    """The operands of a chain of '+' down its left side: s + a + b gives [s, a, b]"""
+    terms = []
+    while node.__class__ is BinOp and node.op == '+':
+        terms.append(node.right)
+        node = node.left
+    terms.append(node)
+    terms.reverse()
+    return terms
+
+def _is_text(node, functions):
+    """Whether an expression always evaluates to a string"""
+    kind = node.__class__
+    if kind is Const:
+        return node.value.__class__ is str
+    if kind is Call:
+        return node.fname == 'str' and 'str' not in functions
+    if kind is BinOp and node.op == '+':
+        return _is_text(node.left, functions) or _is_text(node.right, functions)
+    return False
+
+def _count_reads(node, counts):
+    """Add the names an expression reads to counts; returns the node"""
+    if node.__class__ is Name:
+        counts[node.name] += 1
+        return node
+    return map_expr(node, lambda child: _count_reads(child, counts))
+
+def _term_nodes(node):
+    """All nodes of an integer term (see pyva_reduce.is_integer_term)"""
+    kind = node.__class__
+    if kind is UnaryOp:
+        return [node] + _term_nodes(node.operand)
+    if kind is Const or kind is Name:
+        return [node]
+    return [node] + _term_nodes(node.left) + _term_nodes(node.right)
+
+def _noop(stmt):
+    # Keeps an emptied loop body non-empty, so every iteration still
+    # charges a step to the budget.
+    return _like(ExprStmt(Const(None)), stmt)
+
+def map_expr(node, func):
+    """Rebuild an expression with func applied to each child"""
+    kind = node.__class__
+    if kind is BinOp or kind is Compare or kind is NativeBinOp or kind is NativeCompare:
+        return kind(node.op, func(node.left), func(node.right))
+    if kind is UnaryOp:
+        return UnaryOp(node.op, func(node.operand))
+    if kind is BoolOp:
+        return BoolOp(node.op, [func(value) for value in node.values])
+    if kind is Call:
+        return Call(node.fname, [func(arg) for arg in node.args])
+    if kind is List:
+        return List([func(item) for item in node.items])
+    if kind is Map:
+        return Map([func(key) for key in node.keys], [func(value) for value in node.values])
+    if kind is Subscript:
+        return Subscript(func(node.value), func(node.index))
+    if kind is Slice:
+        return Slice(func(node.value), None if node.start is None else func(node.start),
+                     None if node.stop is None else func(node.stop))
+    return node
+
+def map_block(stmts, func):
+    """Rebuild a block tree with func applied to every expression it contains"""
+    return [map_statement(stmt, func) for stmt in stmts]
+
+def map_statement(stmt, func):
+    kind = stmt.__class__
+    if kind is Assign:
+        new = Assign(stmt.name, func(stmt.value))
+    elif kind is AssignItem:
+        new = AssignItem(func(stmt.target), func(stmt.index), func(stmt.value))
+    elif kind is ExprStmt:
+        new = ExprStmt(func(stmt.expr))
+    elif kind is Return:
+        new = Return(None if stmt.value is None else func(stmt.value))
+    elif kind is If:
+        orelse = None if stmt.orelse is None else map_block(stmt.orelse, func)
+        new = If([(func(cond), map_block(block, func)) for cond, block in stmt.branches], orelse)
+    elif kind is While:
+        new = While(func(stmt.cond), map_block(stmt.body, func))
+    elif kind is DoWhile:
+        new = DoWhile(map_block(stmt.body, func), func(stmt.cond))
+    elif kind is For:
+        items = stmt.items if stmt.loop_type == 'variable' else [func(item) for item in stmt.items]
+        reduction = stmt.reduction
+        if reduction is not None:
+            reduction = reduction.resolved([func(read) for read in reduction.reads], reduction.targets)
+        new = For(stmt.var, stmt.loop_type, items, map_block(stmt.body, func), reduction=reduction)
+    else:
+        return stmt
+    return _like(new, stmt)
+
+def calls(node):
+    """Names of the functions an expression calls"""
+    kind = node.__class__
+    if kind is Call:
+        names = {node.fname}
+        for arg in node.args:
+            names |= calls(arg)
+        return names
+    if kind is BinOp or kind is Compare or kind is NativeBinOp or kind is NativeCompare:
+        return calls(node.left) | calls(node.right)
+    if kind is UnaryOp:
+        return calls(node.operand)
+    if kind is BoolOp or kind is List:
+        names = set()
+        for value in (node.values if kind is BoolOp else node.items):
+            names |= calls(value)
+        return names
+    if kind is Map:
+        names = set()
+        for child in node.keys + node.values:
+            names |= calls(child)
+        return names
+    if kind is Subscript:
+        return calls(node.value) | calls(node.index)
+    if kind is Slice:
+        names = calls(node.value)
+        for bound in (node.start, node.stop):
+            if bound is not None:
+                names |= calls(bound)
+        return names
+    return set()
+
+def statement_exprs(stmt):
+    """The expressions a statement evaluates itself, not those of nested blocks"""
+    kind = stmt.__class__
+    if kind is Assign or kind is Return:
+        if stmt.value is not None:
+            yield stmt.value
+    elif kind is AssignItem:
+        yield stmt.target
+        yield stmt.index
+        yield stmt.value
+    elif kind is ExprStmt:
+        yield stmt.expr
+    elif kind is If:
+        for cond, _ in stmt.branches:
+            yield cond
+    elif kind is While or kind is DoWhile:
+        yield stmt.cond
+    elif kind is For and stmt.loop_type != 'variable':
+        yield from stmt.items
+
+def mutating_functions(functions):
+    """Names of the functions that may change a list or map in place, directly or through the functions they call"""
+    called = {}
+    mutating = set()
+    for fname, (params, body, return_type) in functions.items():
+        names = set()
+        for stmt in walk_statements(body):
+            if stmt.__class__ is AssignItem:
+                mutating.add(fname)
+            for node in statement_exprs(stmt):
+                names |= calls(node)
+        if (names & MUTATING_BUILTINS) - functions.keys():
+            mutating.add(fname)
+        called[fname] = names & functions.keys()
+    changed = True
+    while changed:
+        changed = False
+        for fname, names in called.items():
+            if fname not in mutating and names & mutating:
+                mutating.add(fname)
+                changed = True
+    return mutating
+
+def global_reads(functions):
+    """Names each function may read from the globals, itself or through the functions it calls.
+
+    Any name a function reads counts, as reading a local before its first
+    assignment falls back to the global.
+    """
+    reads = {}
+    called = {}
+    for fname, (params, body, return_type) in functions.items():
+        counts = Counter()
+        names = set()
+        for stmt in walk_statements(body):
+            if stmt.__class__ is For and stmt.loop_type == 'variable':
+                counts[stmt.items] += 1
+            for node in statement_exprs(stmt):
+                _count_reads(node, counts)
+                names |= calls(node)
+        reads[fname] = set(counts)
+        called[fname] = names & functions.keys()
+    changed = True
+    while changed:
+        changed = False
+        for fname, names in called.items():
+            for callee in names:
+                if not reads[callee] <= reads[fname]:
+                    reads[fname] |= reads[callee]
+                    changed = True
+    return reads
+
+class Optimizer:
+    """Rewrite a program's block trees; the input trees are left untouched"""
+
+    def __init__(self, functions):
+        self.functions = functions
+        self.mutating = mutating_functions(functions)
+        self.temp_count = 0
+
+    # -- constant folding ------------------------------------------------------
+
+    def fold(self, node):
+        """Fold constant sub-expressions using the same helpers the engines run"""
+        node = map_expr(node, self.fold)
+        kind = node.__class__
+        if kind is BinOp or kind is Compare:
+            if _is_const(node.left) and _is_const(node.right) and \
+                    (kind is Compare or _small_enough(node.op, node.left.value, node.right.value)):
+                operation = binary_op if kind is BinOp else compare_op
+                try:
+                    return Const(operation(node.op, node.left.value, node.right.value))
+                except Exception:
+                    # Left for the engines to report when the statement runs.
+                    return node
+        elif kind is UnaryOp:
+            if _is_const(node.operand):
+                value = node.operand.value
+                if node.op == 'not':
+                    return Const(not value)
+                try:
+                    return Const(-value)
+                except TypeError:
+                    return Const(0)
+        elif kind is BoolOp:
+            return self.fold_boolop(node)
+        elif kind is Call:
+            if node.fname in BUILTINS and node.fname not in self.functions and all(map(_is_const, node.args)):
+                try:
+                    value = BUILTINS[node.fname]([arg.value for arg in node.args])
+                except Exception:
+                    # Left for the engines to report when the call runs.
+                    return node
+                if not isinstance(value, str) or len(value) <= MAX_FOLDED_SIZE:
+                    return Const(value)
+        return node
+
+    def fold_boolop(self, node):
+        # 'and'/'or' evaluate to a bool of Python truthiness; constants that
+        # cannot change the result are dropped, one that decides it ends the list.
+        deciding = node.op == 'or'
+        values = []
+        for value in node.values:
+            if _is_const(value):
+                if bool(value.value) != deciding:
+                    continue
+                if not values:
+                    return Const(deciding)
+                values.append(Const(deciding))
+                break
+            values.append(value)
+        if not values:
+            return Const(not deciding)
+        return BoolOp(node.op, values)
+
+    # -- statements --------------------------------------------------------------
+
+    def block(self, stmts):
+        result = []
+        for stmt in stmts:
+            result.extend(self.statement(stmt))
+        return result
+
+    def loop_body(self, stmts, loop):
+        return self.block(stmts) or [_noop(loop)]
+
+    def statement(self, stmt):
+        """Optimized replacement for one statement, as a list of statements"""
+        kind = stmt.__class__
+        if kind is Assign or kind is AssignItem or kind is ExprStmt or kind is Return:
+            return [map_statement(stmt, self.fold)]
+        if kind is If:
+            return self.if_statement(stmt)
+        if kind is While:
+            cond = self.fold(stmt.cond)
+            if _is_const(cond) and not is_true(cond.value):
+                return []
+            loop = _like(While(cond, self.loop_body(stmt.body, stmt)), stmt)
+        elif kind is DoWhile:
+            loop = _like(DoWhile(self.loop_body(stmt.body, stmt), self.fold(stmt.cond)), stmt)
+        elif kind is For:
+            items = stmt.items if stmt.loop_type == 'variable' else [self.fold(item) for item in stmt.items]
+            loop = _like(For(stmt.var, stmt.loop_type, items, self.loop_body(stmt.body, stmt)), stmt)
+        else:
+            return [stmt]
+        stmts = self.hoist(loop)
+        if kind is For and loop.loop_type == 'range':
+            stmts[-1].reduction = self.reduction(stmts[-1])
+        return stmts
+
+    def if_statement(self, stmt):
+        branches = []
+        orelse = stmt.orelse
+        for cond, block in stmt.branches:
+            cond = self.fold(cond)
+            if _is_const(cond):
+                if not is_true(cond.value):
+                    continue
+                # Always taken: it acts as the else and later branches are dead.
+                orelse = block
+                break
+            branches.append((cond, self.block(block)))
+        if orelse is not None:
+            orelse = self.block(orelse)
+        if not branches:
+            return orelse or []
+        return [_like(If(branches, orelse), stmt)]
+
+    # -- loop-invariant hoisting -------------------------------------------------
+
+    def hoist(self, loop):
+        """Move invariant sub-expressions of a loop into temporaries assigned just before it.
+
+        An expression is invariant when it has no calls and reads no name the
+        loop assigns. Functions cannot assign globals, so nothing else can
+        change those names while the loop runs. The temporaries are assigned
+        even when the loop body never runs, so only expressions that cannot
+        raise for any operand types are hoisted: no comparisons, which fail
+        on strings such as "1.2.3", and no '+' or '-', which overflow mixing
+        a huge int with a float (and '+' may build a new list, which every
+        evaluation must make its own). Loops that may change a list or map
+        in place are left alone.
+        """
+        assigned = set()
+        for stmt in walk_statements([loop]):
+            if stmt.__class__ is Assign:
+                assigned.add(stmt.name)
+            elif stmt.__class__ is For:
+                assigned.add(stmt.var)
+            elif stmt.__class__ is AssignItem:
+                return [loop]
+            for node in statement_exprs(stmt):
+                names = calls(node)
+                if names & self.mutating or (names & MUTATING_BUILTINS) - self.functions.keys():
+                    return [loop]
+        temps = {}
+
+        def invariant(node):
+            kind = node.__class__
+            if kind is Call or kind is List or kind is Map or kind is Subscript or kind is Slice or kind is Compare:
+                return False
+            if kind is BinOp and (node.op == '+' or node.op == '-'):
+                return False
+            if kind is Name:
+                return node.name not in assigned
+            if kind is Const:
+                return True
+            if kind is BoolOp:
+                return all(invariant(value) for value in node.values)
+            if kind is UnaryOp:
+                return invariant(node.operand)
+            return invariant(node.left) and invariant(node.right)
+
+        def replace(node):
+            if isinstance(node, COMPOUND_EXPRS) and invariant(node):
+                key = repr(node)
+                if key not in temps:
+                    self.temp_count += 1
+                    temps[key] = (f'__hoisted{self.temp_count}', node)
+                return Name(temps[key][0])
+            return map_expr(node, replace)
+
+        kind = loop.__class__
+        if kind is While:
+            new_loop = _like(While(replace(loop.cond), map_block(loop.body, replace)), loop)
+        elif kind is DoWhile:
+            new_loop = _like(DoWhile(map_block(loop.body, replace), replace(loop.cond)), loop)
+        else:
+            new_loop = _like(For(loop.var, loop.loop_type, loop.items, map_block(loop.body, replace)), loop)
+        if not temps:
+            return [loop]
+        prelude = [_like(Assign(name, node), loop) for name, node in temps.values()]
+        return prelude + [new_loop]
+
+    # -- range loop reductions ---------------------------------------------------
+
+    def reduction(self, loop):
+        """Reduction computing a range loop's effect directly, None unless its body only sums integer terms.
+
+        Each statement must either add and subtract terms to an accumulator
+        nothing else reads, as in 'acc = acc + i * k - 1', or be 'name =
+        term' for a name read only later in the same iteration, whose term
+        then takes its place. Terms combine int constants, the loop
+        variable and names the loop does not assign with + - * %. With int
+        values all of that is exact integer arithmetic, so the order of
+        the additions does not matter.
+        """
+        var = loop.var
+        assigned = {stmt.name for stmt in loop.body if stmt.__class__ is Assign}
+        if var in assigned:
+            return None
+        temps = {}
+        sums = {}
+        invariants = set()
+
+        def substitute(node):
+            if node.__class__ is Name:
+                return temps.get(node.name, node)
+            return map_expr(node, substitute)
+
+        for stmt in loop.body:
+            if stmt.__class__ is ExprStmt and _is_const(stmt.expr):
+                continue
+            if stmt.__class__ is not Assign:
+                return None
+            name = stmt.name
+            value = stmt.value
+            if not is_integer_term(value):
+                return None
+            accumulates = False
+            if name not in temps:
+                pieces = _signed_terms(value)
+                own = [piece for piece in pieces if piece[1].__class__ is Name and piece[1].name == name]
+                if len(pieces) > 1 and len(own) == 1 and own[0][0] > 0:
+                    accumulates = True
+                    value = None
+                    for sign, node in pieces:
+                        if node is own[0][1]:
+                            continue
+                        if value is None:
+                            value = node if sign > 0 else UnaryOp('-', node)
+                        else:
+                            value = BinOp('+' if sign > 0 else '-', value, node)
+            term = substitute(value)
+            nodes = _term_nodes(term)
+            if len(nodes) > MAX_TERM_SIZE:
+                return None
+            for node in nodes:
+                if node.__class__ is Name and node.name != var:
+                    if node.name in assigned:
+                        # An accumulator, or a name read before this
+                        # iteration assigns it.
+                        return None
+                    invariants.add(node.name)
+            if accumulates:
+                sums.setdefault(name, []).append((term, degree(term, var)))
+            elif name in sums:
+                return None
+            else:
+                temps[name] = term
+        for terms in sums.values():
+            for index, (term, term_degree) in enumerate(terms):
+                if term_degree is not None and term_degree > MAX_DEGREE:
+                    terms[index] = (term, None)
+        accumulators = list(sums)
+        inputs = accumulators + sorted(invariants)
+        return Reduction(var, inputs, [Name(name) for name in inputs], accumulators + list(temps) + [var],
+                         [sums[name] for name in accumulators], list(temps.values()), len(loop.body))
+
+    # -- string builders ---------------------------------------------------------
+
+    def concat_block(self, stmts, shared, builders=None):
+        """Rewrite the loops of a block that only extend a string with '+' to collect its parts instead.
+
+        In 'for w in words: s = s + w + " "' every '+' copies all of s,
+        which makes the loop quadratic in the length of s. A loop qualifies
+        for a name when every assignment to it in the loop adds to it
+        like that, at least one added term is surely a string, and nothing
+        else in the loop reads it. The name then gets a StringBuilder
+        before the loop and its value back after it, so '__concat_add'
+        calls replace the assignments. Reading a name in the main block
+        also includes the functions the loop calls; shared holds the
+        names each function may read from the globals, None inside a
+        function, whose locals no call can read.
+        """
+        if builders is None:
+            builders = {}
+        result = []
+        for stmt in stmts:
+            kind = stmt.__class__
+            if kind is Assign and stmt.name in builders:
+                terms = _concat_terms(stmt.value)
+                result.append(_like(ExprStmt(Call('__concat_add', [Name(builders[stmt.name])] + terms[1:])), stmt))
+            elif kind is If:
+                orelse = None if stmt.orelse is None else self.concat_block(stmt.orelse, shared, builders)
+                branches = [(cond, self.concat_block(block, shared, builders)) for cond, block in stmt.branches]
+                result.append(_like(If(branches, orelse), stmt))
+            elif kind is While or kind is DoWhile or kind is For:
+                names = self.concat_names(stmt, shared) - builders.keys()
+                inner = dict(builders)
+                epilogue = []
+                for name in sorted(names):
+                    self.temp_count += 1
+                    temp = f'__builder{self.temp_count}'
+                    inner[name] = temp
+                    result.append(_like(Assign(temp, Call('__concat_start', [Name(name)])), stmt))
+                    epilogue.append(_like(Assign(name, Call('__concat_end', [Name(temp)])), stmt))
+                body = self.concat_block(stmt.body, shared, inner)
+                if kind is While:
+                    loop = While(stmt.cond, body)
+                elif kind is DoWhile:
+                    loop = DoWhile(body, stmt.cond)
+                else:
+                    # A reduction computes what the old body assigns.
+                    changed = any(new is not old for new, old in zip(body, stmt.body))
+                    loop = For(stmt.var, stmt.loop_type, stmt.items, body,
+                               reduction=None if changed else stmt.reduction)
+                result.append(_like(loop, stmt))
+                result.extend(epilogue)
+            else:
+                result.append(stmt)
+        return result
+
+    def concat_names(self, loop, shared):
+        """Names a loop only extends with string terms (see concat_block)"""
+        reads = Counter()
+        extends = Counter()
+        text = set()
+        other = set()
+        called = set()
+        for stmt in walk_statements([loop]):
+            kind = stmt.__class__
+            if kind is Return:
+                # Leaving the loop this way would skip the epilogue.
+                return set()
+            if kind is Assign:
+                terms = _concat_terms(stmt.value)
+                if len(terms) > 1 and terms[0].__class__ is Name and terms[0].name == stmt.name:
+                    extends[stmt.name] += 1
+                    if any(_is_text(term, self.functions) for term in terms[1:]):
+                        text.add(stmt.name)
+                else:
+                    other.add(stmt.name)
+            elif kind is For:
+                other.add(stmt.var)
+                if stmt.loop_type == 'variable':
+                    reads[stmt.items] += 1
+            for node in statement_exprs(stmt):
+                _count_reads(node, reads)
+                called |= calls(node)
+        names = {name for name in text if name not in other and reads[name] == extends[name]}
+        if shared is not None:
+            for fname in called & shared.keys():
+                names -= shared[fname]
+        return names
+
+def optimize_program(functions, main_block):
+    """Optimize every registered function in place and return the optimized main block"""
+    optimizer = Optimizer(functions)
+    for fname, (params, body, return_type) in list(functions.items()):
+        functions[fname] = (params, optimizer.concat_block(optimizer.block(body), None), return_type)
+    return optimizer.concat_block(optimizer.block(main_block), global_reads(functions))
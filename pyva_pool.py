@@ -0,0 +1,376 @@
+"""Pool of pre-warmed worker processes that execute PyVa jobs for the web service"""
+import atexit
+import concurrent.futures
+import io
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import pyva_cache
+import pyva_compiler
+import pyva_profile
+
+DEFAULT_MAX_OUTPUT = 1024 * 1024
+BUSY_MESSAGE = "Error: Server is busy, please try again"
+
+class PoolBusy(Exception):
+    """Raised when the pool's job queue is full"""
+    pass
+
+class OutputLimitExceeded(pyva_compiler.ExecutionAborted):
+    pass
+
+class OutputStream:
+    """Write-only stdout for a job that enforces an output byte cap.
+
+    Without on_chunk the output is kept for getvalue(). With on_chunk the
+    writes are batched and handed over whenever chunk_bytes have collected
+    or flush_interval seconds have passed, and nothing is kept.
+    """
+
+    def __init__(self, on_chunk=None, max_bytes=DEFAULT_MAX_OUTPUT, chunk_bytes=4096, flush_interval=0.05):
+        self.on_chunk = on_chunk
+        self.max_bytes = max_bytes
+        self.chunk_bytes = chunk_bytes
+        self.flush_interval = flush_interval
+        self.parts = []
+        self.pending = 0
+        self.total = 0
+        self.last_flush = time.monotonic()
+
+    def write(self, text):
+        size = len(text.encode('utf-8'))
+        if self.total + size > self.max_bytes:
+            room = self.max_bytes - self.total
+            self.parts.append(text.encode('utf-8')[:room].decode('utf-8', 'ignore'))
+            self.total = self.max_bytes
+            self.flush()
+            raise OutputLimitExceeded(f"Output limit of {self.max_bytes} bytes exceeded")
+        self.parts.append(text)
+        self.total += size
+        if self.on_chunk is not None:
+            self.pending += size
+            if self.pending >= self.chunk_bytes or time.monotonic() - self.last_flush >= self.flush_interval:
+                self.flush()
+        return len(text)
+
+    def flush(self):
+        if self.on_chunk is None or not self.parts:
+            return
+        text = ''.join(self.parts)
+        self.parts = []
+        self.pending = 0
+        self.last_flush = time.monotonic()
+        self.on_chunk(text)
+
+    def getvalue(self):
+        return ''.join(self.parts)
+
+def run_job(job, cache=None, on_chunk=None):
+    """Execute one job dict and return its result dict.
+
+    A job has the program 'code' and optionally 'inputs', 'engine',
+    'max_output', 'max_steps', 'timeout', 'profile' and 'sample'. A
+    profiled job runs on the tree engine and its result carries the
+    'profile' (see ProfilingInterpreter.as_dict); a sampled one runs on its
+    own engine and its result carries the 'samples' in collapsed stack
+    format (see Sampler.collapsed). With a ProgramCache, repeated
+    sources skip parsing and compilation. With on_chunk, output is streamed
+    to it as the program runs and the result only carries the closing error
+    message, if any. The result's 'time' is the wall-clock time of the job
+    in seconds, 'parse_time' the part of it spent parsing and compiling (or
+    fetching the program from the cache) and 'output_bytes' the size of the
+    program's output; a run stopped by its budget also carries the 'budget'
+    details.
+    """
+    # Each job gets its own interpreter and I/O channels, so jobs never see
+    # each other's state. Prompts are not echoed, the editor shows program
+    # output only.
+    output = OutputStream(on_chunk, job.get('max_output', DEFAULT_MAX_OUTPUT))
+    profile = job.get('profile', False)
+    interpreter_class = pyva_profile.ProfilingInterpreter if profile else pyva_compiler.Interpreter
+    interpreter = interpreter_class(stdin=io.StringIO(job.get('inputs', '')), stdout=output, echo_prompts=False)
+    engine = 'tree' if profile else job.get('engine', 'tree')
+    max_steps = job.get('max_steps', pyva_compiler.DEFAULT_MAX_STEPS)
+    timeout = job.get('timeout')
+    extra = {}
+    sampler = pyva_profile.Sampler() if job.get('sample') else None
+    if sampler is not None:
+        sampler.start()
+    started = time.perf_counter()
+    parsed = None
+    try:
+        pyva_compiler.check_engine(engine)
+        if cache is None:
+            program = pyva_compiler.Program(job['code'], interpreter.optimize)
+            program.compile(engine)
+        else:
+            program = cache.get(job['code'], engine)
+        parsed = time.perf_counter()
+        interpreter.execute(program, engine, max_steps, timeout)
+        status, message = 'ok', ''
+    except pyva_compiler.BudgetExceeded as e:
+        status, message = 'budget_exceeded', f"Error: {str(e)}"
+        extra['budget'] = e.as_dict()
+    except OutputLimitExceeded as e:
+        status, message = 'output_limit', f"Error: {str(e)}"
+    except Exception as e:
+        status, message = 'error', f"Error: {str(e)}"
+    finally:
+        if sampler is not None:
+            sampler.stop()
+            extra['samples'] = sampler.collapsed()
+    finished = time.perf_counter()
+    elapsed = finished - started
+    extra['parse_time'] = (finished if parsed is None else parsed) - started
+    extra['output_bytes'] = output.total
+    if profile:
+        extra['profile'] = interpreter.as_dict(job['code'])
+    if status == 'error' and on_chunk is None:
+        return dict(extra, output=message, status=status, time=elapsed)
+    output.flush()
+    if on_chunk is not None:
+        return dict(extra, output=message, status=status, time=elapsed)
+    text = output.getvalue().strip()
+    return dict(extra, output=f"{text}\n{message}" if text and message else text or message, status=status,
+                time=elapsed)
+
+def stream_job(job, cache=None):
+    """Run a job in a background thread, yielding ('chunk', text) messages and a final ('done', result)"""
+    messages = queue.Queue()
+    cancelled = threading.Event()
+
+    def on_chunk(text):
+        if cancelled.is_set():
+            raise pyva_compiler.ExecutionAborted("Client disconnected")
+        messages.put(('chunk', text))
+
+    def target():
+        messages.put(('done', run_job(job, cache, on_chunk)))
+
+    threading.Thread(target=target, daemon=True).start()
+    try:
+        while True:
+            message = messages.get()
+            yield message
+            if message[0] == 'done':
+                return
+    finally:
+        cancelled.set()
+
+def worker_main(conn, cache_entries, cache_bytes):
+    """Worker process loop: receive a job, run it, send its messages back"""
+    cache = pyva_cache.ProgramCache(cache_entries, cache_bytes)
+
+    def send_chunk(text):
+        conn.send(('chunk', text))
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            return
+        if job is None:
+            return
+        result = run_job(job, cache, send_chunk if job.get('stream') else None)
+        result['cache'] = cache.stats()
+        conn.send(('done', result))
+
+class Worker:
+    def __init__(self, context, cache_entries, cache_bytes):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=worker_main, args=(child_conn, cache_entries, cache_bytes),
+                                       daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def stop(self, timeout=1.0):
+        try:
+            self.conn.send(None)
+        except (OSError, ValueError):
+            pass
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.kill()
+        else:
+            self.conn.close()
+
+class WorkerPool:
+    """Fixed-size pool of worker processes with a bounded job queue.
+
+    run() blocks the calling thread until a worker is free and the job has
+    finished. Jobs that run longer than the timeout get their worker
+    killed and replaced, so a runaway program never holds a slot for long.
+    Every worker keeps its own ProgramCache of cache_entries programs and
+    at most cache_bytes of memory.
+    """
+
+    def __init__(self, size=None, max_queue=64, timeout=10.0, start_method=None,
+                 cache_entries=256, cache_bytes=32 * 1024 * 1024):
+        self.size = size or os.cpu_count() or 1
+        self.timeout = timeout
+        self.cache_entries = cache_entries
+        self.cache_bytes = cache_bytes
+        if start_method is None:
+            start_method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+        self.context = multiprocessing.get_context(start_method)
+        if start_method == 'forkserver':
+            # Replacement workers fork from a server that already imported
+            # the interpreter, so they start warm.
+            self.context.set_forkserver_preload(['pyva_compiler', 'pyva_cache', 'pyva_pool'])
+        self._slots = threading.BoundedSemaphore(self.size + max_queue)
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self._workers = set()
+        self._cache_stats = {}
+        # Cache counters of replaced workers, so that the totals never drop.
+        self._retired_cache_stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+        self._closed = False
+        self.restarts = 0
+        # Jobs waiting for an idle worker and jobs running on one.
+        self.queued = 0
+        self.busy = 0
+        for _ in range(self.size):
+            self._start_worker()
+        atexit.register(self.shutdown)
+
+    def _start_worker(self):
+        worker = Worker(self.context, self.cache_entries, self.cache_bytes)
+        with self._lock:
+            self._workers.add(worker)
+        self._idle.put(worker)
+
+    def _replace(self, worker):
+        worker.kill()
+        with self._lock:
+            self._workers.discard(worker)
+            stats = self._cache_stats.pop(worker, None)
+            if stats is not None:
+                for name in self._retired_cache_stats:
+                    self._retired_cache_stats[name] += stats[name]
+            self.restarts += 1
+            closed = self._closed
+        if not closed:
+            self._start_worker()
+
+    def run(self, job, timeout=None):
+        """Run a job on a worker and return its result dict"""
+        result = None
+        for kind, payload in self.stream(job, timeout):
+            if kind == 'done':
+                result = payload
+        return result
+
+    def run_many(self, jobs, parallel=False, timeout=None):
+        """Run several jobs and return their results in order, optionally on several workers at once.
+
+        Workers cache parsed programs, so jobs sharing a source parse it at
+        most once per worker.
+        """
+        def run_one(job):
+            try:
+                return self.run(job, timeout)
+            except PoolBusy:
+                return {'output': BUSY_MESSAGE, 'status': 'busy'}
+
+        if not parallel or len(jobs) < 2:
+            return [run_one(job) for job in jobs]
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(self.size, len(jobs))) as executor:
+            return list(executor.map(run_one, jobs))
+
+    def stream(self, job, timeout=None):
+        """Run a job on a worker, yielding ('chunk', text) messages and a final ('done', result).
+
+        Jobs with 'stream' set send their output in chunks as it is produced.
+        Closing the iterator early kills the worker running the job.
+        """
+        if self._closed:
+            raise RuntimeError("Worker pool is shut down")
+        if timeout is None:
+            timeout = self.timeout
+        if not self._slots.acquire(blocking=False):
+            raise PoolBusy("Too many queued jobs")
+        running = False
+        try:
+            queued_at = time.monotonic()
+            with self._lock:
+                self.queued += 1
+            worker = self._idle.get()
+            with self._lock:
+                self.queued -= 1
+                self.busy += 1
+            running = True
+            queue_wait = time.monotonic() - queued_at
+            deadline = time.monotonic() + timeout
+            finished = False
+            try:
+                worker.conn.send(job)
+                while True:
+                    if not worker.conn.poll(max(deadline - time.monotonic(), 0)):
+                        self._replace(worker)
+                        worker = None
+                        yield 'done', {'output': f"Error: Execution timed out after {timeout:g} seconds",
+                                       'status': 'timeout', 'queue_wait': queue_wait}
+                        return
+                    kind, payload = worker.conn.recv()
+                    if kind == 'done':
+                        # Recorded before the worker goes back to the idle
+                        # queue, where another job may get it replaced.
+                        with self._lock:
+                            self._cache_stats[worker] = payload.pop('cache')
+                        finished = True
+                        break
+                    yield kind, payload
+            except (EOFError, OSError):
+                self._replace(worker)
+                worker = None
+                yield 'done', {'output': "Error: Worker process crashed", 'status': 'error',
+                               'queue_wait': queue_wait}
+                return
+            finally:
+                if worker is not None:
+                    if finished:
+                        self._idle.put(worker)
+                    else:
+                        self._replace(worker)
+            payload['queue_wait'] = queue_wait
+            yield 'done', payload
+        finally:
+            if running:
+                with self._lock:
+                    self.busy -= 1
+            self._slots.release()
+
+    def load(self):
+        """Pool size, busy workers, queued jobs and worker restarts so far"""
+        with self._lock:
+            return {'workers': self.size, 'busy': self.busy, 'queued': self.queued, 'restarts': self.restarts}
+
+    def cache_stats(self):
+        """Program cache sizes summed over the live workers, as of their last job.
+
+        The hits, misses and evictions include those of replaced workers.
+        """
+        with self._lock:
+            totals = dict(self._retired_cache_stats, entries=0, bytes=0)
+            for stats in self._cache_stats.values():
+                for name in totals:
+                    totals[name] += stats[name]
+        return totals
+
+    def shutdown(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop()
@@ -0,0 +1,265 @@
+"""Profilers for PyVa programs: a tracing line and function profiler and a sampling one"""
+import sys
+import threading
+import time
+from collections import Counter
+
+from pyva_compiler import Interpreter, DEFAULT_MAX_STEPS
+from pyva_vm import VirtualMachine
+
+DEFAULT_SAMPLE_INTERVAL = 0.005
+
+# Python frames the sampler rebuilds PyVa stacks from.
+_EXECUTE_MAIN = Interpreter.execute_main.__code__
+_EXECUTE_BLOCK = Interpreter.execute_block.__code__
+_EXECUTE_FUNCTION = Interpreter.execute_function.__code__
+_VM_RUN = VirtualMachine.run.__code__
+
+class Stats:
+    """Counters of one source line or function; iterations is None except on loop lines"""
+    __slots__ = ('hits', 'iterations', 'total', 'own', 'active')
+
+    def __init__(self):
+        self.hits = 0
+        self.iterations = None
+        self.total = 0.0
+        self.own = 0.0
+        self.active = 0
+
+class ProfilingInterpreter(Interpreter):
+    """An Interpreter that records hits, cumulative time and self time per source line and per function.
+
+    A line's cumulative time includes the statements nested under it and
+    the functions it calls, its self time neither; a function's self time
+    leaves out the functions it calls. Time spent in recursive calls
+    counts once, in the outermost one. Loop lines also count their
+    iterations. Profiles always run on the tree engine, whose statements
+    map one to one onto source lines; only this subclass pays for the
+    bookkeeping.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.line_stats = {}
+        self.call_stats = {}
+        self.elapsed = 0.0
+        # Child time of the statements and the calls being timed.
+        self._line_stack = []
+        self._call_stack = []
+        self._loops = []
+
+    def execute(self, program, engine='tree', max_steps=DEFAULT_MAX_STEPS, timeout=None):
+        self.line_stats.clear()
+        self.call_stats.clear()
+        del self._line_stack[:], self._call_stack[:], self._loops[:]
+        started = time.perf_counter()
+        try:
+            return super().execute(program, 'tree', max_steps, timeout)
+        finally:
+            self.elapsed = time.perf_counter() - started
+
+    # -- timing ----------------------------------------------------------------
+
+    def _timed(self, stats, stacks, func, args):
+        """Run func(*args), charging its time to stats and to the frames enclosing it on stacks.
+
+        stats' self time leaves out what its children on the first stack
+        took.
+        """
+        stats.hits += 1
+        stats.active += 1
+        for stack in stacks:
+            stack.append(0.0)
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            elapsed = time.perf_counter() - started
+            stats.active -= 1
+            stats.own += elapsed - stacks[0][-1]
+            if not stats.active:
+                stats.total += elapsed
+            for stack in stacks:
+                stack.pop()
+                if stack:
+                    stack[-1] += elapsed
+
+    def _line(self, stmt, func, *args):
+        stats = self.line_stats.get(stmt.lineno)
+        if stats is None:
+            stats = self.line_stats[stmt.lineno] = Stats()
+        return self._timed(stats, (self._line_stack,), func, args)
+
+    def _loop(self, node, func, local_vars):
+        stats = self.line_stats.get(node.lineno)
+        if stats is None:
+            stats = self.line_stats[node.lineno] = Stats()
+        if stats.iterations is None:
+            stats.iterations = 0
+        self._loops.append(node)
+        try:
+            return self._timed(stats, (self._line_stack,), func, (node, local_vars))
+        finally:
+            self._loops.pop()
+
+    # -- instrumented executors --------------------------------------------------
+
+    def execute_statement(self, stmt, local_vars):
+        return self._line(stmt, super().execute_statement, stmt, local_vars)
+
+    def execute_if_block(self, node, local_vars):
+        return self._line(node, super().execute_if_block, node, local_vars)
+
+    def execute_while_loop(self, node, local_vars):
+        return self._loop(node, super().execute_while_loop, local_vars)
+
+    def execute_do_while_loop(self, node, local_vars):
+        return self._loop(node, super().execute_do_while_loop, local_vars)
+
+    def execute_for_loop(self, node, local_vars):
+        return self._loop(node, super().execute_for_loop, local_vars)
+
+    def execute_block(self, stmts, local_vars):
+        loops = self._loops
+        if loops and loops[-1].body is stmts:
+            self.line_stats[loops[-1].lineno].iterations += 1
+        return super().execute_block(stmts, local_vars)
+
+    def execute_function(self, fname, args):
+        stats = self.call_stats.get(fname)
+        if stats is None:
+            stats = self.call_stats[fname] = Stats()
+        # The call is a child of the calling function as well as of the
+        # calling line, so neither counts the callee's time as its own.
+        return self._timed(stats, (self._call_stack, self._line_stack), super().execute_function, (fname, args))
+
+    # -- reports -------------------------------------------------------------------
+
+    def as_dict(self, source_code=None):
+        """The last run's profile as JSON-ready data, slowest self time first"""
+        source = source_code.splitlines() if source_code else []
+        lines = []
+        for lineno, stats in sorted(self.line_stats.items(), key=lambda item: -item[1].own):
+            entry = {'line': lineno, 'hits': stats.hits, 'total': stats.total, 'self': stats.own}
+            if stats.iterations is not None:
+                entry['iterations'] = stats.iterations
+            if 0 < lineno <= len(source):
+                entry['source'] = source[lineno - 1].strip()
+            lines.append(entry)
+        functions = [{'function': fname, 'calls': stats.hits, 'total': stats.total, 'self': stats.own}
+                     for fname, stats in sorted(self.call_stats.items(), key=lambda item: -item[1].own)]
+        return {'time': self.elapsed, 'lines': lines, 'functions': functions}
+
+    def report(self, source_code=None, limit=None):
+        """The last run's profile as text tables, slowest self time first"""
+        profile = self.as_dict(source_code)
+        out = [f"Profile: {profile['time']:.6f} s",
+               f"{'Line':>6} {'Hits':>10} {'Iterations':>10} {'Total (s)':>11} {'Self (s)':>11}  Source"]
+        for entry in profile['lines'][:limit]:
+            iterations = entry.get('iterations', '')
+            out.append(f"{entry['line']:>6} {entry['hits']:>10} {iterations:>10} {entry['total']:>11.6f} "
+                       f"{entry['self']:>11.6f}  {entry.get('source', '')}")
+        if profile['functions']:
+            out.append('')
+            out.append(f"{'Function':<20} {'Calls':>10} {'Total (s)':>11} {'Self (s)':>11}")
+            for entry in profile['functions'][:limit]:
+                out.append(f"{entry['function']:<20} {entry['calls']:>10} {entry['total']:>11.6f} "
+                           f"{entry['self']:>11.6f}")
+        return '\n'.join(out)
+
+class Sampler:
+    """Sample the PyVa call stack of the thread running a program, every interval seconds.
+
+    The program runs uninstrumented on any engine. A background thread
+    reads the running thread's Python frames and rebuilds the PyVa stack
+    from them: the tree engine's executor frames, the VM's own frame stack
+    or the functions the Python backend generated. counts maps each stack,
+    a tuple of 'function:line' entries from main down to the running
+    line, to the number of samples that found it.
+    """
+
+    def __init__(self, interval=DEFAULT_SAMPLE_INTERVAL):
+        self.interval = interval
+        self.counts = Counter()
+        self._thread = None
+        self._target = None
+        self._stopped = threading.Event()
+
+    def start(self, thread_id=None):
+        """Start sampling a thread, by default the calling one"""
+        self._target = threading.get_ident() if thread_id is None else thread_id
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._sample_loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _sample_loop(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            if frame is not None:
+                stack = pyva_stack(frame)
+                if stack:
+                    self.counts[stack] += 1
+
+    @property
+    def samples(self):
+        return sum(self.counts.values())
+
+    def collapsed(self):
+        """The samples in the collapsed stack format of flamegraph.pl and speedscope, one 'a;b;c count' line per stack"""
+        return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in sorted(self.counts.items()))
+
+def pyva_stack(frame):
+    """PyVa stack, as a tuple of 'function:line', of the Python frame a program runs in; empty outside programs"""
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        frame = frame.f_back
+    stack = []
+    function = None
+    line = 0
+    for frame in reversed(frames):
+        code = frame.f_code
+        if code is _EXECUTE_BLOCK:
+            stmt = frame.f_locals.get('stmt')
+            if stmt is not None:
+                line = stmt.lineno
+        elif code is _EXECUTE_FUNCTION:
+            if function is not None:
+                stack.append(f'{function}:{line}')
+            function = frame.f_locals.get('fname')
+            line = 0
+        elif code is _EXECUTE_MAIN:
+            function = 'main'
+        elif code is _VM_RUN:
+            # Suspended callers are (code, fast, stack, pc, ...) with pc past
+            # their call instruction; pc is past the running one.
+            names = frame.f_locals
+            for caller in list(names.get('frames', ())):
+                stack.append(_vm_entry(caller[0], caller[3]))
+            if 'code' in names:
+                stack.append(_vm_entry(names['code'], names.get('pc', 0)))
+        elif code.co_filename == '<pyva>' and code.co_name != '<module>':
+            line_numbers = frame.f_globals.get('_line_numbers')
+            index = frame.f_lineno - 1
+            line = line_numbers[index] if line_numbers and 0 <= index < len(line_numbers) else 0
+            name = 'main' if code.co_name == '_main' else code.co_name[2:]
+            stack.append(f'{name}:{line}')
+    if function is not None:
+        stack.append(f'{function}:{line}')
+    return tuple(stack)
+
+def _vm_entry(code, pc):
+    line = code.lines[pc - 1] if 0 < pc <= len(code.lines) else 0
+    return f"{'main' if code.name == '<main>' else code.name}:{line}"
@@ -0,0 +1,227 @@
+"""Closed-form and vectorized execution of range loops that only sum integer terms"""
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from pyva_compiler import Const, Name, UnaryOp, BinOp, NativeBinOp
+
+# Sums of polynomial terms up to this degree are computed in closed form.
+MAX_DEGREE = 8
+
+# NumPy only pays off for long loops; it runs them in chunks of this many
+# iterations, and only while every intermediate value fits in an int64.
+NUMPY_MIN_ITERATIONS = 10000
+NUMPY_CHUNK = 65536
+INT64_MAX = 2 ** 63 - 1
+
+def _mod(left, right):
+    return left % right if right != 0 else 0
+
+def degree(node, var):
+    """Degree of an integer term as a polynomial in var, None if it is not one"""
+    kind = node.__class__
+    if kind is Const:
+        return 0
+    if kind is Name:
+        return 1 if node.name == var else 0
+    if kind is UnaryOp:
+        return degree(node.operand, var)
+    left = degree(node.left, var)
+    right = degree(node.right, var)
+    if left is None or right is None:
+        return None
+    if node.op == '*':
+        return left + right
+    if node.op == '%':
+        return 0 if left == 0 and right == 0 else None
+    return max(left, right)
+
+def evaluate(node, env):
+    """Value of an integer term, with binary_op's results for int operands"""
+    kind = node.__class__
+    if kind is Const:
+        return node.value
+    if kind is Name:
+        return env[node.name]
+    if kind is UnaryOp:
+        return -evaluate(node.operand, env)
+    left = evaluate(node.left, env)
+    right = evaluate(node.right, env)
+    if node.op == '+':
+        return left + right
+    if node.op == '-':
+        return left - right
+    if node.op == '*':
+        return left * right
+    return _mod(left, right)
+
+def bound(node, env):
+    """Upper bound of the absolute values a term computes over the loop, env holding absolute values"""
+    kind = node.__class__
+    if kind is Const:
+        return abs(node.value)
+    if kind is Name:
+        return env[node.name]
+    if kind is UnaryOp:
+        return bound(node.operand, env)
+    left = bound(node.left, env)
+    right = bound(node.right, env)
+    # Operands count too, so the bound also covers every intermediate value.
+    if node.op == '*':
+        return max(left * right, left, right)
+    if node.op == '%':
+        return max(left, right)
+    return left + right
+
+def source(node):
+    """Python expression computing a term, names read as v_<name>"""
+    kind = node.__class__
+    if kind is Const:
+        return repr(node.value)
+    if kind is Name:
+        return f'v_{node.name}'
+    if kind is UnaryOp:
+        return f'(-{source(node.operand)})'
+    if node.op == '%':
+        return f'_mod({source(node.left)}, {source(node.right)})'
+    return f'({source(node.left)} {node.op} {source(node.right)})'
+
+def is_integer_term(node):
+    """Whether a term only combines int constants and names with + - * % and negation"""
+    kind = node.__class__
+    if kind is Const:
+        return type(node.value) is int
+    if kind is Name:
+        return True
+    if kind is UnaryOp:
+        return node.op == '-' and is_integer_term(node.operand)
+    if kind is BinOp or kind is NativeBinOp:
+        return node.op in ('+', '-', '*', '%') and is_integer_term(node.left) and is_integer_term(node.right)
+    return False
+
+class Reduction:
+    """How to run a range loop whose body only adds integer terms of the loop variable to accumulators.
+
+    reads are the expressions giving, before the loop, the values of the
+    names in inputs: the accumulators, then the loop invariants. run()
+    returns the values the loop leaves in targets: the accumulators, the
+    other names the body assigns (finals, the term each last gets) and
+    the loop variable. sums holds the (term, degree) pairs each iteration
+    adds to each accumulator, degree being None for terms that are no
+    polynomial of the loop variable; steps is the length of the loop
+    body.
+    """
+    __slots__ = ('var', 'inputs', 'reads', 'targets', 'sums', 'finals', 'steps', '_functions')
+
+    def __init__(self, var, inputs, reads, targets, sums, finals, steps):
+        self.var = var
+        self.inputs = inputs
+        self.reads = reads
+        self.targets = targets
+        self.sums = sums
+        self.finals = finals
+        self.steps = steps
+        self._functions = {}
+
+    def resolved(self, reads, targets):
+        """Copy reading and storing through an engine's own name references"""
+        return Reduction(self.var, self.inputs, reads, targets, self.sums, self.finals, self.steps)
+
+    def run(self, interpreter, iteration_values, values):
+        """Results for targets after the loop, or None when the engine must run it normally.
+
+        That is the case for an empty range, for inputs that are not ints
+        and when the loop would exceed the step budget, so the normal loop
+        stops at the same step as it would without this.
+        """
+        count = len(iteration_values)
+        if count == 0:
+            return None
+        for value in values:
+            if type(value) is not int:
+                return None
+        steps = interpreter.steps + count * self.steps
+        if interpreter.max_steps is not None and steps > interpreter.max_steps:
+            return None
+        env = dict(zip(self.inputs, values))
+        results = []
+        for index, terms in enumerate(self.sums):
+            total = values[index]
+            for term, term_degree in terms:
+                total += self.sum(term, term_degree, iteration_values, env)
+            results.append(total)
+        env[self.var] = iteration_values[-1]
+        for term in self.finals:
+            results.append(evaluate(term, env))
+        results.append(iteration_values[-1])
+        interpreter.steps = steps
+        if steps >= interpreter.next_check:
+            interpreter.check_budget()
+        return results
+
+    def sum(self, term, term_degree, iteration_values, env):
+        """Sum of a term over the range"""
+        count = len(iteration_values)
+        start = iteration_values.start
+        step = iteration_values.step
+        if term_degree is not None:
+            # Newton's forward differences: the sum of q(0..count-1) is the
+            # sum of the j-th difference at 0 times C(count, j + 1).
+            points = []
+            for k in range(term_degree + 1):
+                env[self.var] = start + step * k
+                points.append(evaluate(term, env))
+            total = 0
+            for j in range(term_degree + 1):
+                total += points[0] * math.comb(count, j + 1)
+                points = [right - left for left, right in zip(points, points[1:])]
+            return total
+        if numpy is not None and count >= NUMPY_MIN_ITERATIONS:
+            limits = {name: abs(value) for name, value in env.items() if name != self.var}
+            limits[self.var] = max(abs(iteration_values[0]), abs(iteration_values[-1]))
+            if bound(term, limits) * count <= INT64_MAX:
+                return self.numpy_sum(term, iteration_values, env)
+        return sum(map(self.function(term, env), iteration_values))
+
+    def function(self, term, env):
+        """Python function of the loop variable computing a term for the current inputs"""
+        code = self._functions.get(id(term))
+        if code is None:
+            code = compile(f'lambda v_{self.var}: {source(term)}', '<pyva reduction>', 'eval')
+            self._functions[id(term)] = code
+        namespace = {f'v_{name}': value for name, value in env.items() if name != self.var}
+        namespace['_mod'] = _mod
+        return eval(code, namespace)
+
+    def numpy_sum(self, term, iteration_values, env):
+        total = 0
+        step = iteration_values.step
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            for offset in range(0, len(iteration_values), NUMPY_CHUNK):
+                chunk = iteration_values[offset:offset + NUMPY_CHUNK]
+                env[self.var] = numpy.arange(chunk.start, chunk.stop, step, dtype=numpy.int64)
+                values = numpy_evaluate(term, env)
+                total += int(values.sum()) if isinstance(values, numpy.ndarray) else int(values) * len(chunk)
+        return total
+
+def numpy_evaluate(node, env):
+    """evaluate() over int64 arrays; % by zero gives 0 as binary_op does"""
+    kind = node.__class__
+    if kind is Const:
+        return node.value
+    if kind is Name:
+        return env[node.name]
+    if kind is UnaryOp:
+        return -numpy_evaluate(node.operand, env)
+    left = numpy_evaluate(node.left, env)
+    right = numpy_evaluate(node.right, env)
+    if node.op == '+':
+        return left + right
+    if node.op == '-':
+        return left - right
+    if node.op == '*':
+        return left * right
+    return numpy.where(right != 0, numpy.remainder(left, right), 0)
@@ -0,0 +1,109 @@
+"""Resolver for the tree walking interpreter: function locals get fixed frame slots"""
+from pyva_compiler import (
+    Name, LocalName, GlobalName, Assign, AssignLocal, AssignItem, ExprStmt, Return, If, While, DoWhile, For,
+    walk_statements,
+)
+from pyva_optimize import map_expr
+
+class ResolvedFunction:
+    """A function ready for the tree walker.
+
+    Its locals live in a list of nlocals slots, parameters first, instead of
+    a dict. specialized is the resolved type-specialized body, if any.
+    """
+    __slots__ = ('params', 'body', 'return_type', 'specialized', 'nlocals')
+
+    def __init__(self, params, body, return_type, specialized, nlocals):
+        self.params = params
+        self.body = body
+        self.return_type = return_type
+        self.specialized = specialized
+        self.nlocals = nlocals
+
+class Resolver:
+    """Rewrite a block tree so names refer to frame slots (slots given) or to the globals"""
+
+    def __init__(self, slots=None):
+        self.slots = slots
+
+    def expr(self, node):
+        if node.__class__ is Name:
+            if self.slots is not None and node.name in self.slots:
+                return LocalName(node.name, self.slots[node.name])
+            return GlobalName(node.name)
+        return map_expr(node, self.expr)
+
+    def block(self, stmts):
+        return [self.statement(stmt) for stmt in stmts]
+
+    def statement(self, stmt):
+        kind = stmt.__class__
+        if kind is Assign:
+            if self.slots is None:
+                new = Assign(stmt.name, self.expr(stmt.value))
+            else:
+                new = AssignLocal(stmt.name, self.slots[stmt.name], self.expr(stmt.value))
+        elif kind is AssignItem:
+            new = AssignItem(self.expr(stmt.target), self.expr(stmt.index), self.expr(stmt.value))
+        elif kind is ExprStmt:
+            new = ExprStmt(self.expr(stmt.expr))
+        elif kind is Return:
+            new = Return(None if stmt.value is None else self.expr(stmt.value))
+        elif kind is If:
+            orelse = None if stmt.orelse is None else self.block(stmt.orelse)
+            new = If([(self.expr(cond), self.block(block)) for cond, block in stmt.branches], orelse)
+        elif kind is While:
+            new = While(self.expr(stmt.cond), self.block(stmt.body))
+        elif kind is DoWhile:
+            new = DoWhile(self.block(stmt.body), self.expr(stmt.cond))
+        elif kind is For:
+            if stmt.loop_type != 'variable':
+                items = [self.expr(item) for item in stmt.items]
+            elif self.slots is None:
+                items = stmt.items
+            else:
+                items = self.expr(Name(stmt.items))
+            slot = None if self.slots is None else self.slots[stmt.var]
+            reduction = stmt.reduction
+            if reduction is not None:
+                targets = reduction.targets if self.slots is None else \
+                    [self.slots[name] for name in reduction.targets]
+                reduction = reduction.resolved([self.expr(read) for read in reduction.reads], targets)
+            new = For(stmt.var, stmt.loop_type, items, self.block(stmt.body), slot, reduction)
+        else:
+            return stmt
+        new.indent = stmt.indent
+        new.lineno = stmt.lineno
+        return new
+
+def frame_slots(params, body):
+    """Slot of every local of a function and the frame size: parameters first, then assigned names"""
+    # A repeated parameter name refers to the last argument, as it did
+    # with dict frames.
+    slots = {name: index for index, (name, _) in enumerate(params)}
+    count = len(params)
+    for stmt in walk_statements(body):
+        if stmt.__class__ is Assign:
+            name = stmt.name
+        elif stmt.__class__ is For:
+            name = stmt.var
+        else:
+            continue
+        if name not in slots:
+            slots[name] = count
+            count += 1
+    return slots, count
+
+def resolve_function(params, body, return_type, specialized=None):
+    slots, nlocals = frame_slots(params, body)
+    resolver = Resolver(slots)
+    fast_body = None if specialized is None else resolver.block(specialized)
+    return ResolvedFunction(params, resolver.block(body), return_type, fast_body, nlocals)
+
+def compile_program(functions, main_block, specialized=None):
+    """Resolve every registered function and the main block; returns (resolved_functions, main_block)"""
+    specialized = specialized or {}
+    resolved = {}
+    for fname, (params, body, return_type) in functions.items():
+        resolved[fname] = resolve_function(params, body, return_type, specialized.get(fname))
+    return resolved, Resolver().block(main_block)
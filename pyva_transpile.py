@@ -0,0 +1,434 @@
+"""Translate PyVa programs into Python source and run them with compile()/exec"""
+import functools
+
+from pyva_compiler import (
+    Const, Name, UnaryOp, BinOp, Compare, BoolOp, Call, NativeBinOp, NativeCompare, List, Map, Subscript, Slice,
+    Assign, AssignItem, ExprStmt, Return, Break, Continue, If, While, DoWhile, For,
+    BUILTINS, BUILTIN_NAMES, ExecutionAborted, binary_op, compare_op, is_true, coerce_argument,
+    walk_statements, Program,
+)
+from pyva_list import PyvaList
+from pyva_map import PyvaMap
+
+TYPE_NAMES = {int: 'int', float: 'float', str: 'str', bool: 'bool', PyvaList: '_List', PyvaMap: '_Map'}
+
+# ---------------------------------------------------------------------------
+# Runtime support used by the generated code
+# ---------------------------------------------------------------------------
+
+def _neg(value):
+    try:
+        return -value
+    except TypeError:
+        return 0
+
+def _range(*args):
+    try:
+        bounds = [int(value) for value in args]
+        if len(bounds) == 1:
+            bounds.insert(0, 0)
+        return range(*bounds)
+    except (ValueError, TypeError) as e:
+        raise SyntaxError(f"Error in for loop: {e}")
+
+def _iterate(value):
+    try:
+        return iter(value)
+    except TypeError:
+        raise SyntaxError(f"Error in for loop: '{type(value).__name__}' object is not iterable")
+
+def _setitem(target, index, value):
+    target[index] = value
+
+def _undefined_variable(name):
+    raise NameError(f"Variable '{name}' not defined")
+
+def _undefined_function(name):
+    raise NameError(f"Function '{name}' not defined")
+
+def _arity_error(fname, expected, got):
+    raise ValueError(f"Function '{fname}' expects {expected} arguments, got {got}")
+
+def _memoized(interpreter, fname, params, func):
+    """Route the calls of a generated function through the interpreter's memo cache"""
+    param_types = [param_type for _, param_type in params]
+
+    def call(*args):
+        args = [arg if type(arg) is param_type else coerce_argument(arg, param_type)
+                for arg, param_type in zip(args, param_types)]
+        return interpreter.call_memoized(fname, args, func, *args)
+    return call
+
+# Shared helpers; run() adds print, input and error reporting bound to the
+# executing Interpreter.
+RUNTIME = {
+    '_binop': binary_op,
+    '_compare': compare_op,
+    '_truth': is_true,
+    '_neg': _neg,
+    '_coerce': coerce_argument,
+    '_range': _range,
+    '_iterate': _iterate,
+    '_setitem': _setitem,
+    '_List': PyvaList,
+    '_Map': PyvaMap,
+    '_undefined_variable': _undefined_variable,
+    '_undefined_function': _undefined_function,
+    '_arity_error': _arity_error,
+    '_Aborted': ExecutionAborted,
+}
+for _name, _builtin in BUILTINS.items():
+    RUNTIME[f'_builtin_{_name}'] = _builtin
+
+# ---------------------------------------------------------------------------
+# Code generator
+# ---------------------------------------------------------------------------
+
+def assigned_names(stmts):
+    names = []
+    for stmt in walk_statements(stmts):
+        if stmt.__class__ is Assign:
+            name = stmt.name
+        elif stmt.__class__ is For:
+            name = stmt.var
+        else:
+            continue
+        if name not in names:
+            names.append(name)
+    return names
+
+def continues_loop(stmts):
+    """Whether a loop body contains a 'continue' for that loop (not for a nested one)"""
+    for stmt in stmts:
+        if stmt.__class__ is Continue:
+            return True
+        if stmt.__class__ is If:
+            blocks = [block for _, block in stmt.branches]
+            if stmt.orelse is not None:
+                blocks.append(stmt.orelse)
+            if any(continues_loop(block) for block in blocks):
+                return True
+    return False
+
+def _is_simple(node):
+    return node.__class__ is Const or node.__class__ is Name
+
+def _is_int_const(node):
+    return node.__class__ is Const and type(node.value) is int
+
+class PythonGenerator:
+    """Emit Python source with the same semantics as the tree walking interpreter"""
+
+    def __init__(self, functions, main_block, specialized=None):
+        self.functions = functions
+        self.main_block = main_block
+        self.specialized = specialized or {}
+        self.main_names = set(assigned_names(main_block))
+        self.local_names = None
+        self.reductions = []
+        self.lines = []
+        # PyVa source line of each generated line, for the sampling profiler.
+        self.line_numbers = []
+        self.lineno = 0
+        self.level = 0
+        self.temp_count = 0
+
+    def line(self, text):
+        self.lines.append('    ' * self.level + text)
+        self.line_numbers.append(self.lineno)
+
+    def temp(self, prefix):
+        self.temp_count += 1
+        return f'_{prefix}{self.temp_count}'
+
+    # -- expressions -------------------------------------------------------
+
+    def name_ref(self, name):
+        if self.local_names is not None and name in self.local_names:
+            return f'v_{name}'
+        if name in self.main_names:
+            return f'v_{name}'
+        return repr(name)
+
+    def expr(self, node):
+        kind = node.__class__
+        if kind is Const:
+            return repr(node.value)
+        if kind is Name:
+            return self.name_ref(node.name)
+        if kind is BinOp:
+            return self.typed_op(node, '_binop', ('+', '-', '*'))
+        if kind is Compare:
+            return self.typed_op(node, '_compare', ('==', '!=', '<', '<=', '>', '>='))
+        if kind is NativeBinOp or kind is NativeCompare:
+            return f'({self.expr(node.left)} {node.op} {self.expr(node.right)})'
+        if kind is UnaryOp:
+            operand = self.expr(node.operand)
+            if node.op == 'not':
+                return f'(not {operand})'
+            return f'_neg({operand})'
+        if kind is BoolOp:
+            return f'bool({self.boolop(node)})'
+        if kind is Call:
+            return self.call(node)
+        if kind is List:
+            return f'_List([{", ".join(self.expr(item) for item in node.items)}])'
+        if kind is Map:
+            pairs = ', '.join(f'{self.expr(key)}: {self.expr(value)}' for key, value in zip(node.keys, node.values))
+            return f'_Map({{{pairs}}})'
+        if kind is Subscript:
+            return f'{self.expr(node.value)}[{self.expr(node.index)}]'
+        if kind is Slice:
+            start = '' if node.start is None else self.expr(node.start)
+            stop = '' if node.stop is None else self.expr(node.stop)
+            return f'{self.expr(node.value)}[{start}:{stop}]'
+        raise SyntaxError(f"Cannot transpile '{type(node).__name__}'")
+
+    def typed_op(self, node, helper, native_ops):
+        """Use the native operator when both operands are ints, the PyVa helper otherwise"""
+        left = self.expr(node.left)
+        right = self.expr(node.right)
+        generic = f'{helper}({node.op!r}, {left}, {right})'
+        if node.op not in native_ops or not (_is_simple(node.left) and _is_simple(node.right)):
+            return generic
+        if any(operand.__class__ is Const and not _is_int_const(operand) for operand in (node.left, node.right)):
+            return generic
+        checks = [f'type({code}) is int' for operand, code in ((node.left, left), (node.right, right))
+                  if not _is_int_const(operand)]
+        native = f'{left} {node.op} {right}'
+        if not checks:
+            return f'({native})'
+        return f'({native} if {" and ".join(checks)} else {generic})'
+
+    def boolop(self, node):
+        joiner = f' {node.op} '
+        return '(' + joiner.join(self.expr(value) for value in node.values) + ')'
+
+    def condition(self, node):
+        kind = node.__class__
+        if kind is Compare or kind is NativeCompare or (kind is UnaryOp and node.op == 'not'):
+            return self.expr(node)
+        if kind is BoolOp:
+            return self.boolop(node)
+        if kind is Const and type(node.value) is bool:
+            return repr(node.value)
+        return f'_truth({self.expr(node)})'
+
+    def call(self, node):
+        args = [self.expr(arg) for arg in node.args]
+        fname = node.fname
+        if fname in self.functions:
+            expected = len(self.functions[fname][0])
+            if expected != len(args):
+                return f'_arity_error({fname!r}, {expected}, {len(args)})'
+            return f'f_{fname}({", ".join(args)})'
+        if fname == 'print':
+            return f'print({", ".join(args)})'
+        if fname in BUILTIN_NAMES:
+            packed = ''.join(f'{arg}, ' for arg in args).rstrip()
+            return f'_builtin_{fname}(({packed}))'
+        return f'_undefined_function({fname!r})'
+
+    # -- statements ---------------------------------------------------------
+
+    def block(self, stmts):
+        # _B is the running Interpreter; charge the block's statements to
+        # its step budget on entry, as the other engines do.
+        self.line(f'_B.steps += {len(stmts) or 1}')
+        self.line('if _B.steps >= _B.next_check: _B.check_budget()')
+        for stmt in stmts:
+            self.lineno = stmt.lineno
+            kind = stmt.__class__
+            if kind is If:
+                self.if_block(stmt)
+            elif kind is While:
+                self.while_loop(stmt)
+            elif kind is For:
+                self.for_loop(stmt)
+            elif kind is DoWhile:
+                self.do_while_loop(stmt)
+            else:
+                self.simple(stmt)
+
+    def nested(self, stmts):
+        lineno = self.lineno
+        self.level += 1
+        self.block(stmts)
+        self.level -= 1
+        self.lineno = lineno
+
+    def simple(self, stmt):
+        kind = stmt.__class__
+        if kind is Break or kind is Continue:
+            self.line('break' if kind is Break else 'continue')
+            return
+        if kind is Assign:
+            code = f'v_{stmt.name} = {self.expr(stmt.value)}'
+        elif kind is AssignItem:
+            code = f'_setitem({self.expr(stmt.target)}, {self.expr(stmt.index)}, {self.expr(stmt.value)})'
+        elif kind is ExprStmt:
+            code = self.expr(stmt.expr)
+        elif kind is Return:
+            code = 'return None' if stmt.value is None else f'return {self.expr(stmt.value)}'
+        else:
+            raise SyntaxError(f"line {stmt.lineno}: Cannot transpile '{type(stmt).__name__}'")
+        self.line('try:')
+        self.line(f'    {code}  # line {stmt.lineno}')
+        self.line('except _Aborted:')
+        self.line('    raise')
+        self.line('except Exception as _e:')
+        self.line('    _report(_e)')
+
+    def if_block(self, node):
+        keyword = 'if'
+        for cond, block in node.branches:
+            self.line(f'{keyword} {self.condition(cond)}:')
+            self.nested(block)
+            keyword = 'elif'
+        if node.orelse is not None:
+            self.line('else:')
+            self.nested(node.orelse)
+
+    def while_loop(self, node):
+        self.line(f'while {self.condition(node.cond)}:')
+        self.nested(node.body)
+
+    def do_while_loop(self, node):
+        if not continues_loop(node.body):
+            self.line('while True:')
+            self.nested(node.body)
+            self.line(f'    if not {self.condition(node.cond)}:')
+            self.line('        break')
+            return
+        # The condition is skipped on the first pass, so 'continue' in the
+        # body still re-checks it exactly like the interpreter does.
+        started = self.temp('d')
+        self.line(f'{started} = False')
+        self.line('while True:')
+        self.line(f'    if {started} and not {self.condition(node.cond)}:')
+        self.line('        break')
+        self.line(f'    {started} = True')
+        self.nested(node.body)
+
+    def for_loop(self, node):
+        if node.loop_type == 'range':
+            iterable = f'_range({", ".join(self.expr(arg) for arg in node.items)})'
+            if node.reduction is not None:
+                self.reduced_loop(node, iterable)
+                return
+        elif node.loop_type == 'list':
+            iterable = f'[{", ".join(self.expr(item) for item in node.items)}]'
+        else:
+            ref = self.name_ref(node.items)
+            if ref.startswith('v_'):
+                iterable = f'_iterate({ref})'
+            else:
+                iterable = f'_undefined_variable({node.items!r})'
+        self.line(f'for v_{node.var} in {iterable}:')
+        self.nested(node.body)
+
+    def reduced_loop(self, node, iterable):
+        """Run the loop's Reduction (see run_compiled) and the loop itself only when it declines"""
+        reduction = node.reduction
+        values = self.temp('r')
+        results = self.temp('s')
+        reads = ''.join(f'{self.expr(read)}, ' for read in reduction.reads)
+        self.line(f'{values} = {iterable}')
+        self.line(f'{results} = _reductions[{len(self.reductions)}].run(_B, {values}, ({reads.rstrip()}))')
+        self.reductions.append(reduction)
+        self.line(f'if {results} is None:')
+        self.line(f'    for v_{node.var} in {values}:')
+        self.level += 1
+        self.nested(node.body)
+        self.level -= 1
+        self.line('else:')
+        self.line(f'    {", ".join(f"v_{name}" for name in reduction.targets)}, = {results}')
+
+    # -- program -------------------------------------------------------------
+
+    def function(self, fname, params, body):
+        param_names = [name for name, _ in params]
+        self.local_names = set(param_names) | set(assigned_names(body))
+        self.line(f'def f_{fname}({", ".join(f"v_{name}" for name in param_names)}):')
+        self.level += 1
+        for name, param_type in params:
+            type_name = TYPE_NAMES.get(param_type, 'str')
+            self.line(f'if type(v_{name}) is not {type_name}:')
+            self.line(f'    v_{name} = _coerce(v_{name}, {type_name})')
+        # Locals read before their first assignment fall back to the global
+        # (or to their own name), so seed them the same way.
+        for name in assigned_names(body):
+            if name in param_names:
+                continue
+            if name in self.main_names:
+                self.line(f'v_{name} = _G[{f"v_{name}"!r}]')
+            else:
+                self.line(f'v_{name} = {name!r}')
+        if fname in self.specialized:
+            # Only int and float coercions can fail and keep the argument.
+            checks = [f'type(v_{name}) is {TYPE_NAMES[param_type]}' for name, param_type in params
+                      if param_type is int or param_type is float]
+            self.line(f'if {" and ".join(checks)}:')
+            self.nested(self.specialized[fname])
+            self.line('else:')
+            self.nested(body)
+        else:
+            self.block(body)
+        self.level -= 1
+        self.local_names = None
+        self.line('')
+
+    def program(self):
+        self.line('# Generated from PyVa source by pyva_transpile')
+        self.line('_G = globals()')
+        for name in sorted(self.main_names):
+            self.line(f'v_{name} = {name!r}')
+        self.line('')
+        for fname, (params, body, return_type) in self.functions.items():
+            self.function(fname, params, body)
+        self.line('def _main():')
+        self.level += 1
+        if self.main_names:
+            self.line(f'global {", ".join(f"v_{name}" for name in sorted(self.main_names))}')
+        self.block(self.main_block)
+        self.level -= 1
+        return '\n'.join(self.lines) + '\n'
+
+def generate(functions, main_block, specialized=None):
+    """Python source for an already loaded program"""
+    return PythonGenerator(functions, main_block, specialized).program()
+
+def transpile(source_code, optimize=True):
+    """Translate PyVa source code into equivalent Python source code"""
+    program = Program(source_code, optimize)
+    return generate(program.functions, program.main_block, program.specialized)
+
+def compile_program(functions, main_block, specialized=None):
+    """Transpile and compile a loaded program; returns (code, main_names, reductions, line_numbers)"""
+    generator = PythonGenerator(functions, main_block, specialized)
+    code = compile(generator.program(), '<pyva>', 'exec')
+    return code, assigned_names(main_block), generator.reductions, generator.line_numbers
+
+def run_compiled(interpreter, compiled):
+    """Execute the (code, main_names, reductions, line_numbers) returned by compile_program"""
+    code, main_names, reductions, line_numbers = compiled
+    namespace = dict(RUNTIME)
+    namespace['_reductions'] = reductions
+    namespace['_line_numbers'] = line_numbers
+    namespace['print'] = functools.partial(print, file=interpreter.stdout)
+    namespace['_report'] = interpreter.report_error
+    namespace['_builtin_input'] = interpreter.builtin_input
+    namespace['_B'] = interpreter
+    exec(code, namespace)
+    # Calls look f_<name> up in the namespace, recursive ones included.
+    for fname in interpreter.memoized:
+        params = interpreter.functions[fname][0]
+        namespace[f'f_{fname}'] = _memoized(interpreter, fname, params, namespace[f'f_{fname}'])
+    result = namespace['_main']()
+    for name in main_names:
+        interpreter.global_vars[name] = namespace[f'v_{name}']
+    return result
+
+def run(interpreter, main_block):
+    """Transpile the program loaded into an Interpreter, compile it once and execute it"""
+    return run_compiled(interpreter, compile_program(interpreter.functions, main_block))
@@ -0,0 +1,291 @@
+"""Type inference over the block tree, so operations on operands of known types run natively"""
+from pyva_compiler import (
+    Const, Name, UnaryOp, BinOp, Compare, BoolOp, Call, NativeBinOp, NativeCompare, List, Map, Subscript, Slice,
+    Assign, AssignItem, ExprStmt, Return, If, While, DoWhile, For,
+    SAFE_BUILTINS, walk_statements,
+)
+from pyva_optimize import map_expr, map_block
+
+# Types are int, bool, float and str; None means unknown. PENDING marks a
+# name the fixpoint in solve() has not seen a value for yet.
+PENDING = object()
+
+INTEGRAL = (int, bool)
+NUMBERS = (int, bool, float)
+KNOWN_TYPES = (int, bool, float, str)
+
+# Builtins whose result type does not depend on their arguments; float()
+# is missing because it gives the int 0 when the conversion fails.
+BUILTIN_RESULTS = {'int': int, 'str': str, 'bool': bool, 'input': str, 'len': int, 'contains': bool}
+
+def join(a, b):
+    if a is PENDING:
+        return b
+    if b is PENDING or a is b:
+        return a
+    return None
+
+def binop_type(op, left, right):
+    """Type of binary_op's result for the operand types, None when it depends on the values"""
+    if op == '+' and (left is str or right is str):
+        return str
+    if left is None or right is None:
+        return None
+    if op == '+' or op == '-':
+        if left is str or right is str:
+            return int
+        return float if float in (left, right) else int
+    if op == '*':
+        if left is str or right is str:
+            # Repetition needs an integral count, anything else fails to 0.
+            return str if left in INTEGRAL or right in INTEGRAL else int
+        if left in INTEGRAL and right in INTEGRAL:
+            return int
+        if left is float and right is float:
+            return float
+        return None
+    if op == '%':
+        if left in INTEGRAL and right in INTEGRAL:
+            return int
+        # A string on the left is a format string.
+        return int if right is str and left is not str else None
+    if op == '/' and (left is str or right is str):
+        return int
+    return None
+
+def is_native_binop(op, left, right):
+    """Whether the plain Python operator gives exactly binary_op's result for these operand types"""
+    if op == '+' or op == '-':
+        if left in NUMBERS and right in NUMBERS:
+            return True
+        return op == '+' and left is str and right is str
+    if op == '*':
+        return (left in INTEGRAL and right in INTEGRAL) or (left is float and right is float)
+    return False
+
+class TypeInference:
+    """Infer the types of a program's names and rewrite its typed operations into native ones"""
+
+    def __init__(self, functions):
+        self.functions = functions
+        self.native_count = 0
+
+    # -- expressions -------------------------------------------------------------
+
+    def expr_type(self, node, types):
+        kind = node.__class__
+        if kind is Const:
+            value_type = type(node.value)
+            return value_type if value_type in KNOWN_TYPES else None
+        if kind is Name:
+            return types.get(node.name)
+        if kind is BinOp or kind is NativeBinOp:
+            left = self.expr_type(node.left, types)
+            right = self.expr_type(node.right, types)
+            if left is PENDING or right is PENDING:
+                return PENDING
+            return binop_type(node.op, left, right)
+        if kind is Compare or kind is NativeCompare or kind is BoolOp:
+            return bool
+        if kind is UnaryOp:
+            if node.op == 'not':
+                return bool
+            operand = self.expr_type(node.operand, types)
+            if operand in INTEGRAL or operand is str:
+                return int
+            return operand
+        if kind is Call and node.fname not in self.functions:
+            return BUILTIN_RESULTS.get(node.fname)
+        return None
+
+    def may_raise(self, node, types):
+        """Whether evaluating an expression can raise, which leaves its assignment undone"""
+        kind = node.__class__
+        if kind is Call:
+            if node.fname in self.functions or node.fname not in SAFE_BUILTINS:
+                return True
+            return any(self.may_raise(arg, types) for arg in node.args)
+        if kind is Subscript or kind is Slice:
+            return True
+        if kind is List:
+            return any(self.may_raise(item, types) for item in node.items)
+        if kind is Map:
+            # Only a key that is no constant may turn out unhashable.
+            if any(key.__class__ is not Const for key in node.keys):
+                return True
+            return any(self.may_raise(value, types) for value in node.values)
+        if kind is BinOp or kind is Compare:
+            if kind is BinOp and (node.op == '+' or node.op == '-'):
+                # binary_op only catches the TypeError, and an int too big
+                # for a float overflows when mixed with one.
+                left = self.expr_type(node.left, types)
+                right = self.expr_type(node.right, types)
+                if left is not str and right is not str:
+                    if left is None or right is None or (float in (left, right) and
+                                                         (left in INTEGRAL or right in INTEGRAL)):
+                        return True
+            return self.may_raise(node.left, types) or self.may_raise(node.right, types)
+        if kind is UnaryOp:
+            return self.may_raise(node.operand, types)
+        if kind is BoolOp:
+            return any(self.may_raise(value, types) for value in node.values)
+        return False
+
+    # -- inference ---------------------------------------------------------------
+
+    def infer(self, stmts, known):
+        """Types of the names of one function body (or the main block), given the parameter types.
+
+        A name gets a type only if every value assigned to it has that type
+        and it is never read where it may still be unassigned, because such
+        a read falls back to the global or to the name itself.
+        """
+        assignments = []
+        for stmt in walk_statements(stmts):
+            if stmt.__class__ is Assign:
+                assignments.append((stmt.name, stmt.value))
+            elif stmt.__class__ is For:
+                # Range loops count with ints; list items can be anything.
+                assignments.append((stmt.var, Const(0) if stmt.loop_type == 'range' else None))
+        unsafe = set()
+        while True:
+            types = self.solve(assignments, known, unsafe)
+            found = set()
+            self.scan(stmts, set(known), types, found)
+            if found <= unsafe:
+                return types
+            unsafe |= found
+
+    def solve(self, assignments, known, unsafe):
+        types = {name: PENDING for name, _ in assignments}
+        types.update(known)
+        for name in unsafe:
+            types[name] = None
+        changed = True
+        while changed:
+            changed = False
+            for name, value in assignments:
+                old = types[name]
+                if old is None:
+                    continue
+                new = join(old, None if value is None else self.expr_type(value, types))
+                if new is not old:
+                    types[name] = new
+                    changed = True
+        return {name: None if value_type is PENDING else value_type for name, value_type in types.items()}
+
+    def scan(self, stmts, defined, types, found):
+        """Collect into found the names read where they may be unassigned; returns the names assigned after the block"""
+        defined = set(defined)
+        for stmt in stmts:
+            kind = stmt.__class__
+            if kind is Assign:
+                self.reads(stmt.value, defined, found)
+                if not self.may_raise(stmt.value, types):
+                    defined.add(stmt.name)
+            elif kind is AssignItem:
+                self.reads(stmt.target, defined, found)
+                self.reads(stmt.index, defined, found)
+                self.reads(stmt.value, defined, found)
+            elif kind is ExprStmt:
+                self.reads(stmt.expr, defined, found)
+            elif kind is Return:
+                if stmt.value is not None:
+                    self.reads(stmt.value, defined, found)
+            elif kind is If:
+                outcomes = []
+                for cond, block in stmt.branches:
+                    self.reads(cond, defined, found)
+                    outcomes.append(self.scan(block, defined, types, found))
+                if stmt.orelse is None:
+                    outcomes.append(defined)
+                else:
+                    outcomes.append(self.scan(stmt.orelse, defined, types, found))
+                defined = set.intersection(*outcomes)
+            elif kind is While:
+                # Loops may run zero times (or break early), so what their
+                # bodies assign does not count afterwards.
+                self.reads(stmt.cond, defined, found)
+                self.scan(stmt.body, defined, types, found)
+            elif kind is DoWhile:
+                self.scan(stmt.body, defined, types, found)
+                self.reads(stmt.cond, defined, found)
+            elif kind is For:
+                if stmt.loop_type == 'variable':
+                    self.reads(Name(stmt.items), defined, found)
+                else:
+                    for item in stmt.items:
+                        self.reads(item, defined, found)
+                self.scan(stmt.body, defined | {stmt.var}, types, found)
+        return defined
+
+    def reads(self, node, defined, found):
+        kind = node.__class__
+        if kind is Name:
+            if node.name not in defined:
+                found.add(node.name)
+        elif kind is BinOp or kind is Compare:
+            self.reads(node.left, defined, found)
+            self.reads(node.right, defined, found)
+        elif kind is UnaryOp:
+            self.reads(node.operand, defined, found)
+        elif kind is BoolOp or kind is Call:
+            for child in (node.values if kind is BoolOp else node.args):
+                self.reads(child, defined, found)
+        elif kind is List or kind is Map:
+            for item in (node.items if kind is List else node.keys + node.values):
+                self.reads(item, defined, found)
+        elif kind is Subscript:
+            self.reads(node.value, defined, found)
+            self.reads(node.index, defined, found)
+        elif kind is Slice:
+            for child in (node.value, node.start, node.stop):
+                if child is not None:
+                    self.reads(child, defined, found)
+
+    # -- rewriting ---------------------------------------------------------------
+
+    def specialize(self, node, types):
+        node = map_expr(node, lambda child: self.specialize(child, types))
+        kind = node.__class__
+        if kind is BinOp or kind is Compare:
+            left = self.expr_type(node.left, types)
+            right = self.expr_type(node.right, types)
+            if kind is BinOp and is_native_binop(node.op, left, right):
+                self.native_count += 1
+                return NativeBinOp(node.op, node.left, node.right)
+            if kind is Compare and left in NUMBERS and right in NUMBERS:
+                self.native_count += 1
+                return NativeCompare(node.op, node.left, node.right)
+        return node
+
+    def block(self, stmts, known):
+        """Specialized copy of a block, or None if nothing in it has known operand types"""
+        types = self.infer(stmts, known)
+        count = self.native_count
+        result = map_block(stmts, lambda node: self.specialize(node, types))
+        return result if self.native_count > count else None
+
+def specialize_program(functions, main_block):
+    """Specialize a program's block trees; returns (main_block, specialized).
+
+    Coercion always turns arguments into str, bool and lists, so functions
+    with only such parameters are rewritten in place, like the main block. An
+    int or float argument that fails to convert is kept as it is, so those
+    functions keep their generic body and their specialized one goes into
+    specialized, for the engines to run when all arguments have their
+    declared types.
+    """
+    inference = TypeInference(functions)
+    specialized = {}
+    for fname, (params, body, return_type) in list(functions.items()):
+        # List parameters count as assigned, of no type the inference tracks.
+        known = {name: (param_type if param_type in KNOWN_TYPES else None) for name, param_type in params}
+        fast_body = inference.block(body, known)
+        if fast_body is None:
+            continue
+        if any(param_type is int or param_type is float for _, param_type in params):
+            specialized[fname] = fast_body
+        else:
+            functions[fname] = (params, fast_body, return_type)
+    return inference.block(main_block, {}) or main_block, specialized
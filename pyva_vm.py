@@ -0,0 +1,804 @@
+"""Bytecode compiler and stack-based virtual machine for PyVa"""
+import operator
+
+from pyva_compiler import (
+    Const, Name, UnaryOp, BinOp, Compare, BoolOp, Call, NativeBinOp, NativeCompare, List, Map, Subscript, Slice,
+    Assign, AssignItem, ExprStmt, Return, Break, Continue, If, While, DoWhile, For,
+    BUILTIN_NAMES, UNBOUND, ExecutionAborted, memo_key, binary_op, compare_op, is_true, coerce_argument,
+    walk_statements,
+)
+from pyva_list import PyvaList
+from pyva_map import PyvaMap
+
+# Opcodes, numbered in the order the dispatch loop tests them; the hot
+# ones come first so the common case takes few comparisons.
+LOAD_FAST = 0
+LOAD_CONST = 1
+STORE_FAST = 2
+BINARY_ADD = 3
+COMPARE_JUMP = 4
+NATIVE_OP = 5
+NATIVE_COMPARE_JUMP = 6
+JUMP = 7
+FOR_ITER = 8
+BINARY_SUB = 9
+BINARY_MUL = 10
+BINARY_OP = 11
+CHARGE = 12
+LOAD_GLOBAL = 13
+STORE_GLOBAL = 14
+CALL_FUNCTION = 15
+RETURN_VALUE = 16
+TAIL_CALL = 17
+CALL_BUILTIN = 18
+SUBSCRIPT = 19
+POP_TOP = 20
+POP_JUMP_IF_FALSE = 21
+LOAD_NAME = 22
+COMPARE_OP = 23
+UNARY_NEG = 24
+UNARY_NOT = 25
+JUMP_IF_FALSY = 26
+JUMP_IF_TRUTHY = 27
+TO_BOOL = 28
+MAKE_RANGE = 29
+BUILD_LIST = 30
+LOAD_ITERABLE = 31
+GET_ITER = 32
+CALL_UNKNOWN = 33
+REDUCE_RANGE = 34
+MAKE_LIST = 35
+SLICE = 36
+STORE_SUBSCRIPT = 37
+MAKE_MAP = 38
+
+# Deepest PyVa call nesting; calls live on the VM's own frame stack, not
+# on Python's.
+MAX_CALL_DEPTH = 100000
+
+OPNAMES = {value: name for name, value in globals().items() if name.isupper() and isinstance(value, int)}
+
+BINARY_OPCODES = {
+    '+': BINARY_ADD,
+    '-': BINARY_SUB,
+    '*': BINARY_MUL,
+}
+
+COMPARE_FUNCS = {
+    '==': operator.eq,
+    '!=': operator.ne,
+    '<': operator.lt,
+    '<=': operator.le,
+    '>': operator.gt,
+    '>=': operator.ge,
+}
+
+class CodeObject:
+    """Compiled form of one function (or of the main block).
+
+    A function with a type-specialized body also carries its compiled form
+    in specialized, run when every argument has its declared type.
+    """
+
+    def __init__(self, name, params, return_type='void'):
+        self.name = name
+        self.params = params
+        self.return_type = return_type
+        self.instructions = []
+        self.consts = []
+        self.names = []
+        self.varnames = [param_name for param_name, _ in params]
+        self.handlers = []
+        self.lines = []
+        self.specialized = None
+
+    @property
+    def nlocals(self):
+        return len(self.varnames)
+
+    def __repr__(self):
+        return f'<CodeObject {self.name} ({len(self.instructions)} instructions)>'
+
+class Compiler:
+    """Translate the parsed statements of one function into a CodeObject"""
+
+    def __init__(self, code, function_names, is_main=False):
+        self.code = code
+        self.function_names = function_names
+        self.is_main = is_main
+        self.loops = []
+        self.iter_depth = 0
+        self.lineno = 0
+        self._const_index = {}
+
+    # -- emission helpers -------------------------------------------------
+
+    def emit(self, op, arg=None):
+        code = self.code
+        code.instructions.append((op, arg))
+        code.handlers.append(None)
+        code.lines.append(self.lineno)
+        return len(code.instructions) - 1
+
+    def here(self):
+        return len(self.code.instructions)
+
+    def patch(self, index, target):
+        op, arg = self.code.instructions[index]
+        if op == COMPARE_JUMP:
+            arg = (arg[0], arg[1], target)
+        elif op == NATIVE_COMPARE_JUMP or op == REDUCE_RANGE:
+            arg = (arg[0], target)
+        else:
+            arg = target
+        self.code.instructions[index] = (op, arg)
+
+    def const(self, value):
+        # 0.0 and -0.0 are equal but print differently, so floats go by repr.
+        key = (type(value), repr(value) if type(value) is float else value)
+        index = self._const_index.get(key)
+        if index is None:
+            index = len(self.code.consts)
+            self.code.consts.append(value)
+            self._const_index[key] = index
+        return index
+
+    def name_index(self, name):
+        names = self.code.names
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    def slot(self, name):
+        varnames = self.code.varnames
+        if name not in varnames:
+            varnames.append(name)
+        return varnames.index(name)
+
+    def emit_store(self, name):
+        if self.is_main:
+            self.emit(STORE_GLOBAL, self.name_index(name))
+        else:
+            self.emit(STORE_FAST, self.slot(name))
+
+    # -- expressions -------------------------------------------------------
+
+    def compile_expr(self, node):
+        kind = node.__class__
+        if kind is Const:
+            self.emit(LOAD_CONST, self.const(node.value))
+        elif kind is Name:
+            if self.is_main:
+                self.emit(LOAD_GLOBAL, self.name_index(node.name))
+            elif node.name in self.code.varnames:
+                self.emit(LOAD_FAST, self.slot(node.name))
+            else:
+                self.emit(LOAD_NAME, self.name_index(node.name))
+        elif kind is BinOp:
+            self.compile_expr(node.left)
+            self.compile_expr(node.right)
+            if node.op in BINARY_OPCODES:
+                self.emit(BINARY_OPCODES[node.op])
+            else:
+                self.emit(BINARY_OP, node.op)
+        elif kind is Compare:
+            self.compile_expr(node.left)
+            self.compile_expr(node.right)
+            self.emit(COMPARE_OP, node.op)
+        elif kind is NativeBinOp or kind is NativeCompare:
+            self.compile_expr(node.left)
+            self.compile_expr(node.right)
+            self.emit(NATIVE_OP, node.func)
+        elif kind is UnaryOp:
+            self.compile_expr(node.operand)
+            self.emit(UNARY_NOT if node.op == 'not' else UNARY_NEG)
+        elif kind is BoolOp:
+            self.compile_boolop(node)
+        elif kind is Call:
+            for arg in node.args:
+                self.compile_expr(arg)
+            argc = len(node.args)
+            if node.fname in self.function_names:
+                self.emit(CALL_FUNCTION, (node.fname, argc))
+            elif node.fname in BUILTIN_NAMES:
+                self.emit(CALL_BUILTIN, (node.fname, argc))
+            else:
+                self.emit(CALL_UNKNOWN, (node.fname, argc))
+        elif kind is List:
+            for item in node.items:
+                self.compile_expr(item)
+            self.emit(MAKE_LIST, len(node.items))
+        elif kind is Map:
+            for key, value in zip(node.keys, node.values):
+                self.compile_expr(key)
+                self.compile_expr(value)
+            self.emit(MAKE_MAP, len(node.keys))
+        elif kind is Subscript:
+            self.compile_expr(node.value)
+            self.compile_expr(node.index)
+            self.emit(SUBSCRIPT)
+        elif kind is Slice:
+            self.compile_expr(node.value)
+            for bound in (node.start, node.stop):
+                if bound is None:
+                    self.emit(LOAD_CONST, self.const(None))
+                else:
+                    self.compile_expr(bound)
+            self.emit(SLICE)
+        else:
+            raise SyntaxError(f"Cannot compile '{type(node).__name__}'")
+
+    def compile_jump_if_false(self, cond):
+        """Compile a condition followed by a forward jump taken when it is false"""
+        if cond.__class__ is Compare:
+            self.compile_expr(cond.left)
+            self.compile_expr(cond.right)
+            return self.emit(COMPARE_JUMP, (COMPARE_FUNCS[cond.op], cond.op, None))
+        if cond.__class__ is NativeCompare:
+            self.compile_expr(cond.left)
+            self.compile_expr(cond.right)
+            return self.emit(NATIVE_COMPARE_JUMP, (cond.func, None))
+        self.compile_expr(cond)
+        return self.emit(POP_JUMP_IF_FALSE)
+
+    def compile_boolop(self, node):
+        """'and'/'or' short-circuit like the tree walker and always produce a bool"""
+        jump_op = JUMP_IF_FALSY if node.op == 'and' else JUMP_IF_TRUTHY
+        short_jumps = []
+        for value in node.values[:-1]:
+            self.compile_expr(value)
+            short_jumps.append(self.emit(jump_op))
+        self.compile_expr(node.values[-1])
+        self.emit(TO_BOOL)
+        end_jump = self.emit(JUMP)
+        for index in short_jumps:
+            self.patch(index, self.here())
+        self.emit(LOAD_CONST, self.const(node.op == 'or'))
+        self.patch(end_jump, self.here())
+
+    # -- statements ---------------------------------------------------------
+
+    def compile_block(self, stmts):
+        # Pay for the block's statements up front, like the tree walker.
+        self.emit(CHARGE, len(stmts) or 1)
+        for stmt in stmts:
+            self.lineno = stmt.lineno
+            kind = stmt.__class__
+            if kind is If:
+                self.compile_if(stmt)
+            elif kind is While:
+                self.compile_while(stmt)
+            elif kind is For:
+                self.compile_for(stmt)
+            elif kind is DoWhile:
+                self.compile_do_while(stmt)
+            else:
+                self.compile_simple(stmt)
+
+    def compile_simple(self, stmt):
+        """Compile a statement whose runtime errors are reported and skipped"""
+        start = self.here()
+        kind = stmt.__class__
+        if kind is Assign:
+            self.compile_expr(stmt.value)
+            self.emit_store(stmt.name)
+        elif kind is AssignItem:
+            self.compile_expr(stmt.target)
+            self.compile_expr(stmt.index)
+            self.compile_expr(stmt.value)
+            self.emit(STORE_SUBSCRIPT)
+        elif kind is ExprStmt:
+            self.compile_expr(stmt.expr)
+            self.emit(POP_TOP)
+        elif kind is Return:
+            if stmt.value is None:
+                self.emit(LOAD_CONST, self.const(None))
+            else:
+                self.compile_expr(stmt.value)
+            self.emit(RETURN_VALUE)
+        elif kind is Break or kind is Continue:
+            loop = self.loops[-1]
+            if kind is Break:
+                if loop['is_for']:
+                    self.emit(POP_TOP)
+                loop['breaks'].append(self.emit(JUMP))
+            else:
+                loop['continues'].append(self.emit(JUMP))
+        end = self.here()
+        handler = (end, self.iter_depth)
+        for pc in range(start, end):
+            self.code.handlers[pc] = handler
+
+    def compile_if(self, node):
+        end_jumps = []
+        for cond, block in node.branches:
+            skip = self.compile_jump_if_false(cond)
+            self.compile_block(block)
+            end_jumps.append(self.emit(JUMP))
+            self.patch(skip, self.here())
+        if node.orelse is not None:
+            self.compile_block(node.orelse)
+        for index in end_jumps:
+            self.patch(index, self.here())
+
+    def enter_loop(self, is_for):
+        loop = {'is_for': is_for, 'breaks': [], 'continues': []}
+        self.loops.append(loop)
+        return loop
+
+    def exit_loop(self, loop, continue_target, exit_target):
+        self.loops.pop()
+        for index in loop['continues']:
+            self.patch(index, continue_target)
+        for index in loop['breaks']:
+            self.patch(index, exit_target)
+
+    def compile_while(self, node):
+        top = self.here()
+        exit_jump = self.compile_jump_if_false(node.cond)
+        loop = self.enter_loop(False)
+        self.compile_block(node.body)
+        self.emit(JUMP, top)
+        exit_target = self.here()
+        self.patch(exit_jump, exit_target)
+        self.exit_loop(loop, top, exit_target)
+
+    def compile_do_while(self, node):
+        top = self.here()
+        loop = self.enter_loop(False)
+        self.compile_block(node.body)
+        continue_target = self.here()
+        exit_jump = self.compile_jump_if_false(node.cond)
+        self.emit(JUMP, top)
+        exit_target = self.here()
+        self.patch(exit_jump, exit_target)
+        self.exit_loop(loop, continue_target, exit_target)
+
+    def compile_for(self, node):
+        reduced_jump = None
+        if node.loop_type == 'range':
+            for arg in node.items:
+                self.compile_expr(arg)
+            self.emit(MAKE_RANGE, len(node.items))
+            if node.reduction is not None:
+                reduced_jump = self.compile_reduction(node.reduction)
+        elif node.loop_type == 'list':
+            for item in node.items:
+                self.compile_expr(item)
+            self.emit(BUILD_LIST, len(node.items))
+        else:
+            if self.is_main:
+                self.emit(LOAD_ITERABLE, (None, node.items))
+            else:
+                slot = self.slot(node.items) if node.items in self.code.varnames else None
+                self.emit(LOAD_ITERABLE, (slot, node.items))
+        self.emit(GET_ITER)
+        top = self.here()
+        next_jump = self.emit(FOR_ITER)
+        self.emit_store(node.var)
+        loop = self.enter_loop(True)
+        self.iter_depth += 1
+        self.compile_block(node.body)
+        self.iter_depth -= 1
+        self.emit(JUMP, top)
+        exit_target = self.here()
+        self.patch(next_jump, exit_target)
+        self.exit_loop(loop, top, exit_target)
+        if reduced_jump is not None:
+            self.patch(reduced_jump, exit_target)
+
+    def compile_reduction(self, reduction):
+        """Try the loop's Reduction on the range on the stack; returns the jump past the loop taken when it applies"""
+        for read in reduction.reads:
+            self.compile_expr(read)
+        fallback_jump = self.emit(REDUCE_RANGE, (reduction, None))
+        for name in reversed(reduction.targets):
+            self.emit_store(name)
+        reduced_jump = self.emit(JUMP)
+        self.patch(fallback_jump, self.here())
+        return reduced_jump
+
+def compile_function(name, params, body, return_type, function_names):
+    code = CodeObject(name, params, return_type)
+    compiler = Compiler(code, function_names)
+    # Every assigned name gets a slot up front so reads before the first
+    # assignment still resolve to the local.
+    for stmt in walk_statements(body):
+        if stmt.__class__ is Assign:
+            compiler.slot(stmt.name)
+        elif stmt.__class__ is For:
+            compiler.slot(stmt.var)
+    compiler.compile_block(body)
+    compiler.emit(LOAD_CONST, compiler.const(None))
+    compiler.emit(RETURN_VALUE)
+    mark_tail_calls(code)
+    return code
+
+def returns_none(code, pc):
+    """Whether execution from pc only jumps, then returns None"""
+    instructions = code.instructions
+    seen = set()
+    while instructions[pc][0] == JUMP and pc not in seen:
+        seen.add(pc)
+        pc = instructions[pc][1]
+    op, arg = instructions[pc]
+    return op == LOAD_CONST and code.consts[arg] is None and instructions[pc + 1][0] == RETURN_VALUE
+
+def mark_tail_calls(code):
+    """Turn the calls of 'return f(...)' statements into TAIL_CALL where that keeps the semantics.
+
+    An error escaping the callee is reported by the 'return' statement,
+    which then carries on after it. A tail call is only used where that
+    means returning None, which the VM can do without the replaced frame.
+    """
+    instructions = code.instructions
+    for pc in range(len(instructions) - 1):
+        op, arg = instructions[pc]
+        if op == CALL_FUNCTION and instructions[pc + 1][0] == RETURN_VALUE:
+            handler = code.handlers[pc]
+            if handler is not None and returns_none(code, handler[0]):
+                instructions[pc] = (TAIL_CALL, arg)
+
+def compile_program(functions, main_block, specialized=None):
+    """Compile every registered function and the main block; returns (codes, main_code)"""
+    function_names = set(functions)
+    codes = {}
+    for fname, (params, body, return_type) in functions.items():
+        code = compile_function(fname, params, body, return_type, function_names)
+        if specialized and fname in specialized:
+            code.specialized = compile_function(fname, params, specialized[fname], return_type, function_names)
+        codes[fname] = code
+    main_code = CodeObject('<main>', [])
+    compiler = Compiler(main_code, function_names, is_main=True)
+    compiler.compile_block(main_block)
+    compiler.emit(LOAD_CONST, compiler.const(None))
+    compiler.emit(RETURN_VALUE)
+    return codes, main_code
+
+def disassemble(code):
+    """Human readable listing of a CodeObject"""
+    lines = [f'Disassembly of {code.name}:']
+    for pc, (op, arg) in enumerate(code.instructions):
+        text = f'{code.lines[pc]:>5} {pc:>5} {OPNAMES[op]:<18}'
+        if op == LOAD_CONST:
+            text += f'{arg} ({code.consts[arg]!r})'
+        elif op in (LOAD_GLOBAL, STORE_GLOBAL, LOAD_NAME):
+            text += f'{arg} ({code.names[arg]})'
+        elif op in (LOAD_FAST, STORE_FAST):
+            text += f'{arg} ({code.varnames[arg]})'
+        elif op in (CALL_BUILTIN, CALL_FUNCTION, TAIL_CALL):
+            text += f'{arg[0]}/{arg[1]}'
+        elif op == NATIVE_OP:
+            text += arg.__name__
+        elif op == NATIVE_COMPARE_JUMP:
+            text += f'{arg[0].__name__} {arg[1]}'
+        elif op == REDUCE_RANGE:
+            text += f'{", ".join(arg[0].targets)} {arg[1]}'
+        elif arg is not None:
+            text += str(arg)
+        lines.append(text.rstrip())
+    return '\n'.join(lines)
+
+class VirtualMachine:
+    """Dispatch loop executing compiled PyVa code.
+
+    PyVa calls push frames onto a list instead of recursing in Python, so
+    the call depth is only bounded by MAX_CALL_DEPTH, and tail calls reuse
+    the caller's slot on it.
+    """
+
+    def __init__(self, codes, interpreter):
+        self.codes = codes
+        self.interpreter = interpreter
+        self.global_vars = interpreter.global_vars
+        self.builtins = interpreter.builtins
+
+    def call(self, fname, args):
+        return self.run(*self.enter(fname, args))
+
+    def enter(self, fname, args):
+        """Code and fast locals for a call of fname, its arguments coerced to the parameter types"""
+        code = self.codes[fname]
+        params = code.params
+        if len(params) != len(args):
+            raise ValueError(f"Function '{fname}' expects {len(params)} arguments, got {len(args)}")
+        fast = [UNBOUND] * code.nlocals
+        typed = True
+        for index, (arg, (_, param_type)) in enumerate(zip(args, params)):
+            if type(arg) is not param_type:
+                arg = coerce_argument(arg, param_type)
+                if type(arg) is not param_type:
+                    typed = False
+            fast[index] = arg
+        if typed and code.specialized is not None:
+            code = code.specialized
+        return code, fast
+
+    def run(self, code, fast=None):
+        if fast is None:
+            fast = [UNBOUND] * code.nlocals
+        instructions = code.instructions
+        consts = code.consts
+        names = code.names
+        global_vars = self.global_vars
+        interpreter = self.interpreter
+        memo = interpreter.memo
+        memoized = interpreter.memoized
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = 0
+        # Suspended callers as (code, fast, stack, pc, pending, tail).
+        # pending links the (key, error count, outer) of the memoized calls
+        # the running frame returns for, several after tail calls; tail
+        # marks a frame that replaced its caller through a tail call.
+        frames = []
+        pending = None
+        tail = False
+        while True:
+            try:
+                while True:
+                    op, arg = instructions[pc]
+                    pc += 1
+                    if op < 9:
+                        if op == LOAD_FAST:
+                            value = fast[arg]
+                            if value is UNBOUND:
+                                name = code.varnames[arg]
+                                value = global_vars.get(name, name)
+                            push(value)
+                        elif op == LOAD_CONST:
+                            push(consts[arg])
+                        elif op == STORE_FAST:
+                            fast[arg] = pop()
+                        elif op == BINARY_ADD:
+                            right = pop()
+                            left = stack[-1]
+                            if type(left) is int and type(right) is int:
+                                stack[-1] = left + right
+                            else:
+                                stack[-1] = binary_op('+', left, right)
+                        elif op == COMPARE_JUMP:
+                            right = pop()
+                            left = pop()
+                            func, op_name, target = arg
+                            if type(left) is int and type(right) is int:
+                                if not func(left, right):
+                                    pc = target
+                            elif not compare_op(op_name, left, right):
+                                pc = target
+                        elif op == NATIVE_OP:
+                            right = pop()
+                            stack[-1] = arg(stack[-1], right)
+                        elif op == NATIVE_COMPARE_JUMP:
+                            right = pop()
+                            if not arg[0](pop(), right):
+                                pc = arg[1]
+                        elif op == JUMP:
+                            pc = arg
+                        else:
+                            try:
+                                push(next(stack[-1]))
+                            except StopIteration:
+                                pop()
+                                pc = arg
+                    elif op < 18:
+                        if op == BINARY_SUB:
+                            right = pop()
+                            left = stack[-1]
+                            if type(left) is int and type(right) is int:
+                                stack[-1] = left - right
+                            else:
+                                stack[-1] = binary_op('-', left, right)
+                        elif op == BINARY_MUL:
+                            right = pop()
+                            left = stack[-1]
+                            if type(left) is int and type(right) is int:
+                                stack[-1] = left * right
+                            else:
+                                stack[-1] = binary_op('*', left, right)
+                        elif op == BINARY_OP:
+                            right = pop()
+                            stack[-1] = binary_op(arg, stack[-1], right)
+                        elif op == CHARGE:
+                            interpreter.steps += arg
+                            if interpreter.steps >= interpreter.next_check:
+                                interpreter.check_budget()
+                        elif op == LOAD_GLOBAL:
+                            name = names[arg]
+                            push(global_vars.get(name, name))
+                        elif op == STORE_GLOBAL:
+                            global_vars[names[arg]] = pop()
+                        elif op == RETURN_VALUE:
+                            value = pop()
+                            while pending is not None:
+                                key, errors, pending = pending
+                                if interpreter.errors == errors:
+                                    memo.put(key, value)
+                            if not frames:
+                                return value
+                            code, fast, stack, pc, pending, tail = frames.pop()
+                            instructions = code.instructions
+                            consts = code.consts
+                            names = code.names
+                            push = stack.append
+                            pop = stack.pop
+                            push(value)
+                        else:
+                            # CALL_FUNCTION, or TAIL_CALL for 'return f(...)'
+                            fname, argc = arg
+                            if argc:
+                                args = stack[-argc:]
+                                del stack[-argc:]
+                            else:
+                                args = []
+                            callee, callee_fast = self.enter(fname, args)
+                            callee_pending = None if op == CALL_FUNCTION else pending
+                            if fname in memoized:
+                                try:
+                                    key = memo_key(fname, callee_fast[:len(callee.params)])
+                                    value = memo.get(key, UNBOUND)
+                                except TypeError:
+                                    value = UNBOUND
+                                else:
+                                    callee_pending = (key, interpreter.errors, callee_pending)
+                                if value is not UNBOUND:
+                                    push(value)
+                                    continue
+                            if op == CALL_FUNCTION:
+                                if len(frames) >= MAX_CALL_DEPTH:
+                                    raise RecursionError("maximum recursion depth exceeded")
+                                frames.append((code, fast, stack, pc, pending, tail))
+                                tail = False
+                            else:
+                                tail = True
+                            code = callee
+                            fast = callee_fast
+                            pending = callee_pending
+                            instructions = code.instructions
+                            consts = code.consts
+                            names = code.names
+                            stack = []
+                            push = stack.append
+                            pop = stack.pop
+                            pc = 0
+                    elif op == CALL_BUILTIN:
+                        fname, argc = arg
+                        if argc:
+                            args = stack[-argc:]
+                            del stack[-argc:]
+                        else:
+                            args = []
+                        push(self.builtins[fname](args))
+                    elif op == SUBSCRIPT:
+                        index = pop()
+                        stack[-1] = stack[-1][index]
+                    elif op == POP_TOP:
+                        pop()
+                    elif op == POP_JUMP_IF_FALSE:
+                        value = pop()
+                        if value is not True and (value is False or not is_true(value)):
+                            pc = arg
+                    elif op == LOAD_NAME:
+                        name = names[arg]
+                        push(global_vars.get(name, name))
+                    elif op == COMPARE_OP:
+                        right = pop()
+                        stack[-1] = compare_op(arg, stack[-1], right)
+                    elif op == UNARY_NEG:
+                        try:
+                            stack[-1] = -stack[-1]
+                        except TypeError:
+                            stack[-1] = 0
+                    elif op == UNARY_NOT:
+                        stack[-1] = not stack[-1]
+                    elif op == JUMP_IF_FALSY:
+                        if not pop():
+                            pc = arg
+                    elif op == JUMP_IF_TRUTHY:
+                        if pop():
+                            pc = arg
+                    elif op == TO_BOOL:
+                        stack[-1] = bool(stack[-1])
+                    elif op == MAKE_RANGE:
+                        bounds = stack[-arg:]
+                        del stack[-arg:]
+                        try:
+                            bounds = [int(value) for value in bounds]
+                            if len(bounds) == 1:
+                                bounds.insert(0, 0)
+                            push(range(*bounds))
+                        except (ValueError, TypeError) as e:
+                            raise SyntaxError(f"Error in for loop: {e}")
+                    elif op == BUILD_LIST:
+                        items = stack[-arg:] if arg else []
+                        if arg:
+                            del stack[-arg:]
+                        push(items)
+                    elif op == LOAD_ITERABLE:
+                        slot, name = arg
+                        value = UNBOUND if slot is None else fast[slot]
+                        if value is UNBOUND:
+                            if name not in global_vars:
+                                raise NameError(f"Variable '{name}' not defined")
+                            value = global_vars[name]
+                        push(value)
+                    elif op == GET_ITER:
+                        try:
+                            stack[-1] = iter(stack[-1])
+                        except TypeError:
+                            raise SyntaxError(f"Error in for loop: '{type(stack[-1]).__name__}' object is not iterable")
+                    elif op == CALL_UNKNOWN:
+                        raise NameError(f"Function '{arg[0]}' not defined")
+                    elif op == REDUCE_RANGE:
+                        reduction, fallback = arg
+                        count = len(reduction.reads)
+                        values = stack[-count:] if count else []
+                        if count:
+                            del stack[-count:]
+                        results = reduction.run(interpreter, stack[-1], values)
+                        if results is None:
+                            pc = fallback
+                        else:
+                            stack[-1:] = results
+                    elif op == MAKE_LIST:
+                        items = stack[-arg:] if arg else []
+                        if arg:
+                            del stack[-arg:]
+                        push(PyvaList(items))
+                    elif op == SLICE:
+                        stop = pop()
+                        start = pop()
+                        stack[-1] = stack[-1][start:stop]
+                    elif op == STORE_SUBSCRIPT:
+                        value = pop()
+                        index = pop()
+                        target = pop()
+                        target[index] = value
+                    elif op == MAKE_MAP:
+                        result = PyvaMap()
+                        if arg:
+                            items = stack[-2 * arg:]
+                            del stack[-2 * arg:]
+                            for index in range(0, 2 * arg, 2):
+                                result[items[index]] = items[index + 1]
+                        push(result)
+                    else:
+                        raise RuntimeError(f"Unknown opcode {op}")
+            except Exception as e:
+                if isinstance(e, ExecutionAborted):
+                    raise
+                # Unwind to the innermost frame whose current statement
+                # reports errors, as nested Python calls would.
+                handler = code.handlers[pc - 1]
+                while handler is None and not tail:
+                    if not frames:
+                        raise
+                    code, fast, stack, pc, pending, tail = frames.pop()
+                    handler = code.handlers[pc - 1]
+                interpreter.report_error(e)
+                if handler is None:
+                    # The frame this one replaced would have reported the
+                    # error at its 'return f(...)' and returned None.
+                    if not frames:
+                        return None
+                    code, fast, stack, pc, pending, tail = frames.pop()
+                    stack.append(None)
+                else:
+                    resume, depth = handler
+                    del stack[depth:]
+                    pc = resume
+                instructions = code.instructions
+                consts = code.consts
+                names = code.names
+                push = stack.append
+                pop = stack.pop
+
+def run_compiled(interpreter, compiled):
+    """Execute the (codes, main_code) pair returned by compile_program"""
+    codes, main_code = compiled
+    return VirtualMachine(codes, interpreter).run(main_code)
+
+def run(interpreter, main_block):
+    """Compile the program loaded into an Interpreter and execute its main block on the VM"""
+    return run_compiled(interpreter, compile_program(interpreter.functions, main_block))
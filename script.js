@@ -10,20 +10,66 @@ editor.setOptions({
 document.getElementById("run-button").addEventListener("click", function () {
     var code = editor.getSession().getValue();
     var inputs = document.getElementById("inputs").value;
-    fetch("/execute", {
+    var output = document.getElementById("output");
+    output.innerText = "";
+    fetch("/execute/stream", {
         method: "POST",
         headers: {
             "Content-Type": "application/json",
         },
         body: JSON.stringify({ code: code, inputs: inputs }),
     })
-        .then((response) => response.json())
-        .then((data) => {
-            document.getElementById("output").innerText = data.output;
+        .then((response) => {
+            if (!response.ok) {
+                throw new Error("HTTP " + response.status);
+            }
+            // The server sends Server-Sent Events: "output" events carry
+            // chunks of program output, a final "done" event the status.
+            var reader = response.body.getReader();
+            var decoder = new TextDecoder();
+            var buffer = "";
+
+            function handleEvent(block) {
+                var event = "message";
+                var data = "";
+                block.split("\n").forEach((line) => {
+                    if (line.startsWith("event: ")) {
+                        event = line.slice(7);
+                    } else if (line.startsWith("data: ")) {
+                        data += line.slice(6);
+                    }
+                });
+                if (!data) {
+                    return;
+                }
+                var payload = JSON.parse(data);
+                if (event === "output") {
+                    output.appendChild(document.createTextNode(payload.text));
+                } else if (event === "done" && payload.output) {
+                    if (output.textContent && !output.textContent.endsWith("\n")) {
+                        output.appendChild(document.createTextNode("\n"));
+                    }
+                    output.appendChild(document.createTextNode(payload.output));
+                }
+            }
+
+            function read() {
+                return reader.read().then(({ done, value }) => {
+                    if (done) {
+                        return;
+                    }
+                    buffer += decoder.decode(value, { stream: true });
+                    var events = buffer.split("\n\n");
+                    buffer = events.pop();
+                    events.forEach(handleEvent);
+                    return read();
+                });
+            }
+
+            return read();
         })
         .catch((error) => {
             console.error("Error:", error);
-            document.getElementById("output").innerText =
-                "An error occurred while executing the code.";
+            output.innerText = "An error occurred while executing the code.";
         });
 });
@@ -0,0 +1,79 @@
+"""Step budget and deadline of runs on every engine"""
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_compiler
+import pyva_pool
+
+EMPTY_WHILE = 'main {\n    i = 0\n    while i < 3:\n    print("after")\n}\n'
+EMPTY_DO_WHILE = 'main {\n    do:\n    while 1 < 2:\n    print("after")\n}\n'
+COUNTING = 'main {\n    i = 0\n    while i < 100000:\n        i = i + 1\n    print(i)\n}\n'
+
+class EmptyLoopBudgetTest(unittest.TestCase):
+    def run_program(self, source, engine, **limits):
+        interpreter = pyva_compiler.Interpreter(stdout=io.StringIO(), optimize=False)
+        with self.assertRaises(pyva_compiler.BudgetExceeded) as raised:
+            interpreter.run(source, engine, **limits)
+        return raised.exception
+
+    def test_empty_loop_bodies_use_up_the_step_budget(self):
+        for source in (EMPTY_WHILE, EMPTY_DO_WHILE):
+            for engine in pyva_compiler.ENGINES:
+                with self.subTest(source=source, engine=engine):
+                    error = self.run_program(source, engine, max_steps=1000)
+                    self.assertEqual(error.kind, 'steps')
+                    self.assertEqual(error.steps, 1001)
+
+    def test_empty_loop_bodies_pass_the_deadline(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                error = self.run_program(EMPTY_WHILE, engine, max_steps=None, timeout=0.05)
+                self.assertEqual(error.kind, 'time')
+
+class BudgetResultTest(unittest.TestCase):
+    def test_step_budget_details(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = pyva_compiler.Interpreter(stdout=io.StringIO(), optimize=False)
+                with self.assertRaises(pyva_compiler.BudgetExceeded) as raised:
+                    interpreter.run(COUNTING, engine, max_steps=500)
+                details = raised.exception.as_dict()
+                self.assertEqual(set(details), {'kind', 'limit', 'steps', 'elapsed'})
+                self.assertEqual((details['kind'], details['limit']), ('steps', 500))
+                self.assertGreater(details['steps'], 500)
+                self.assertEqual(interpreter.stdout.getvalue(), '')
+
+    def test_time_budget_details(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = pyva_compiler.Interpreter(stdout=io.StringIO(), optimize=False)
+                with self.assertRaises(pyva_compiler.BudgetExceeded) as raised:
+                    interpreter.run(EMPTY_WHILE, engine, max_steps=None, timeout=0.05)
+                details = raised.exception.as_dict()
+                self.assertEqual((details['kind'], details['limit']), ('time', 0.05))
+                self.assertGreaterEqual(details['elapsed'], 0.05)
+
+    def test_batch_cases_report_their_budget(self):
+        interpreter = pyva_compiler.Interpreter(optimize=False)
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                results = interpreter.run_batch(COUNTING, ['', ''], engine, max_steps=500)
+                self.assertEqual([result['status'] for result in results], ['budget_exceeded'] * 2)
+                self.assertIn('Step budget of 500 exceeded', results[0]['error'])
+
+    def test_jobs_carry_the_budget_details(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                result = pyva_pool.run_job({'code': COUNTING, 'engine': engine, 'max_steps': 500})
+                self.assertEqual(result['status'], 'budget_exceeded')
+                self.assertEqual(result['budget']['kind'], 'steps')
+                self.assertTrue(result['output'].startswith('Error: Step budget of 500 exceeded'))
+                result = pyva_pool.run_job({'code': COUNTING, 'engine': engine})
+                self.assertEqual((result['status'], result['output']), ('ok', '100000'))
+                self.assertNotIn('budget', result)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,134 @@
+"""The in-memory program cache and .pyvac files"""
+import io
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_cache
+import pyva_compiler
+from pyva_cache import ProgramCache, cache_path, load_program_file
+
+def source(n):
+    return f'main {{\n    print({n})\n}}\n'
+
+def run(program, engine):
+    interpreter = pyva_compiler.Interpreter(stdout=io.StringIO())
+    interpreter.execute(program, engine)
+    return interpreter.stdout.getvalue()
+
+class ProgramCacheTest(unittest.TestCase):
+    def test_hits_misses_and_evictions(self):
+        cache = ProgramCache(max_entries=2)
+        first = cache.get(source(1))
+        self.assertIs(cache.get(source(1)), first)
+        cache.get(source(1), 'vm')
+        cache.get(source(2))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['hits'], stats['misses'], stats['evictions']), (2, 1, 3, 1))
+        self.assertGreater(stats['bytes'], 0)
+        # The least recently used entry went first.
+        self.assertIsNot(cache.get(source(1)), first)
+        self.assertEqual(cache.stats()['evictions'], 2)
+
+    def test_byte_limit(self):
+        size = pyva_cache.deep_sizeof(ProgramCache().get(source(1)))
+        cache = ProgramCache(max_bytes=size * 2 + size // 2)
+        for n in range(4):
+            cache.get(source(n))
+        stats = cache.stats()
+        self.assertEqual((stats['entries'], stats['evictions']), (2, 2))
+        self.assertLessEqual(stats['bytes'], cache.max_bytes)
+
+    def test_syntax_errors_are_not_cached(self):
+        cache = ProgramCache()
+        for _ in range(2):
+            with self.assertRaises(SyntaxError):
+                cache.get('main {\n    print(\n}\n')
+        self.assertEqual(cache.stats()['entries'], 0)
+        self.assertEqual(cache.stats()['misses'], 2)
+
+    def test_cached_programs_run_on_every_engine(self):
+        cache = ProgramCache()
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(cache.get(source(7), engine), engine), '7\n')
+
+class PyvacTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.filename = os.path.join(self.directory, 'prog.pyva')
+        self.write(source(1))
+
+    def write(self, text):
+        with open(self.filename, 'w') as file:
+            file.write(text)
+
+    def load(self, engine='tree', optimize=True):
+        """The loaded program, and whether its .pyvac file was written anew"""
+        with open(self.filename) as file:
+            text = file.read()
+        path = cache_path(self.filename)
+        before = os.stat(path).st_ino if os.path.exists(path) else None
+        program = load_program_file(self.filename, text, engine, optimize)
+        # The file is replaced, never rewritten in place.
+        return program, os.stat(path).st_ino != before
+
+    def test_cache_path(self):
+        self.assertEqual(cache_path(self.filename), os.path.join(self.directory, '__pycache__', 'prog.pyvac'))
+
+    def test_reused_until_the_source_changes(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                self.write(source(1))
+                program, rebuilt = self.load(engine)
+                self.assertTrue(rebuilt)
+                self.assertTrue(os.path.exists(cache_path(self.filename)))
+                program, rebuilt = self.load(engine)
+                self.assertFalse(rebuilt)
+                self.assertEqual(run(program, engine), '1\n')
+                # Same size; the content hash catches it even at the same mtime.
+                stat_before = os.stat(self.filename)
+                self.write(source(2))
+                os.utime(self.filename, ns=(stat_before.st_atime_ns, stat_before.st_mtime_ns))
+                program, rebuilt = self.load(engine)
+                self.assertTrue(rebuilt)
+                self.assertEqual(run(program, engine), '2\n')
+
+    def test_engines_share_one_file(self):
+        self.load('tree')
+        # Adding the VM's compiled form writes the file once more.
+        self.assertTrue(self.load('vm')[1])
+        for engine in ('tree', 'vm'):
+            program, rebuilt = self.load(engine)
+            self.assertFalse(rebuilt)
+            self.assertEqual(set(program.compiled), {'tree', 'vm'})
+            self.assertEqual(run(program, engine), '1\n')
+
+    def test_optimize_flag_is_part_of_the_key(self):
+        self.load(optimize=True)
+        self.assertTrue(self.load(optimize=False)[1])
+        self.assertFalse(self.load(optimize=False)[1])
+
+    def test_corrupt_files_are_rebuilt(self):
+        self.load()
+        with open(cache_path(self.filename), 'r+b') as file:
+            file.truncate(20)
+        program, rebuilt = self.load()
+        self.assertTrue(rebuilt)
+        self.assertEqual(run(program, 'tree'), '1\n')
+        self.assertFalse(self.load()[1])
+
+    @unittest.skipIf(os.name != 'posix', "POSIX permissions")
+    def test_file_takes_the_source_permissions(self):
+        os.chmod(self.filename, 0o640)
+        self.load()
+        self.assertEqual(stat.S_IMODE(os.stat(cache_path(self.filename)).st_mode), 0o640)
+        self.assertEqual([name for name in os.listdir(os.path.dirname(cache_path(self.filename)))], ['prog.pyvac'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+"""Lists and maps behave the same on every engine"""
+import io
+import os
+import sys
+import unittest
+from array import array
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_compiler
+from pyva_list import PyvaList
+from pyva_map import PyvaMap
+
+LISTS = '''main {
+    xs = [1, 2, 3]
+    append(xs, 4)
+    xs[0] = 10
+    print(xs)
+    print(xs[1:3])
+    print(xs + [5])
+    append(xs, 2.5)
+    print(xs)
+    print(len(xs))
+    print(contains(xs, 4))
+    print([1, 2] == [1, 2])
+    ys = []
+    for i in range(4):
+        append(ys, i * i)
+    print(ys)
+}
+'''
+
+MAPS = '''main {
+    ages = {"ann": 31, "bob": 27}
+    set(ages, "cid", 40)
+    print(ages["bob"])
+    print(get(ages, "dan", 0))
+    print(contains(ages, "cid"))
+    print(keys(ages))
+    print(values(ages))
+    for name in ages:
+        set(ages, name + "!", 1)
+    print(len(ages))
+    print(ages["dan"])
+}
+'''
+
+def run(source, engine, optimize=True):
+    interpreter = pyva_compiler.Interpreter(stdout=io.StringIO(), optimize=optimize)
+    try:
+        interpreter.run(source, engine)
+    except Exception as e:
+        interpreter.stdout.write(f"{type(e).__name__}: {e}\n")
+    return interpreter.stdout.getvalue()
+
+class PyvaListTest(unittest.TestCase):
+    def test_storage_is_typed_until_widened(self):
+        ints = PyvaList([1, 2, 3])
+        self.assertEqual(ints.items.typecode, 'q')
+        self.assertEqual(PyvaList([1.5]).items.typecode, 'd')
+        self.assertIs(PyvaList([True]).items.__class__, list)
+        self.assertIs(PyvaList([2 ** 70]).items.__class__, list)
+        ints.append(4)
+        self.assertEqual(ints.items, array('q', [1, 2, 3, 4]))
+        ints.append('x')
+        self.assertEqual(ints.items, [1, 2, 3, 4, 'x'])
+        ints = PyvaList([1])
+        ints[0] = 2 ** 70
+        self.assertEqual(ints.items, [2 ** 70])
+
+    def test_empty_list_takes_the_type_of_its_first_item(self):
+        xs = PyvaList()
+        xs.append(1.5)
+        self.assertEqual(xs.items.typecode, 'd')
+
+    def test_slices_and_sums_are_lists(self):
+        xs = PyvaList([1, 2, 3])
+        self.assertEqual(xs[1:], PyvaList([2, 3]))
+        self.assertEqual((xs + PyvaList([4])).items.typecode, 'q')
+        self.assertEqual(xs + PyvaList(['a']), PyvaList([1, 2, 3, 'a']))
+        self.assertNotEqual(xs, PyvaList([1, 2]))
+        self.assertEqual(PyvaList([1]), PyvaList([1.0]))
+        self.assertEqual(repr(PyvaList([1, 'a'])), "[1, 'a']")
+        with self.assertRaises(TypeError):
+            hash(xs)
+
+class PyvaMapTest(unittest.TestCase):
+    def test_missing_key(self):
+        with self.assertRaisesRegex(LookupError, "Key 'a' not found"):
+            PyvaMap()['a']
+
+    def test_iteration_is_over_a_snapshot(self):
+        counts = PyvaMap(a=1, b=2)
+        for key in counts:
+            counts[key + key] = 0
+        self.assertEqual(list(counts), ['a', 'b', 'aa', 'bb'])
+
+class ProgramTest(unittest.TestCase):
+    def test_lists(self):
+        expected = ("[10, 2, 3, 4]\n[2, 3]\n[10, 2, 3, 4, 5]\n[10, 2, 3, 4, 2.5]\n"
+                    "5\nTrue\nTrue\n[0, 1, 4, 9]\n")
+        for engine in pyva_compiler.ENGINES:
+            for optimize in (False, True):
+                with self.subTest(engine=engine, optimize=optimize):
+                    self.assertEqual(run(LISTS, engine, optimize), expected)
+
+    def test_maps(self):
+        expected = "27\n0\nTrue\n['ann', 'bob', 'cid']\n[31, 27, 40]\n6\nError: Key 'dan' not found\n"
+        for engine in pyva_compiler.ENGINES:
+            for optimize in (False, True):
+                with self.subTest(engine=engine, optimize=optimize):
+                    self.assertEqual(run(MAPS, engine, optimize), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,56 @@
+"""Every engine prints the same as the tree walker on the sample programs"""
+import io
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import pyva_compiler
+
+# (program in the repository root, scripted input)
+SAMPLES = [
+    ('hello.pyva', '3\n4\n'),
+    ('inheritance.pyva', ''),
+    ('whileloop.pyva', ''),
+    ('dowhileloop.pyva', ''),
+    ('forloop.pyva', ''),
+    ('elif.pyva', '15\n'),
+    ('operations.pyva', '3\n4\nab\ncd\n'),
+    ('calculate.pyva', ''),
+    ('Hello1.pyva', ''),
+    ('equal.pyva', 'a\na\n'),
+    ('ifelse.pyva', '20\n'),
+    ('strings.pyva', 'x\ny\n'),
+]
+
+def run(source, engine, inputs='', optimize=True):
+    """A program's output, ending with the error that stopped it as interpret_file prints it"""
+    interpreter = pyva_compiler.Interpreter(stdin=io.StringIO(inputs), stdout=io.StringIO(), optimize=optimize)
+    try:
+        interpreter.run(source, engine)
+    except Exception as e:
+        interpreter.stdout.write(f"Error: {e}\n")
+    return interpreter.stdout.getvalue()
+
+class SampleParityTest(unittest.TestCase):
+    def test_engines_agree_on_the_samples(self):
+        for name, inputs in SAMPLES:
+            with open(os.path.join(ROOT, name)) as file:
+                source = file.read()
+            expected = run(source, 'tree', inputs, optimize=False)
+            for engine in pyva_compiler.ENGINES:
+                for optimize in (True, False):
+                    with self.subTest(program=name, engine=engine, optimize=optimize):
+                        self.assertEqual(run(source, engine, inputs, optimize), expected)
+
+    def test_while_loop_sample_output(self):
+        with open(os.path.join(ROOT, 'whileloop.pyva')) as file:
+            source = file.read()
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(source, engine),
+                                 "Executing While Loop:\n0\n1\n2\n3\n4\nWhile loop completed\n")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+"""Memoized calls of pure functions"""
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_compiler
+
+EQUAL_ARGUMENTS = '''@memo
+def f(x: float) -> str:
+    return "v" + str(x)
+
+@memo
+def g(x) -> str:
+    return "g" + str(x)
+
+main {
+    print(f(0.0))
+    print(f(-0.0))
+    print(g(1))
+    print(g(1.0))
+    print(g(True))
+}
+'''
+
+FIB = '''def fib(n: int) -> int:
+    if n < 2:
+        return n
+    return fib(n - 1) + fib(n - 2)
+
+main {
+    print(fib(18))
+    print(fib(18))
+}
+'''
+
+PURITY = '''def noisy(n: int) -> int:
+    print(n)
+    return n
+
+def reads_global(n: int) -> int:
+    return n + limit
+
+def calls_noisy(n: int) -> int:
+    return noisy(n) + 1
+
+def leaf(n: int) -> int:
+    return n * 2
+
+def loops(n: int) -> int:
+    total = 0
+    for i in range(n):
+        total = total + leaf(i)
+    return total
+
+@memo
+def forced(n: int) -> int:
+    return n + 1
+
+main {
+    limit = 3
+    print(loops(4))
+}
+'''
+
+def run(source, engine, memo_size=pyva_compiler.DEFAULT_MEMO_SIZE):
+    interpreter = pyva_compiler.Interpreter(stdout=io.StringIO(), memo_size=memo_size)
+    interpreter.run(source, engine)
+    return interpreter
+
+class MemoKeyTest(unittest.TestCase):
+    def test_equal_arguments_of_other_types_or_signs_are_cached_apart(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                output = run(EQUAL_ARGUMENTS, engine).stdout.getvalue()
+                self.assertEqual(output, run(EQUAL_ARGUMENTS, engine, 0).stdout.getvalue())
+                self.assertEqual(output, 'v0.0\nv-0.0\ng1\ng1.0\ngTrue\n')
+
+class MemoCacheTest(unittest.TestCase):
+    def test_repeated_calls_hit_the_cache(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = run(FIB, engine)
+                self.assertEqual(interpreter.stdout.getvalue(), '2584\n2584\n')
+                stats = interpreter.memo.stats()
+                # One miss per distinct argument; every other call hits.
+                self.assertEqual(stats['misses'], 19)
+                self.assertEqual(stats['entries'], 19)
+                self.assertGreater(stats['hits'], 0)
+                self.assertEqual(stats['evictions'], 0)
+
+    def test_memo_size_zero_turns_memoization_off(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = run(FIB, engine, 0)
+                self.assertEqual(interpreter.stdout.getvalue(), '2584\n2584\n')
+                self.assertEqual(interpreter.memo.stats()['entries'], 0)
+
+    def test_small_caches_evict(self):
+        interpreter = run(FIB, 'tree', 4)
+        self.assertEqual(interpreter.stdout.getvalue(), '2584\n2584\n')
+        stats = interpreter.memo.stats()
+        self.assertEqual(stats['entries'], 4)
+        self.assertGreater(stats['evictions'], 0)
+
+class PurityTest(unittest.TestCase):
+    def test_impure_functions_are_not_memoized(self):
+        program = pyva_compiler.Program(PURITY)
+        # print, a global read and a call of an impure function each
+        # disqualify; a loop-free leaf is pure but not worth caching.
+        self.assertEqual(program.memoized, frozenset({'loops', 'forced'}))
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(PURITY, engine).stdout.getvalue(), '12\n')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+"""Optimized programs behave like the unoptimized ones"""
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_compiler
+from pyva_compiler import Assign, Call, walk_statements
+
+FAILING_CONSTANT = '''def never() -> bool:
+    return 1 < "1.2.3"
+
+main {
+    print("start")
+    x = 1 < "1.2.3"
+    print("end")
+}
+'''
+
+NEVER_RUN_COMPARISONS = '''def f(s: str, n: int) -> int:
+    i = 0
+    while i < 3:
+        if n > 5:
+            print(s < 2)
+        i = i + 1
+    return i
+
+main {
+    s = "1.2.3"
+    for i in range(0, 0):
+        print(s < 2)
+    print(f(s, 1))
+    k = 7
+    t = 0
+    for i in range(4):
+        t = t + k * 3 + i
+    print(t)
+}
+'''
+
+CONCATENATION = '''def spaced(n: int) -> str:
+    s = ""
+    i = 0
+    while i < n:
+        s = s + str(i) + " "
+        i = i + 1
+    return s
+
+main {
+    line = ""
+    for i in range(6):
+        if i % 2 == 0:
+            line = line + "even" + i
+        else:
+            line = line + "-"
+    print(line)
+    print(spaced(4))
+    count = 0
+    for i in range(3):
+        count = count + i + "!"
+    print(count)
+    seen = ""
+    for i in range(3):
+        seen = seen + i
+        print(len(seen))
+}
+'''
+
+def builders(block):
+    return sorted(stmt.name for stmt in walk_statements(block)
+                  if stmt.__class__ is Assign and stmt.value.__class__ is Call
+                  and stmt.value.fname == '__concat_end')
+
+def run(source, engine, optimize):
+    interpreter = pyva_compiler.Interpreter(stdout=io.StringIO(), optimize=optimize)
+    interpreter.run(source, engine)
+    return interpreter.stdout.getvalue()
+
+class ConstantFoldingTest(unittest.TestCase):
+    def test_failing_constant_expressions_are_left_for_runtime(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                output = run(FAILING_CONSTANT, engine, True)
+                self.assertEqual(output, run(FAILING_CONSTANT, engine, False))
+                self.assertEqual(output.splitlines()[0], 'start')
+                self.assertEqual(output.splitlines()[-1], 'end')
+
+class HoistingTest(unittest.TestCase):
+    def test_invariants_that_may_raise_stay_in_the_loop(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                output = run(NEVER_RUN_COMPARISONS, engine, True)
+                self.assertEqual(output, run(NEVER_RUN_COMPARISONS, engine, False))
+                self.assertEqual(output, '3\n90\n')
+
+class StringBuilderTest(unittest.TestCase):
+    def test_append_only_loops_use_builders(self):
+        program = pyva_compiler.Program(CONCATENATION)
+        # seen is read inside its loop, so it keeps its '+'.
+        self.assertEqual(builders(program.main_block), ['count', 'line'])
+        self.assertEqual(builders(program.functions['spaced'][1]), ['s'])
+        self.assertEqual(builders(pyva_compiler.Program(CONCATENATION, optimize=False).main_block), [])
+
+    def test_builders_give_the_same_strings(self):
+        expected = "even0-even2-even4-\n0 1 2 3 \n0!1!2!\n1\n2\n3\n"
+        for engine in pyva_compiler.ENGINES:
+            for optimize in (False, True):
+                with self.subTest(engine=engine, optimize=optimize):
+                    self.assertEqual(run(CONCATENATION, engine, optimize), expected)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Range loops run in closed form or vectorized give the results of running them"""
+import io
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_compiler
+import pyva_reduce
+from pyva_compiler import For, walk_statements
+
+POLYNOMIAL = '''def sums(n: int, k: int) -> int:
+    total = 0
+    squares = 0
+    for i in range(3, n, 2):
+        total = total + i * k - 1
+        squares = squares - i * i
+    return total + squares
+
+main {
+    print(sums(1000, 7))
+    print(sums(0, 7))
+    acc = 5
+    for j in range(-40, 40):
+        acc = acc + j * j * j
+    print(acc)
+}
+'''
+
+# i % 7 is no polynomial, so long loops go to NumPy when it is installed.
+MODULO = '''main {
+    total = 0
+    for i in range(50000):
+        total = total + i % 7 + i * 3
+    print(total)
+}
+'''
+
+def run(source, engine, optimize=True):
+    interpreter = pyva_compiler.Interpreter(stdout=io.StringIO(), optimize=optimize)
+    interpreter.run(source, engine)
+    return interpreter.stdout.getvalue()
+
+def reductions(source):
+    program = pyva_compiler.Program(source)
+    blocks = [program.main_block] + [body for _, body, _ in program.functions.values()]
+    return [stmt.reduction for block in blocks for stmt in walk_statements(block)
+            if stmt.__class__ is For and stmt.reduction is not None]
+
+class ReductionTest(unittest.TestCase):
+    def test_summing_loops_are_reduced(self):
+        self.assertEqual(len(reductions(POLYNOMIAL)), 2)
+        self.assertEqual(len(reductions(MODULO)), 1)
+
+    def test_closed_form_matches_the_loop(self):
+        expected = run(POLYNOMIAL, 'tree', optimize=False)
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(POLYNOMIAL, engine), expected)
+
+    def test_python_sum_matches_the_loop(self):
+        expected = run(MODULO, 'tree', optimize=False)
+        with mock.patch.object(pyva_reduce, 'numpy', None):
+            for engine in pyva_compiler.ENGINES:
+                with self.subTest(engine=engine):
+                    self.assertEqual(run(MODULO, engine), expected)
+
+    @unittest.skipIf(pyva_reduce.numpy is None, "NumPy is not installed")
+    def test_numpy_sum_matches_the_loop(self):
+        expected = run(MODULO, 'tree', optimize=False)
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                self.assertEqual(run(MODULO, engine), expected)
+
+    def test_reduced_loops_still_pay_for_their_steps(self):
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = pyva_compiler.Interpreter(stdout=io.StringIO())
+                with self.assertRaises(pyva_compiler.BudgetExceeded):
+                    interpreter.run(MODULO, engine, max_steps=1000)
+
+if __name__ == '__main__':
+    unittest.main()
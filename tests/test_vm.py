@@ -0,0 +1,34 @@
+"""VM compilation details that must not change what programs print"""
+import io
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import pyva_compiler
+
+def run(source, engine):
+    interpreter = pyva_compiler.Interpreter(stdout=io.StringIO())
+    interpreter.run(source, engine)
+    return interpreter.stdout.getvalue()
+
+class ConstantPoolTest(unittest.TestCase):
+    def test_signed_zeros_stay_apart(self):
+        source = 'main {\n    x = -0.0\n    print(x)\n    print(0.0)\n}\n'
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                interpreter = pyva_compiler.Interpreter(stdout=io.StringIO())
+                interpreter.run(source, engine)
+                self.assertEqual(interpreter.stdout.getvalue(), '-0.0\n0.0\n')
+
+class RangeErrorTest(unittest.TestCase):
+    def test_range_errors_are_reported_like_the_tree_walker(self):
+        source = 'main {\n    for i in range(0, 5, 0):\n        print(i)\n}\n'
+        for engine in pyva_compiler.ENGINES:
+            with self.subTest(engine=engine):
+                with self.assertRaises(SyntaxError) as raised:
+                    run(source, engine)
+                self.assertEqual(str(raised.exception), "Error in for loop: range() arg 3 must not be zero")
+
+if __name__ == '__main__':
+    unittest.main()